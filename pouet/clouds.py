@@ -3,7 +3,6 @@ import scipy.ndimage
 from scipy.optimize import least_squares
 import scipy.ndimage.filters as filters
 import scipy.ndimage as ndimage
-from scipy.spatial import cKDTree
 import copy
 import imageio
 #todo: there seem to be a problem with urllib.request which does not exists anymore...?
@@ -12,6 +11,7 @@ import requests
 import astropy.time
 from astropy import units as u
 import sys, os, inspect
+import hashlib, json, io
 
 import util
 
@@ -22,12 +22,19 @@ global SETTINGS
 herepath = os.path.dirname(os.path.abspath(inspect.stack()[0][1]))
 SETTINGS = util.readconfig(os.path.join(herepath, "config/settings.cfg"))
 
+# quality flags of the star measurements, see measure_stars
+STAR_OK = 0
+STAR_EDGE = 1
+STAR_NAN = 2
+STAR_UNPHYSICAL = 3
+STAR_NOTCONVERGED = 4
+
 class Clouds():
     """
     This class loads and analyses an all sky image of the Sky and returns an observability map that
     can be used by another method to advise the observer on the sky quality.
     
-    :note: This module can also be used to explore older images, see the example code in `__main__()`.
+    :note: This module can also be used to explore older images, see the example code in `__main__()`. To reanalyse a large number of archived images, see :mod:`reprocess`.
     """
     
     def __init__(self, name, fimage=None, debugmode=False):
@@ -41,37 +48,119 @@ class Clouds():
         """
         self.location = name
         self.station = (util.load_station(name)).AllSky()
+        self.geometry = StationGeometry(self.station, name)
         self.last_im_refresh = None
         self.debugmode = debugmode
         self.failed_connection = False
 
-        if fimage is None:
-            fimage = "current.jpg"
-            if debugmode:
-                fimage = os.path.join(os.path.dirname(os.path.abspath(inspect.stack()[0][1])) , "config", "AllSkyDebugMode.jpg")
-                logger.warning("Cloud analysis is working in debug mode (not using the real current image)")
-            self.fimage = fimage
+        # the downloads share a pooled session, and are conditional on the last frame
+        self.session = requests.Session()
+        self.etag = None
+        self.last_modified = None
+        self.frame_hash = None
+        self.new_frame = False
+
+        if fimage is None and debugmode:
+            fimage = os.path.join(os.path.dirname(os.path.abspath(inspect.stack()[0][1])) , "config", "AllSkyDebugMode.jpg")
+            logger.warning("Cloud analysis is working in debug mode (not using the real current image)")
+        self.fimage = fimage
 
+        self.im_masked = None
+        self.im_original = None
         self.observability_map = None
+        self.nstars = None
 
-    def retrieve_image(self):
+    def retrieve_image(self, timeout=None):
         """
-        Downloads the current all sky from the server and saves it to disk.
+        Downloads the current all sky from the server and decodes it in memory, or reads the image file if one was given (i.e. in debug mode).
         The url of the image is retrived from the corresponding configuration file.
+        
+        The download is conditional (`If-None-Match`/`If-Modified-Since`) on the last frame, and the image is only decoded if its content changed. `new_frame` tells whether there is a new image to analyse.
+        
+        :param timeout: timeout of the download in seconds. If None, use the `downloadtimeout` of the settings.
         """
-        if not self.debugmode:
+        self.new_frame = False
+
+        if self.fimage is None:
             try:
-                logger.info("Loading all sky from {}...".format(self.station.params['url']))
-                #urllib.request.urlretrieve(self.params['url'], "current.JPG")
-                open("current.jpg", 'wb').write(requests.get(self.station.params['url']).content)
+                response = self.download_image(timeout=timeout)
                 self.failed_connection = False
-            except :
+            except requests.RequestException:
                 self.failed_connection = True
                 logger.warning("Cannot download All Sky image. Either you or the server is offline!")
                 return 1
+            self.read_response(response.status_code, response.headers, response.content)
+        else:
+            with open(self.fimage, 'rb') as f:
+                self.read_frame(f.read())
+
+    def download_image(self, timeout=None):
+        """
+        Downloads the current all sky from the server, conditionally on the last frame. Nothing is changed, see :meth:`read_response`.
+
+        :param timeout: timeout of the download in seconds. If None, use the `downloadtimeout` of the settings.
+        :return: the `requests` response
+        :raise requests.RequestException: if the download fails
+        """
+        if timeout is None:
+            timeout = float(SETTINGS['validity']['downloadtimeout'])
+        logger.info("Loading all sky from {}...".format(self.station.params['url']))
+        response = self.session.get(self.station.params['url'], headers=self.get_request_headers(), timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    def get_request_headers(self):
+        """
+        :return: the headers of a download conditional on the last frame
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def read_response(self, status, headers, content):
+        """
+        Reads the answer of the server to a download, done by :meth:`retrieve_image` or by :meth:`~meteo.Meteo.fetch_allsky`.
+
+        :param status: HTTP status of the response
+        :param headers: headers of the response (case-insensitive mapping)
+        :param content: the image file, as bytes
+        """
+        self.new_frame = False
+        if status == 304:
+            logger.info("All sky image not modified since the last download")
+            self.last_im_refresh = astropy.time.Time.now()
+            return
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.read_frame(content)
+
+    def read_frame(self, content):
+        """
+        Decodes the image, if it is not the same as the last one.
 
-        self.im_masked, self.im_original = loadallsky(self.fimage, station=self.station, return_complete=True)
+        :param content: the image file, as bytes
+        """
+        frame_hash = hashlib.sha1(content).hexdigest()
+        if frame_hash == self.frame_hash and self.im_original is not None:
+            logger.info("All sky image unchanged, no need to analyse it again")
+            self.last_im_refresh = astropy.time.Time.now()
+            return
+
+        self.im_masked, self.im_original = loadallsky(content, station=self.station, return_complete=True, geometry=self.geometry)
+        if self.im_original is not None:
+            self.frame_hash = frame_hash
+            self.new_frame = True
         self.last_im_refresh = astropy.time.Time.now()
+
+    def is_recent(self, donotdownloadtime):
+        """
+        :param donotdownloadtime: validity of an image, in min
+        :return: True if the last image was downloaded less than donotdownloadtime ago
+        """
+        return self.last_im_refresh is not None and (astropy.time.Time.now() - self.last_im_refresh).to(u.s).value / 60. < donotdownloadtime
         
     def update(self, donotdownloadtime=1.5):
         """
@@ -82,18 +171,29 @@ class Clouds():
         :return: an observability map with the same dimension as the input image. Then, use all sky get image coordinate method to retrieve observability for a given target.
         """
         logger.debug("Updating the all-sky image")
-        if not self.last_im_refresh is None and (astropy.time.Time.now() - self.last_im_refresh).to(u.s).value / 60. < donotdownloadtime:
+        if self.is_recent(donotdownloadtime):
             logger.info("Last image was downloaded more recently than {} minutes ago, I don't download it again".format(donotdownloadtime))
             #Seems to be okay#logger.critical("TODO: make sure that this map is correct and there's no .T missing (see get_observability_map)")
             return self.observability_map
         
         self.retrieve_image()
+        return self.analyse()
+
+    def analyse(self):
+        """
+        Detects the stars in the last image retrieved and computes its observability map, see :meth:`update`
+        
+        :return: the observability map, None if the image could not be retrieved
+        """
         if self.failed_connection:
             logger.warning("Connection down and not running in debugmode so cannot analyse All Sky")
             return None
+        if not self.new_frame and self.observability_map is not None:
+            return self.observability_map
         x, y = self.detect_stars()
         if x is None or y is None:
             return None
+        self.nstars = len(x)
         
         return self.get_observability_map(x, y)
         
@@ -148,14 +248,11 @@ class Clouds():
         
         if not meas_star: 
             return x, y
-        resx = []
-        resy = []
-        for xx, yy in zip(x, y):
-            f = fwhm(original, xx, yy, 18)
-            if f < fwhm_threshold:
-                resx.append(xx)
-                resy.append(yy)
-                #resfwhm.append(f)
+        # all the objects are measured at once, the quality flags are kept for inspection
+        self.fwhms, self.fwhm_flags = measure_stars(original, x, y, 18)
+        stars = self.fwhms < fwhm_threshold
+        resx = list(np.asarray(x)[stars])
+        resy = list(np.asarray(y)[stars])
         logger.info("Done. {} stars found".format(len(resx)))
         
         if return_all:
@@ -179,14 +276,11 @@ class Clouds():
         observability = copy.copy(self.im_masked) * 0.
         
         if len(x) > 0:
-            notnans = np.where(np.isnan(self.im_masked) == False)
-            notnans = list(zip(notnans[0], notnans[1]))
-            pts = np.array([x,y]).T
-            tree = cKDTree(pts)    
-            for nx, ny in notnans:
-                obs = len(tree.query_ball_point((ny,nx), threshold))
-                if obs > 2 : observability[nx,ny] = 1. 
-                elif obs >= 1 : observability[nx,ny] = 0.5
+            notnans = np.isnan(self.im_masked) == False
+            # number of stars closer than threshold to each pixel, the image rows being y and the columns x
+            obs = star_density(x, y, np.shape(self.im_masked), threshold)
+            observability[notnans & (obs >= 1)] = 0.5
+            observability[notnans & (obs > 2)] = 1.
             observability[filters.gaussian_filter(np.nan_to_num(self.im_masked), 10) > max_pxval] = 0
             observability = filters.gaussian_filter(observability, filter_sigma)
         
@@ -194,6 +288,158 @@ class Clouds():
         return observability
 
 
+def star_density(x, y, shape, radius):
+    """
+    Counts, for every pixel of an image, the number of stars within a given distance (edges included).
+
+    Each star covers, row by row, a segment of pixels. The segments of all the stars are accumulated at once as +1/-1 steps in a difference image, which is then integrated along the rows, so the cost scales with the number of stars times the diameter, not with the number of pixels.
+
+    :param x: x coordinates (columns) of the stars
+    :param y: y coordinates (rows) of the stars
+    :param shape: shape of the image, (rows, columns)
+    :param radius: distance in px
+
+    :return: integer array with the given shape
+    """
+    nrows, ncols = shape
+    x = np.asarray(x, dtype=float)[:, np.newaxis]
+    y = np.asarray(y, dtype=float)[:, np.newaxis]
+    r = int(np.ceil(radius))
+
+    # rows spanned by each star, and the half-width of the disk on each of them
+    rows = np.floor(y).astype(int) + np.arange(-r - 1, r + 2)
+    halfwidth2 = radius ** 2 - (rows - y) ** 2
+    halfwidth = np.sqrt(np.clip(halfwidth2, 0., None))
+    start = np.maximum(np.ceil(x - halfwidth).astype(int), 0)
+    stop = np.minimum(np.floor(x + halfwidth).astype(int), ncols - 1) + 1
+
+    valid = (halfwidth2 >= 0) & (rows >= 0) & (rows < nrows) & (start < stop)
+    rows, start, stop = rows[valid], start[valid], stop[valid]
+
+    steps = np.bincount(rows * (ncols + 1) + start, minlength=nrows * (ncols + 1))
+    steps -= np.bincount(rows * (ncols + 1) + stop, minlength=nrows * (ncols + 1))
+
+    return np.cumsum(steps.reshape(nrows, ncols + 1), axis=1)[:, :ncols]
+
+
+class StationGeometry():
+    """
+    Precomputed geometry of the all-sky camera of a station: the static mask of the image, the azimuth and elevation of every pixel and an array version of the az/alt to pixel mapping.
+    
+    The mask and the az/alt grids are computed once per station and saved on disk (in the `cachedir` of the settings), they are recomputed if the station parameters change.
+    """
+    
+    # to be incremented if the content of the cache changes
+    version = 1
+    
+    def __init__(self, station, name, cachedir=None):
+        """
+        :param station: the AllSky object of the station, see :meth:`util.load_station`
+        :param name: name of the station, used to name the cache file
+        :param cachedir: directory where to save the cache. If None, use the `cachedir` of the settings.
+        """
+        self.station = station
+        self.name = name
+        self.shape = (station.params['image_y_size'], station.params['image_x_size'])
+        self.key = hashlib.sha1(json.dumps([self.version, self.shape, station.params], sort_keys=True, default=str).encode()).hexdigest()
+        
+        if cachedir is None:
+            cachedir = os.path.expanduser(SETTINGS['misc']['cachedir'])
+        self.fcache = os.path.join(cachedir, "{}_allsky_geometry.npz".format(name))
+        
+        if not self.load():
+            self.build()
+            self.save()
+    
+    def load(self):
+        """
+        Loads the geometry from the cache file, if it exists and corresponds to the current station parameters
+        
+        :return: True if the geometry was loaded
+        """
+        try:
+            with np.load(self.fcache) as cache:
+                if str(cache['key']) != self.key:
+                    logger.info("Station parameters of {} changed, recomputing the all-sky geometry".format(self.name))
+                    return False
+                self.mask, self.azimuth, self.elevation = cache['mask'], cache['azimuth'], cache['elevation']
+        except (IOError, KeyError, ValueError):
+            return False
+        
+        logger.debug("All-sky geometry of {} loaded from {}".format(self.name, self.fcache))
+        return True
+    
+    def build(self):
+        """
+        Computes the mask and the azimuth and elevation of every pixel
+        """
+        logger.debug("Computing the all-sky geometry of {}...".format(self.name))
+        self.mask = self.station.get_mask(np.zeros(self.shape))
+        
+        y, x = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        if hasattr(self.station, "get_sky_coordinates"):
+            self.azimuth, self.elevation = self.station.get_sky_coordinates(x.astype(float), y.astype(float))
+        else:
+            self.azimuth, self.elevation = np.ones(self.shape) * np.nan, np.ones(self.shape) * np.nan
+    
+    def save(self):
+        """
+        Saves the geometry in the cache file. Failing to do so is not critical.
+        """
+        try:
+            if not os.path.isdir(os.path.dirname(self.fcache)):
+                os.makedirs(os.path.dirname(self.fcache))
+            with open(self.fcache, 'wb') as f:
+                np.savez_compressed(f, key=self.key, mask=self.mask, azimuth=self.azimuth, elevation=self.elevation)
+        except (IOError, OSError):
+            logger.warning("Could not save the all-sky geometry in {}".format(self.fcache))
+    
+    def get_mask(self, ar):
+        """
+        Same as the station get_mask, using the precomputed mask if the image has the expected size
+        
+        :param ar: original image (or at least an array with the same size). Used to get the image size.
+        """
+        if np.shape(ar)[:2] == self.shape:
+            return self.mask
+        return self.station.get_mask(ar)
+    
+    def get_pixels(self, az, elev):
+        """
+        Converts azimuths and elevations into integer pixel coordinates, to be used as indices of a cloud map (which is indexed [x, y])
+        
+        :param az: azimuth (in rad), float or numpy array
+        :param elev: elevation (in rad), float or numpy array
+        
+        :return: x and y integer arrays (0 where invalid), and a boolean array, True where the position is within the image
+        """
+        x, y = self.station.get_image_coordinates(np.asarray(az, dtype=float), np.asarray(elev, dtype=float))
+        x, y = np.round(np.atleast_1d(x)), np.round(np.atleast_1d(y))
+        
+        inside = np.isfinite(x) & np.isfinite(y)
+        inside[inside] = (x[inside] < self.shape[1]) & (y[inside] < self.shape[0])
+        
+        x = np.where(inside, x, 0).astype(int)
+        y = np.where(inside, y, 0).astype(int)
+        return x, y, inside
+    
+    def lookup(self, cloudmap, az, elev, fill=np.nan):
+        """
+        Values of a cloud map at given azimuths and elevations, in a single fancy-indexing
+        
+        :param cloudmap: the cloud map, indexed [x, y], see :meth:`~clouds.Clouds.get_observability_map`
+        :param az: azimuth (in rad), float or numpy array
+        :param elev: elevation (in rad), float or numpy array
+        :param fill: value for the positions outside of the map
+        
+        :return: numpy array with the shape of az and elev
+        """
+        x, y, inside = self.get_pixels(az, elev)
+        inside &= (x < np.shape(cloudmap)[0]) & (y < np.shape(cloudmap)[1])
+        values = np.where(inside, cloudmap[np.where(inside, x, 0), np.where(inside, y, 0)], fill)
+        return values.reshape(np.shape(az))
+
+
 def rgb2gray(arr):
     """
     Converts from RGB to gray.
@@ -207,15 +453,21 @@ def rgb2gray(arr):
     return 0.299 * red + 0.587 * green + 0.144 * blue
 
 
-def loadallsky(fnimg, station, return_complete=False):
+def loadallsky(fnimg, station, return_complete=False, geometry=None):
     """
     Loads the all sky image
     
     :param return_complete: returns the masked image and the unmasked image
+    :param fnimg: filename of the image, or its content as bytes
+    :param geometry: a :class:`~clouds.StationGeometry`, to use its precomputed mask. If None, the mask is computed by the station.
     
     :return: Masked image or masked image and original image. Note that if cannot download, returns `None` or `None, None`. 
     """
-    logger.debug("Loading image {}...".format(fnimg))
+    if isinstance(fnimg, bytes):
+        logger.debug("Decoding image...")
+        fnimg = io.BytesIO(fnimg)
+    else:
+        logger.debug("Loading image {}...".format(fnimg))
     im = imageio.imread(fnimg)
     ar = np.array(im)
     if len(np.shape(ar)) != 3:
@@ -228,7 +480,10 @@ def loadallsky(fnimg, station, return_complete=False):
     ar = rgb2gray(ar)
     rest = copy.copy(ar)
     
-    mask = station.get_mask(ar)
+    if geometry is None:
+        mask = station.get_mask(ar)
+    else:
+        mask = geometry.get_mask(ar)
     ar[mask] = np.nan
     
     if return_complete:
@@ -263,6 +518,225 @@ def gaussian(params, stamp, stampsize):
 
     return np.ravel(g)
     
+def measure_stars(data, x, y, stampsize, maxnfev=50):
+    """
+    Batched version of :meth:`~clouds.fwhm`: fits a 2D Gaussian profile on all the stars at once and returns their FWHM in px
+    
+    The stamps are cut into a single (stars x stampsize x stampsize) array and fitted together with the Levenberg-Marquardt algorithm of MINPACK, as the `least_squares(method='lm')` of :meth:`~clouds.fwhm`: same model and initial guess, same forward-difference jacobian, trust region and stopping tests, and the same budget of model evaluations (the jacobian costing one evaluation per parameter). The fits only differ by rounding errors, so that the stars are selected as with :meth:`~clouds.fwhm`. Most fits of a real image stop on the budget before converging, like the ones of :meth:`~clouds.fwhm`.
+    
+    :param data: the image containing the stars
+    :param x: centroid x positions
+    :param y: centroid y positions
+    :param stampsize: size of nominal square stamp
+    :param maxnfev: number of evaluations of the model per star, 50 in :meth:`~clouds.fwhm`
+    
+    :return: array of fwhm in px (NaN if the star could not be measured) and array of quality flags: 0 (STAR_OK), 1 (STAR_EDGE, too close to edge), 2 (STAR_NAN, stamp contains NaN), 3 (STAR_UNPHYSICAL, width unphysical), 4 (STAR_NOTCONVERGED, fit not converged within maxnfev evaluations, or stalled away from a minimum)
+    """
+    assert stampsize % 2 == 0 #make sure it's an integer
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    fwhms = np.ones(len(x)) * np.nan
+    flags = np.zeros(len(x), dtype=int)
+    if len(x) == 0:
+        return fwhms, flags
+
+    edge = (x < stampsize) | (y < stampsize) | (data.shape[1] - x < stampsize) | (data.shape[0] - y < stampsize)
+    flags[edge] = STAR_EDGE
+
+    # stamps of all the measurable stars, with the same boundaries as in fwhm
+    xi = (x[~edge] - stampsize / 2.).astype(int)
+    yi = (y[~edge] - stampsize / 2.).astype(int)
+    offsets = np.arange(stampsize)
+    stamps = data[(yi[:, np.newaxis] + offsets)[:, :, np.newaxis], (xi[:, np.newaxis] + offsets)[:, np.newaxis, :]].astype(np.float64)
+
+    hasnan = np.isnan(np.sum(stamps, axis=(1, 2)))
+    flags[np.flatnonzero(~edge)[hasnan]] = STAR_NAN
+    stamps = stamps[~hasnan].reshape(-1, stampsize * stampsize)
+    if len(stamps) == 0:
+        return fwhms, flags
+
+    gx, gy = np.meshgrid(offsets.astype(np.float64), offsets.astype(np.float64))
+    gx, gy = np.ravel(gx), np.ravel(gy)
+    nparams = 5
+    epsmch = np.finfo(np.float64).eps
+    # ftol, xtol and gtol of least_squares
+    tol = 1e-8
+
+    def model(p, stamps):
+        # the same operations as gaussian, for the rounding errors to be the same
+        xc, yc, std, i0, sky = [p[:, ii:ii+1] for ii in range(nparams)]
+        r = np.hypot(gx - xc, gy - yc)
+        return i0 * np.exp(-0.5 * (r / std)**2.) / std / np.sqrt(2.*np.pi) + sky - stamps
+
+    def jacobian(p, residuals, stamps):
+        # forward differences, with the steps of MINPACK
+        jac = np.empty(np.shape(residuals) + (nparams,))
+        for ii in range(nparams):
+            h = np.sqrt(epsmch) * np.abs(p[:, ii])
+            h[h == 0] = np.sqrt(epsmch)
+            shifted = p.copy()
+            shifted[:, ii] += h
+            jac[:, :, ii] = (model(shifted, stamps) - residuals) / h[:, np.newaxis]
+        return jac
+
+    def cosines(jac, residuals):
+        # largest cosine between the residuals and the columns of the jacobian (gnorm of MINPACK), 0 at a minimum
+        colnorms = np.linalg.norm(jac, axis=1)
+        gradient = np.abs(np.matmul(jac.transpose(0, 2, 1), residuals[:, :, np.newaxis])[:, :, 0])
+        return np.max(np.where(colnorms > 0, gradient / (colnorms * np.linalg.norm(residuals, axis=1)[:, np.newaxis]), 0.), axis=1)
+
+    # same initial guess as fwhm
+    nstamps = len(stamps)
+    p = np.tile([stampsize / 2., stampsize / 2., 2., 1e5, np.median(data)], (nstamps, 1))
+    with np.errstate(all='ignore'):
+        residuals = model(p, stamps)
+    fnorm = np.linalg.norm(residuals, axis=1)
+    pnorm = np.linalg.norm(p, axis=1)
+    nfev = np.ones(nstamps, dtype=int)
+    delta, par = np.zeros(nstamps), np.zeros(nstamps)
+    first = np.ones(nstamps, dtype=bool)
+    # the singular value decomposition of the jacobian stands for the QR decomposition of MINPACK
+    sv, v, c, gnorm = np.zeros((nstamps, nparams)), np.zeros((nstamps, nparams, nparams)), np.zeros((nstamps, nparams)), np.zeros(nstamps)
+    newjac = np.ones(nstamps, dtype=bool)
+
+    # termination of each fit, with the info codes of MINPACK: 0 while running, 1, 2, 3 and 4 converged, 5 out of budget, 6, 7 and 8 tolerances too small. -1 if the stamp contains infinite values
+    info = np.zeros(nstamps, dtype=int)
+    info[~np.isfinite(fnorm)] = -1
+
+    while True:
+        # new jacobians at the start and after each successful step
+        active = np.flatnonzero((info == 0) & newjac)
+        if len(active) > 0:
+            with np.errstate(all='ignore'):
+                jac = jacobian(p[active], residuals[active], stamps[active])
+                u, sv[active], vt = np.linalg.svd(jac, full_matrices=False)
+                gnorm[active] = np.where(fnorm[active] != 0, cosines(jac, residuals[active]), 0.)
+            nfev[active] += nparams
+            v[active] = vt.transpose(0, 2, 1)
+            c[active] = np.matmul(u.transpose(0, 2, 1), residuals[active][:, :, np.newaxis])[:, :, 0]
+            delta[active[first[active]]] = np.where(pnorm > 0, 100. * pnorm, 100.)[active[first[active]]]
+            info[active[gnorm[active] <= tol]] = 4
+            newjac[active] = False
+
+        active = np.flatnonzero(info == 0)
+        if len(active) == 0:
+            break
+
+        with np.errstate(all='ignore'):
+            step, par[active], jstepnorm = lm_step(sv[active], v[active], c[active], delta[active], par[active])
+            stepnorm = np.linalg.norm(step, axis=1)
+            delta[active] = np.where(first[active], np.minimum(delta[active], stepnorm), delta[active])
+            newp = p[active] + step
+            newresiduals = model(newp, stamps[active])
+            nfev[active] += 1
+            newfnorm = np.linalg.norm(newresiduals, axis=1)
+
+            # actual and predicted reductions of the cost, they update the trust region
+            actred = np.where(0.1 * newfnorm < fnorm[active], 1. - (newfnorm / fnorm[active]) ** 2, -1.)
+            temp1 = jstepnorm / fnorm[active]
+            temp2 = np.sqrt(par[active]) * stepnorm / fnorm[active]
+            prered = temp1 ** 2 + temp2 ** 2 / 0.5
+            dirder = -(temp1 ** 2 + temp2 ** 2)
+            ratio = np.where(prered != 0, actred / prered, 0.)
+
+            shrink = ratio <= 0.25
+            factor = np.where(actred >= 0, 0.5, 0.5 * dirder / (dirder + 0.5 * actred))
+            factor = np.where((0.1 * newfnorm >= fnorm[active]) | (factor < 0.1), 0.1, factor)
+            expand = ~shrink & ((par[active] == 0) | (ratio >= 0.75))
+            delta[active] = np.where(shrink, factor * np.minimum(delta[active], stepnorm / 0.1), np.where(expand, stepnorm / 0.5, delta[active]))
+            par[active] = np.where(shrink, par[active] / factor, np.where(expand, 0.5 * par[active], par[active]))
+
+        better = ratio >= 1e-4
+        moved = active[better]
+        p[moved], residuals[moved], fnorm[moved] = newp[better], newresiduals[better], newfnorm[better]
+        pnorm[moved] = np.linalg.norm(p[moved], axis=1)
+        newjac[moved] = True
+        first[moved] = False
+
+        small = 0.5 * ratio <= 1
+        tests = [(np.abs(actred) <= tol) & (prered <= tol) & small, delta[active] <= tol * pnorm[active], nfev[active] >= maxnfev,
+                 (np.abs(actred) <= epsmch) & (prered <= epsmch) & small, delta[active] <= epsmch * pnorm[active], gnorm[active] <= epsmch]
+        done = np.zeros(len(active), dtype=int)
+        for code, test in zip([1, 2, 5, 6, 7, 8], tests):
+            done[(done == 0) & test] = code
+        info[active] = done
+
+    # a fit whose trust region collapsed has converged only if it sits at a minimum, i.e. the residuals are orthogonal to the jacobian, or if it is exact
+    collapsed = np.flatnonzero(np.isin(info, [2, 6, 7, 8]))
+    with np.errstate(all='ignore'):
+        gradient = cosines(jacobian(p[collapsed], residuals[collapsed], stamps[collapsed]), residuals[collapsed])
+    exact = np.isfinite(fnorm[collapsed]) & (fnorm[collapsed] ** 2 <= 1e-20 * np.sum(stamps[collapsed] ** 2, axis=1))
+    stalled = collapsed[~((gradient <= tol) | exact)]
+
+    widths = p[:, 2]
+    measured = np.flatnonzero(~edge)[~hasnan]
+    fwhms[measured] = widths * 2. * np.sqrt(2.*np.log(2.))
+    flags[measured[(info == 5) | (info == -1)]] = STAR_NOTCONVERGED
+    flags[measured[stalled]] = STAR_NOTCONVERGED
+    flags[measured[(widths < 0.2) | (widths > 1e3)]] = STAR_UNPHYSICAL
+
+    if SETTINGS["misc"]["cloudsdetailedlogs"] == "True":
+        logger.debug("Measured {} stars, flags: {}".format(len(x), np.bincount(flags, minlength=5)))
+
+    return fwhms, flags
+
+def lm_step(sv, v, c, delta, par):
+    """
+    Levenberg-Marquardt steps of a batch of fits, as computed by the `lmpar` routine of MINPACK: the step is the Gauss-Newton one if it fits in the trust region, otherwise the damping parameter is adjusted until the length of the step is within 10% of the trust region radius (at most 10 iterations).
+
+    The jacobians J are given by their singular value decompositions J = U diag(sv) V^T.
+
+    :param sv: (fits x parameters) array, singular values of the jacobians
+    :param v: (fits x parameters x parameters) array, right singular vectors
+    :param c: (fits x parameters) array, U^T residuals
+    :param delta: array, trust region radii
+    :param par: array, damping parameters of the previous steps
+
+    :return: the steps, the new damping parameters and the norms of the jacobians times the steps
+    """
+    dwarf = np.finfo(np.float64).tiny
+
+    def coordinates(par):
+        # coordinates of minus the step in the basis v
+        denominator = sv ** 2 + par[:, np.newaxis]
+        return np.where(denominator > 0, sv * c / denominator, 0.)
+
+    def derivative(w, norm, par):
+        return np.sum(np.where(sv ** 2 + par[:, np.newaxis] > 0, w ** 2 / (sv ** 2 + par[:, np.newaxis]), 0.), axis=1) / norm ** 2
+
+    # Gauss-Newton step
+    w = coordinates(np.zeros(len(delta)))
+    norm = np.linalg.norm(w, axis=1)
+    fp = norm - delta
+    running = fp > 0.1 * delta
+
+    # bounds of the damping parameter
+    parl = np.where(np.all(sv > 0, axis=1), fp / delta / derivative(w, norm, np.zeros(len(delta))), 0.)
+    gnorm = np.linalg.norm(sv * c, axis=1)
+    paru = gnorm / delta
+    paru = np.where(paru == 0, dwarf / np.minimum(delta, 0.1), paru)
+    par = np.minimum(np.maximum(par, parl), paru)
+    par = np.where(par == 0, gnorm / norm, par)
+    par = np.where(running, par, 0.)
+
+    for ii in range(10):
+        if not running.any():
+            break
+        par = np.where(running & (par == 0), np.maximum(dwarf, 0.001 * paru), par)
+        w = np.where(running[:, np.newaxis], coordinates(par), w)
+        norm = np.linalg.norm(w, axis=1)
+        previous, fp = fp, np.where(running, norm - delta, fp)
+
+        running &= ~((np.abs(fp) <= 0.1 * delta) | ((parl == 0) & (fp <= previous) & (previous < 0)) | (ii == 9))
+        # Newton correction of the damping parameter
+        correction = fp / delta / derivative(w, norm, par)
+        parl = np.where(running & (fp > 0), np.maximum(parl, par), parl)
+        paru = np.where(running & (fp < 0), np.minimum(paru, par), paru)
+        par = np.where(running, np.maximum(parl, par + correction), par)
+
+    step = -np.matmul(v, w[:, :, np.newaxis])[:, :, 0]
+    return step, par, np.linalg.norm(sv * w, axis=1)
+    
 def fwhm(data,xc,yc,stampsize,show=False):
     """
     Fits a 2D Gaussian profile and returns the FWHM in px
@@ -1,20 +1,20 @@
-import requests
 import numpy as np
-import re
 import os
 import sys, inspect
 
 sys.path.insert(0, '../pouet')
-import util
+import util, stationclient, meteolast
 
 import logging
 logger = logging.getLogger(__name__)
 
-class WeatherReport():
+PARSER = meteolast.MeteoLastParser()
+
+class WeatherReport(stationclient.WeatherReport):
     """
     This class is dedicated to recovering the weather report at the La Silla site and feeding the
     wind direction, wind speed, temperature and humidity back to pouet.
-    It must contain at least a `get` method that returns the above variable.
+    The download is done by :meth:`stationclient.WeatherReport.get`, from the url of Maidanak.cfg, the report is interpreted by `parse`.
     """
     
     def __init__(self, name='Maidanak'):
@@ -23,89 +23,54 @@ class WeatherReport():
         
         :param name: name of the cfg file, only included for completeness.
         """
-
-        self.config = util.readconfig(os.path.join(os.path.dirname(os.path.abspath(inspect.stack()[0][1])), "{}.cfg".format(name)))
+        super().__init__(name)
         
-    def get(self, debugmode, FLAG = -9999):
+    def read(self, debugmode, FLAG = -9999):
         """
-        Get method that reads the weather reports off the web. In the LaSilla case, it download a `meteo.last` and interprets the data.
-        
-        :param debugmode: whether or not POUET is in debugmode. If true, it ought to return some static and dummy data
-        :param FLAG: what to return in case the weather report cannot be downloaded or treated. Currently, POUET expect -9999 as a placeholder.
+        See :meth:`stationclient.WeatherReport.read`. There is no weather report at Maidanak yet, the debug report is used.
+        """
+        logger.warning("!! No weather report configured, forcing debugmode = True...")
+        return super().read(debugmode=True, FLAG=FLAG)
     
-        :return: Wind direction, speed, temperature and humidity
+    def parse(self, data, FLAG = -9999):
+        """
+        Interprets the content of a `meteo.last` weather report.
         
-        .. warning:: Such a method *must* return the following variables in that precise order: wind direction, wind speed, temperature and humidity
+        :param data: the content of the report, as a string
+        :param FLAG: what to return for the values that cannot be read
         
+        :return: Wind direction, speed, temperature and humidity
         """
-        #todo: add a "no connection" message if page is not reachable instead of an error
-        WS=[]
-        WD=[]
-        RH = None
-        Temps = []
+        records = meteolast.get_latest(PARSER.parse(data))
         
-        error_msg = "Cannot download weather data. Either you or the weather server is offline!"
-
-        logger.warning("!! No weather report configured, forcing debugmode = True...")
-        debugmode = True
-
-        if debugmode:
-            fname = os.path.join(os.path.dirname(os.path.abspath(inspect.stack()[0][1])), "meteoDebugMode.last")
-            fi = open(fname, mode='r')
-            data = ""
-            with fi:
-                line = fi.read()
-                data += line
-        else:
-            try:
-                #data=urllib.request.urlopen(self.location.get("weather", "url")).read()
-                data = requests.get(self.config.get("weather", "url")).content
-            except requests.ConnectionError:
-                logger.warning(error_msg)
-                return FLAG, FLAG, FLAG, FLAG
-            
-            data = data.decode("utf-8")
-            if "404 Not Found" in data:
-                logger.warning(error_msg)
-                return FLAG, FLAG, FLAG, FLAG
-            
-        data=data.split("\n") # then split it into lines
-        for line in data:
-            if re.match( r'WD', line, re.M|re.I):
-                WD.append(int(line[20:25])) # AVG
-            if re.match( r'WS', line, re.M|re.I):
-                WS.append(float(line[20:25])) # AVG
-            if re.match( r'RH', line, re.M|re.I):
-                RH = float(line[20:25]) # AVG
-            if re.match( r'T ', line, re.M|re.I):
-                Temps.append(float(line[20:25])) # AVG
-    
         # Remove out-of-band readings
         # WD is chosen between station 1 or 2 in EDP pour la Silla.
         # We take average
-        Temps = np.asarray(Temps, dtype=np.float)
+        Temps = meteolast.get_readings(records, 'T')
         Temps = Temps[Temps < 100]
-        Temps = np.mean(Temps)
+        Temps = np.mean(Temps) if len(Temps) > 0 else np.nan
+        
+        RH = meteolast.get_readings(records, 'RH')
+        RH = RH[-1] if len(RH) > 0 else np.nan
     
         # Remove out-of-band readings
         # WD is chosen between station 1 or 2 in EDP pour la Silla.
         # We take average
-        WD = np.asarray(WD, dtype=np.float)
+        WD = meteolast.get_readings(records, 'WD')
         WD = WD[WD < 360]
         WD = WD[WD > 0]
-        WD = np.mean(WD)
+        WD = np.mean(WD) if len(WD) > 0 else np.nan
         
         # WS should be either WS next to 3.6m or max
         # Remove WS > 99 m/s
-        WS = np.asarray(WS, dtype=np.float)
-        if WS[2] < 99:
+        WS = meteolast.get_readings(records, 'WS')
+        if len(WS) > 2 and WS[2] < 99:
             WS = WS[2]
         else:
             logger.warning("Wind speed from 3.6m unavailable, using other readings in LaSilla")
-            WS = np.asarray(WS, dtype=np.float)
             WS = WS[WS > 0]
             WS = WS[WS < 99]
-            WS = np.mean(WS)
+            WS = np.mean(WS) if len(WS) > 0 else np.nan
     
         for var in [WD, WS, Temps, RH]:
             if not np.isnan(var):
@@ -161,17 +126,17 @@ class AllSky():
         """
         Converts the azimuth and elevation of a target in pixel coordinates
         
-        :param az: azimuth (in rad)
-        :param elev: elevation (in rad)
+        :param az: azimuth (in rad), float or numpy array
+        :param elev: elevation (in rad), float or numpy array
         
-        :return: x and y position 
+        :return: x and y position, with the same shape as az and elev
         """
         
         north = self.params['north']
         cx = self.params['cx']
         cy = self.params['cy']
     
-        az *= -1.
+        az = -1. * az
         elev = np.pi/2. - elev
         
         rr = self.get_radius(elev)
@@ -179,12 +144,40 @@ class AllSky():
         x = np.cos(north + az) * (rr - 2) + cx 
         y = np.sin(north + az) * (rr - 2) + cy
         
-        if x < 0 or y < 0: 
-            x = np.nan
-            y = np.nan 
+        outside = np.logical_or(x < 0, y < 0)
+        if np.ndim(outside) == 0:
+            if outside:
+                x = np.nan
+                y = np.nan
+        else:
+            x = np.where(outside, np.nan, x)
+            y = np.where(outside, np.nan, y)
     
         return x, y
     
+    def get_sky_coordinates(self, x, y):
+        """
+        Converts pixel coordinates into azimuth and elevation, inverting :meth:`get_image_coordinates`
+        
+        :param x: x position (in px), float or numpy array
+        :param y: y position (in px), float or numpy array
+        
+        :return: azimuth and elevation (in rad), with the same shape as x and y
+        """
+        
+        north = self.params['north']
+        cx = self.params['cx']
+        cy = self.params['cy']
+        
+        theta = np.arctan2(y - cy, x - cx)
+        rr = np.hypot(x - cx, y - cy) + 2
+        
+        az = np.mod(north - theta, 2. * np.pi)
+        elev = 2. * np.arctan(rr / (self.params["ff"] * self.params["k1"] * self.params["r0"])) / self.params["k2"]
+        elev = np.pi/2. - elev
+        
+        return az, elev
+    
     def get_mask(self, ar):
         """
         Returns the mask to apply on the AllSky hide unwanted features in the image.
@@ -0,0 +1,118 @@
+"""
+Concurrent downloads of the station feeds (weather report, all-sky image...) with asyncio.
+
+Each feed is a job, i.e. a coroutine function, run with its own timeout. All the jobs of a refresh run at the same time in an event loop owned by the calling thread, so that the total time is the one of the slowest feed. A :class:`Refresh` can be cancelled from another thread (typically the GUI thread, which never waits on the network).
+
+The downloads themselves are blocking `requests` calls, that the jobs run in the executor of the loop. A job that times out cannot stop its thread: the jobs only change shared state from the loop thread, once their download is back.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FetchError(IOError):
+    """
+    A download failed: unreachable server, timeout, HTTP error...
+    """
+    pass
+
+
+class RefreshExecutor(concurrent.futures.ThreadPoolExecutor):
+    """
+    Thread pool running the blocking downloads of a :class:`Refresh`. It keeps track of its futures, so that the downloads that did not start yet can be cancelled when the refresh is over (``shutdown(cancel_futures=True)`` needs Python 3.9).
+    """
+
+    def __init__(self, *args, **kwargs):
+        concurrent.futures.ThreadPoolExecutor.__init__(self, *args, **kwargs)
+        self.futures = []
+
+    def submit(self, *args, **kwargs):
+        future = concurrent.futures.ThreadPoolExecutor.submit(self, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def cancel(self):
+        """
+        Cancels the downloads that did not start and shuts the pool down, without waiting for the running ones
+        """
+        for future in self.futures:
+            future.cancel()
+        self.shutdown(wait=False)
+
+
+class Refresh():
+    """
+    Runs a set of jobs concurrently, each one with its own timeout, and collects their results.
+
+    :meth:`run` blocks the calling thread until all the jobs are done, :meth:`cancel` can be called from any thread to abandon the jobs still running.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.task = None
+        self.cancelled = False
+
+    def run(self, jobs, timeouts=None):
+        """
+        :param jobs: dictionary of coroutine functions (without argument), by name of the source
+        :param timeouts: dictionary of timeouts (in s) by name of the source. The sources without timeout can run as long as they want.
+
+        :return: dictionary of the results by name of the source. A job that failed or was cancelled has its exception as result.
+        """
+        timeouts = timeouts or {}
+        executor = RefreshExecutor(thread_name_prefix="refresh")
+        with self.lock:
+            self.cancelled = False
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(executor)
+        try:
+            return self.loop.run_until_complete(self._run(jobs, timeouts))
+        finally:
+            # the downloads that timed out are abandoned, their threads finish on their own
+            executor.cancel()
+            with self.lock:
+                self.loop.close()
+                self.loop = None
+                self.task = None
+
+    async def _run(self, jobs, timeouts):
+        results = {}
+
+        async def guarded(name, job):
+            t0 = self.loop.time()
+            try:
+                results[name] = await asyncio.wait_for(job(), timeouts.get(name))
+                logger.debug("Refresh of {} done in {:.2f} s".format(name, self.loop.time() - t0))
+            except asyncio.TimeoutError:
+                results[name] = FetchError("{} did not answer within {} s".format(name, timeouts.get(name)))
+            except asyncio.CancelledError as e:
+                results[name] = e
+            except Exception as e:
+                results[name] = e
+            if isinstance(results[name], BaseException):
+                logger.warning("Refresh of {} failed: {}".format(name, repr(results[name])))
+
+        with self.lock:
+            self.task = asyncio.gather(*[guarded(name, job) for name, job in jobs.items()])
+            if self.cancelled:
+                self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        # the jobs cancelled before they started have no result
+        return {name: results.get(name, asyncio.CancelledError()) for name in jobs}
+
+    def cancel(self):
+        """
+        Cancels the running jobs (if any). Can be called from any thread.
+        """
+        with self.lock:
+            self.cancelled = True
+            if self.loop is not None and self.task is not None:
+                self.loop.call_soon_threadsafe(self.task.cancel)
@@ -0,0 +1,147 @@
+"""
+Define the AllSkyHistory class, a record of the all-sky analysis of a night on disk.
+
+Each night has its own set of files, memory-mapped so that they can be appended to and read by time range without loading them into memory, and re-opened after a restart of POUET.
+"""
+
+import os
+import warnings
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AllSkyHistory():
+    """
+    Fixed-size ring buffer of timestamped cloud maps, star counts and downsampled gray frames of one night.
+
+    Three .npy files are used: the index (time and number of stars of each slot, NaN time for the empty slots), the cloud maps (float32) and the frames (uint8). Once full, the oldest slots are overwritten.
+    """
+
+    index_dtype = [('mjd', 'f8'), ('nstars', 'i4')]
+
+    def __init__(self, directory, name, obs_night, shape, capacity=480, mapbinning=2, framebinning=4):
+        """
+        :param directory: where to store the files, created if needed
+        :param name: name of the station
+        :param obs_night: string formatted as YYYY-MM-DD, the night of the records
+        :param shape: shape of the cloud maps (and of the transposed frames), i.e. (image_x_size, image_y_size)
+        :param capacity: number of slots of the ring buffer
+        :param mapbinning: the maps are stored binned by this factor
+        :param framebinning: the frames are stored binned by this factor. If 0, the frames are not stored.
+        """
+        self.name = name
+        self.obs_night = obs_night
+        self.mapbinning = mapbinning
+        self.framebinning = framebinning
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        basename = os.path.join(directory, "{}_{}".format(name, obs_night))
+
+        mapshape = (capacity, shape[0] // mapbinning, shape[1] // mapbinning)
+        self.index = self._open("{}_index.npy".format(basename), np.dtype(self.index_dtype), (capacity,))
+        self.maps = self._open("{}_maps.npy".format(basename), np.float32, mapshape)
+        if framebinning:
+            # the frames are stored as images, i.e. transposed with respect to the maps
+            frameshape = (capacity, shape[1] // framebinning, shape[0] // framebinning)
+            self.frames = self._open("{}_frames.npy".format(basename), np.uint8, frameshape)
+        else:
+            self.frames = None
+
+        # the next slot follows the most recent record
+        if np.all(np.isnan(self.index['mjd'])):
+            self.position = 0
+        else:
+            self.position = (int(np.nanargmax(self.index['mjd'])) + 1) % capacity
+        logger.debug("All-sky history of {} opened with {} records".format(obs_night, len(self)))
+
+    def _open(self, filename, dtype, shape):
+        """
+        Opens a memory-mapped .npy file, or creates it (empty) if it does not exist or has a different layout
+        """
+        if os.path.exists(filename):
+            try:
+                array = np.lib.format.open_memmap(filename, mode='r+')
+                if array.dtype == dtype and array.shape == shape:
+                    return array
+                logger.warning("{} has an unexpected layout, it is overwritten".format(filename))
+            except ValueError:
+                logger.warning("{} is not readable, it is overwritten".format(filename))
+
+        array = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        if array.dtype.names is not None:
+            array['mjd'] = np.nan
+            array['nstars'] = -1
+        else:
+            array[:] = 0
+        array.flush()
+        return array
+
+    @property
+    def capacity(self):
+        return len(self.index)
+
+    def __len__(self):
+        return int(np.sum(np.isfinite(self.index['mjd'])))
+
+    def append(self, obs_time, cloudmap, nstars=-1, frame=None):
+        """
+        Records the analysis of a frame in the next slot.
+
+        :param obs_time: Astropy Time object, time of the frame
+        :param cloudmap: observability map of the frame, see :meth:`~clouds.Clouds.get_observability_map`
+        :param nstars: number of stars detected in the frame
+        :param frame: the gray all-sky image (not masked), or None
+        """
+        slot = self.position
+        self.maps[slot] = self._bin(cloudmap, self.mapbinning)
+        if self.frames is not None and frame is not None:
+            self.frames[slot] = np.clip(self._bin(frame, self.framebinning), 0, 255).astype(np.uint8)
+        self.index[slot] = (obs_time.mjd, nstars)
+
+        self.maps.flush()
+        if self.frames is not None:
+            self.frames.flush()
+        self.index.flush()
+        self.position = (slot + 1) % self.capacity
+
+    @staticmethod
+    def _bin(image, binning):
+        """
+        Averages an image over binning x binning pixels, cropping the last rows and columns if needed
+        """
+        image = np.asarray(image, dtype=float)
+        nx, ny = np.shape(image)[0] // binning, np.shape(image)[1] // binning
+        with warnings.catch_warnings():
+            # the fully masked bins are NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmean(image[:nx * binning, :ny * binning].reshape(nx, binning, ny, binning), axis=(1, 3))
+
+    def get_slots(self, tstart=None, tstop=None):
+        """
+        :param tstart: Astropy Time object, start of the time range. If None, from the oldest record.
+        :param tstop: Astropy Time object, end of the time range (included). If None, up to the latest record.
+        :return: indices of the slots within the time range, in chronological order
+        """
+        mjd = self.index['mjd']
+        valid = np.isfinite(mjd)
+        if tstart is not None:
+            valid[valid] = mjd[valid] >= tstart.mjd
+        if tstop is not None:
+            valid[valid] = mjd[valid] <= tstop.mjd
+        slots = np.flatnonzero(valid)
+        return slots[np.argsort(mjd[slots])]
+
+    def get_range(self, tstart=None, tstop=None):
+        """
+        Reads the records within a time range. Only these records are read from the disk.
+
+        :param tstart: Astropy Time object, start of the time range. If None, from the oldest record.
+        :param tstop: Astropy Time object, end of the time range (included). If None, up to the latest record.
+        :return: arrays of the MJDs, star counts, (binned) cloud maps and (binned) frames, the latter being None if they are not stored
+        """
+        slots = self.get_slots(tstart, tstop)
+        frames = None if self.frames is None else self.frames[slots]
+        return self.index['mjd'][slots], self.index['nstars'][slots], self.maps[slots], frames
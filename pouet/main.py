@@ -8,13 +8,15 @@ Launch the application, link POUET functions to the design
 
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 import os, sys
+import asyncio, concurrent.futures, functools, threading
 
-import obs, run, util, plots
+import obs, run, util, plots, fetch, scheduler
 
 from astropy import units as u
 from astropy.time import Time, TimeDelta
 from astropy.table import Table
 import astropy.coordinates.angles as angles
+import astropy.coordinates.angle_utilities as angle_utilities
 import copy
 import ephem
 
@@ -88,7 +90,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 		# signal and slots init...
 		self.loadObs.clicked.connect(self.load_obs)
-		self.weatherDisplayRefresh.clicked.connect(self.weather_display)
+		self.weatherDisplayRefresh.clicked.connect(self.weather_refresh)
 		self.allSkyRefresh.clicked.connect(self.allsky_refresh)
 		self.configCloudsShowLayersValue.clicked.connect(self.allsky_redisplay)
 		self.configAutoupdateFreqValue.valueChanged.connect(self.set_timer_interval)
@@ -108,19 +110,41 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		#self.toggleAirmassObs.selfChecked.connect()
 		self.visibilitytool.figure.canvas.mpl_connect('motion_notify_event', self.on_visibilitytoolmotion)
 
+		# The scheduler decides what to refresh at each tick of the timer, see auto_refresh
+		self.scheduler = scheduler.RefreshScheduler()
+		self.scheduler.add_source("weather", float(SETTINGS['validity']['weatherreportfrequency']))
+		self.scheduler.add_source("allsky", float(SETTINGS['validity']['allskyfrequency']) * 60.)
+		self.set_timer_interval()
+
 		# Stating timer
 		self.timer = QtCore.QTimer()
-		self.timer.timeout.connect(self.update)
-		self.timer.start(30000) #trigger every 2 minutes by default.
 		self.timer.timeout.connect(self.auto_refresh)
+		self.timer.start(10000) # the scheduler checks what is due every 10 seconds
 
 		# Some housekeeping stuff...
 		self.allskylayerTargets.show_coordinates(150, 150, color="None")
 		self.listObs_check_state = 0
 
-		# To handle the all sky in a thread...
-		self.threadAllskyUpdate = ThreadAllskyUpdate(parent=self)
-		self.threadAllskyUpdate.allskyUpdate.connect(self.on_threadAllskyUpdate)
+		# the loaded observables, and the same by name
+		self.observables = []
+		self.observables_index = {}
+
+		# To download the weather report and the all sky in a thread...
+		self.threadMeteoRefresh = ThreadMeteoRefresh(parent=self)
+		self.threadMeteoRefresh.meteoUpdate.connect(self.on_threadMeteoRefresh)
+		self.threadMeteoRefresh.finished.connect(self.on_threadMeteoRefreshFinished)
+
+		# To compute the observability, the site information and the visibility in the background...
+		self.compute = ComputeService(parent=self)
+		self.compute.progress.connect(self.on_computeProgress)
+		self.compute.resultReady.connect(self.on_computeResult)
+		self.compute.failed.connect(self.on_computeFailed)
+		self.compute_pending = None
+		# the observables computed in the background, see get_obssets
+		self.obssets = []
+		self.obssets_key = None
+		# the computed sets whose results are not written back to the observables yet, see writeback_observables
+		self.unwritten = []
 
 		# initialize regular expression validators for alpha and delta selecters
 		alpha_regexp = QtCore.QRegExp('([01]?[0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]([\.][0-9]?[0-9]?|)')
@@ -166,53 +190,53 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		row_id = self.listObs.rowAt(self.listObs.viewport().mapFromGlobal(pos).y())
 		
 		try:
-			targetname = self.listObs.model().item(row_id, 0).data(0)
+			targetname = self.listObs.model().get_name(row_id)
 		except:
 			return
 		
-		for target in self.observables:
+		target = self.observables_index.get(targetname)
+		if target is None:
+			return
 
-			if not target.name == targetname:
-				continue
-			menu = QtWidgets.QMenu()
-			airmassAction = menu.addAction("Show airmass")
-			skychartAction = menu.addAction("Show sky chart")
-			action = menu.exec_(pos)
+		menu = QtWidgets.QMenu()
+		airmassAction = menu.addAction("Show airmass")
+		skychartAction = menu.addAction("Show sky chart")
+		action = menu.exec_(pos)
 		
-			if action == airmassAction:
-				logging.debug("Opening Airmass rosette...")
-				self.print_status('Opening Airmass chart for {}...'.format(target.name), SETTINGS["color"]["warn"])
-				self.plot_show = uic.loadUi(os.path.join(herepath, "dialogPlots.ui"))
-				self.plot_show.setWindowTitle("Airmass for {}".format(target.name))
+		if action == airmassAction:
+			logging.debug("Opening Airmass rosette...")
+			self.print_status('Opening Airmass chart for {}...'.format(target.name), SETTINGS["color"]["warn"])
+			self.plot_show = uic.loadUi(os.path.join(herepath, "dialogPlots.ui"))
+			self.plot_show.setWindowTitle("Airmass for {}".format(target.name))
 
-				amv = AirmassView(parent=self.plot_show.widget)
-				amv.show(target, self.currentmeteo)
+			amv = AirmassView(parent=self.plot_show.widget)
+			amv.show(target, self.currentmeteo)
 
-				self.plot_show.open()
-				logging.info("Airmass rosette opened.")
-				self.print_status('Airmass rosette opened.', SETTINGS["color"]["success"])
+			self.plot_show.open()
+			logging.info("Airmass rosette opened.")
+			self.print_status('Airmass rosette opened.', SETTINGS["color"]["success"])
 
-			elif action == skychartAction:
-				logging.debug("Opening Sky Chart...")
-				self.print_status('Opening Sky Chart for {}...'.format(target.name), SETTINGS["color"]["warn"])
+		elif action == skychartAction:
+			logging.debug("Opening Sky Chart...")
+			self.print_status('Opening Sky Chart for {}...'.format(target.name), SETTINGS["color"]["warn"])
 
-				self.skychart_show = uic.loadUi(os.path.join(herepath, "dialogSkyChart.ui"))
-				self.skychart_show.setWindowTitle("Sky chart for {}".format(target.name))
+			self.skychart_show = uic.loadUi(os.path.join(herepath, "dialogSkyChart.ui"))
+			self.skychart_show.setWindowTitle("Sky chart for {}".format(target.name))
 
-				skychart = SkychartView(target=target, parent=self.skychart_show.widget)
-				skychart.show()
+			skychart = SkychartView(target=target, parent=self.skychart_show.widget)
+			skychart.show()
 
-				self.skychart_show.flipNorth.clicked.connect(skychart.flipNorth)
-				self.skychart_show.flipEast.clicked.connect(skychart.flipEast)
-				self.skychart_show.SurveyBox.currentTextChanged.connect(skychart.changeSurvey)
-				self.skychart_show.sizeBox.currentTextChanged.connect(skychart.changeBoxSize)
-				self.skychart_show.invertColors.clicked.connect(skychart.invertColors)
+			self.skychart_show.flipNorth.clicked.connect(skychart.flipNorth)
+			self.skychart_show.flipEast.clicked.connect(skychart.flipEast)
+			self.skychart_show.SurveyBox.currentTextChanged.connect(skychart.changeSurvey)
+			self.skychart_show.sizeBox.currentTextChanged.connect(skychart.changeBoxSize)
+			self.skychart_show.invertColors.clicked.connect(skychart.invertColors)
 
-				self.skychart_show.open()
+			self.skychart_show.open()
 
-				logging.info("Sky chart opened.")
-				self.print_status('Sky chart opened.', SETTINGS["color"]["success"])
-				
+			logging.info("Sky chart opened.")
+			self.print_status('Sky chart opened.', SETTINGS["color"]["success"])
+			
 	def showSelectedNames(self):
 
 		logging.debug("Opening selected names popup...")
@@ -304,17 +328,91 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		"""
 		self.viewLogs.appendPlainText(msg)
 
-	@QtCore.pyqtSlot(list)
-	def on_threadAllskyUpdate(self, sample):
+	@QtCore.pyqtSlot(dict)
+	def on_threadMeteoRefresh(self, results):
 		"""
-		When an AllSky update is finished, this method is being called. It gets the image from the thread (element 0 in the list `sample`) and displays it.
+		When a weather and/or all sky refresh is finished, this method is being called. It reports the outcome of the downloads to the scheduler, applies the results of the thread (see :meth:`meteo.Meteo.fetch`) to the current meteo and displays them.
 		"""
-		logging.debug("Displaying all sky...")
-		self.currentmeteo.allsky = sample[0]
-		self.allskylayer.erase()
-		self.allsky_redisplay()
-		logging.info("All Sky refresh done.")
-		self.print_status("All Sky refresh done.", SETTINGS["color"]["success"])
+		for name in ["weather", "allsky"]:
+			if self.scheduler.is_running(name):
+				self.scheduler.finish(name, self.get_refresh_outcome(results.get(name)))
+
+		if self.threadMeteoRefresh.meteo is not self.currentmeteo:
+			logging.info("The meteo changed during the refresh, its results are ignored")
+			return
+		self.currentmeteo.apply_refresh(results)
+
+		if 'weather' in results:
+			self.weather_display(draw_wind='allsky' not in results)
+
+		if isinstance(results.get('allsky'), BaseException):
+			logging.info("All Sky refresh cancelled.")
+		elif 'allsky' in results or self.threadMeteoRefresh.allsky:
+			# without result, the last image was too recent to be downloaded again and is displayed again
+			logging.debug("Displaying all sky...")
+			self.allskylayer.erase()
+			self.allsky_redisplay()
+			logging.info("All Sky refresh done.")
+			self.print_status("All Sky refresh done.", SETTINGS["color"]["success"])
+
+		# the observability follows the new weather and clouds
+		self.schedule_observability()
+
+	def get_refresh_outcome(self, result):
+		"""
+		:param result: result of a source in the results of :meth:`meteo.Meteo.fetch`, None if the source was not downloaded (e.g. the last all sky is recent enough)
+		:return: the outcome of the refresh for :meth:`scheduler.RefreshScheduler.finish`: True if it succeeded, False if it failed and None if it was cancelled
+		"""
+		if isinstance(result, asyncio.CancelledError):
+			return None
+		if isinstance(result, BaseException) or getattr(result, "failed_connection", False):
+			return False
+		return True
+
+	@QtCore.pyqtSlot()
+	def on_threadMeteoRefreshFinished(self):
+		"""
+		Starts the refreshes that were requested or became due while the previous one was running, if any.
+		"""
+		for name in ["weather", "allsky"]:
+			if self.scheduler.is_running(name):
+				# the thread stopped without results
+				self.scheduler.finish(name, False)
+		self.run_scheduler()
+
+	def run_scheduler(self):
+		"""
+		Starts the refresh of the sources that are due (see :class:`~scheduler.RefreshScheduler`), all at once. If a refresh is still running, they wait for it to finish.
+		"""
+		if self.threadMeteoRefresh.isRunning():
+			if self.scheduler.queue:
+				logging.debug("A refresh is still running, {} will be refreshed after it".format(", ".join(self.scheduler.queue)))
+			return
+
+		due = self.scheduler.due()
+		if due:
+			self.meteo_refresh(weather="weather" in due, allsky="allsky" in due)
+
+	def meteo_refresh(self, weather=True, allsky=True):
+		"""
+		Starts downloading the weather report and/or the all sky in a new thread, both at the same time. The GUI does not wait for the downloads, see :meth:`on_threadMeteoRefresh`.
+
+		.. note:: Use :meth:`run_scheduler` instead, which does not start a refresh while another one is running
+
+		:param weather: boolean, whether to download the weather report
+		:param allsky: boolean, whether to download and analyse the all sky
+		"""
+		if self.threadMeteoRefresh.isRunning():
+			logging.warning("A refresh is still running, not starting another one")
+			return
+
+		if allsky:
+			self.print_status("Refreshing All Sky...", SETTINGS['color']['warn'])
+			self.allskylayer.erase()
+		self.scheduler.start([name for name, due in [("weather", weather), ("allsky", allsky)] if due])
+		self.threadMeteoRefresh.weather = weather
+		self.threadMeteoRefresh.allsky = allsky
+		self.threadMeteoRefresh.start()
 
 	def init_warn_station(self):
 		"""
@@ -393,10 +491,11 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 	def set_timer_interval(self):
 		"""
-		Helper that sets the auto-refresh frequency when the corresponding field in the `configuration` tab is changed
+		Helper that sets the auto-refresh frequency when the corresponding field in the `configuration` tab is changed. The weather report and the all sky are not refreshed more often than `weatherreportfrequency` and `allskyfrequency` (in global settings).
 		"""
-		interval = self.configAutoupdateFreqValue.value() * 1000 * 60
-		self.timer.setInterval(interval)
+		interval = self.configAutoupdateFreqValue.value() * 60.
+		self.scheduler.set_period("weather", max(interval, float(SETTINGS['validity']['weatherreportfrequency'])))
+		self.scheduler.set_period("allsky", max(interval, float(SETTINGS['validity']['allskyfrequency']) * 60.))
 		logging.debug("Set auto-refresh to {} min".format(self.configAutoupdateFreqValue.value()))
 
 	def set_configTimeNow(self):
@@ -438,6 +537,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 			self.allsky_debugmode = goto_mode
 			self.currentmeteo = run.startup(name=self.name_location, cloudscheck=self.cloudscheck, debugmode=self.allsky_debugmode)
+			self.scheduler.request("weather", "allsky")
 			self.auto_refresh()
 			self.do_update()
 
@@ -464,89 +564,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		logging.debug("Updating observability...")
 		self.print_status("Updating observability...", SETTINGS['color']['warn'])
 		self.save_Time2obstime()
-		self.site_display()
-		self.visibilitytool_draw()
-		self.update_obs()
-
-		self.listObs_plot_targets()
-		logging.info("General observability update performed")
-		self.print_status("Observability update done.", SETTINGS["color"]["success"])
-
-	def get_standard_items(self, o, FLAG='---'):
-		"""
-		Create the default QStandardItem objects for an observable o.
-
-		Assumes the time has been refreshed.
-
-		:param o: :class:`~obs.Observable`
-		:param FLAG: A string representing how non-defined variables, such as wind for non-visible observables, are represented.
-		:return: A bunch of QStandardItem: name, alpha, delta, observability, obsprogram, moondist, sundist, airmass, wind, clouds
-		"""
-		if SETTINGS["misc"]["singletargetlogs"] == "True":
-			logging.debug("Create QStandardItems for {}...".format(o.name))
-		# Initial params
-		name = QtGui.QStandardItem(o.name)
-		name.setCheckable(True)
-		alpha = QtGui.QStandardItem(o.alpha.to_string(unit=u.hour, sep=':', pad=True))
-		delta = QtGui.QStandardItem(o.delta.to_string(unit=u.degree, sep=':', pad=True))
-		observability = QtGui.QStandardItem(str("{:1.1f}".format(o.observability)))
-		obsprogram = QtGui.QStandardItem(o.obsprogram)
-
-
-		# Angle to the moon
-		moondist = QtGui.QStandardItem()
-		moondist.setData(str("{:03.0f}".format(o.angletomoon.degree)), role=QtCore.Qt.DisplayRole)
-		if o.obs_moondist:
-			moondist.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['success'])), role=QtCore.Qt.BackgroundRole)
-		else:
-			moondist.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['limit'])), role=QtCore.Qt.BackgroundRole)
-
-		# Angle to the Sun, TODO: What default requirements?
-		sundist = QtGui.QStandardItem()
-		sundist.setData(str("{:03.0f}".format(o.angletosun.degree)), role=QtCore.Qt.DisplayRole)
-
-		# Airmass
-		airmass = QtGui.QStandardItem()
-		airmass.setData(str("%.2f" % o.airmass), role=QtCore.Qt.DisplayRole)
-		if o.obs_airmass:
-			airmass.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['success'])), role=QtCore.Qt.BackgroundRole)
-		else:
-			if o.obs_highairmass:
-				airmass.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['warn'])), role=QtCore.Qt.BackgroundRole)
-			else:
-				airmass.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['limit'])), role=QtCore.Qt.BackgroundRole)
-
-		# Wind
-		wind = QtGui.QStandardItem()
-		if o.obs_wind_info:
-			wind.setData(str("{:03.0f}".format(o.angletowind.degree)), role=QtCore.Qt.DisplayRole)
-			if o.obs_wind:
-				wind.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['success'])), role=QtCore.Qt.BackgroundRole)
-			else:
-				wind.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['limit'])), role=QtCore.Qt.BackgroundRole)
-		else:
-			wind.setData(str(FLAG), role=QtCore.Qt.DisplayRole)
-			wind.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['nodata'])), role=QtCore.Qt.BackgroundRole)
-
-		# Clouds
-		clouds = QtGui.QStandardItem()
-		if o.obs_clouds_info:
-			clouds.setData(str("{:1.1f}".format(o.cloudcover)), role=QtCore.Qt.DisplayRole)
-			if o.cloudcover <= 0.25:
-				clouds.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['success'])), role=QtCore.Qt.BackgroundRole)
-			elif o.cloudcover <= 0.75:
-				clouds.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['warn'])), role=QtCore.Qt.BackgroundRole)
-			elif o.cloudcover <= 1:
-				clouds.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['limit'])), role=QtCore.Qt.BackgroundRole)
-			else:
-				clouds.setData(str(FLAG), role=QtCore.Qt.DisplayRole)
-				clouds.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['nodata'])), role=QtCore.Qt.BackgroundRole)
-		else:
-			clouds.setData(str(FLAG), role=QtCore.Qt.DisplayRole)
-			clouds.setData(QtGui.QBrush(QtGui.QColor(SETTINGS['color']['nodata'])), role=QtCore.Qt.BackgroundRole)
-
-		return name, alpha, delta, observability, obsprogram, moondist, sundist, airmass, wind, clouds
-
+		self.refresh_observability(site=True, visibility=True)
 
 	def get_header_info(self, table, autotest_mode=False):
 		"""
@@ -649,8 +667,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		"""
 
 		# initialize a new obs_model
-		obs_model = QtGui.QStandardItemModel(self.listObs)
-		obs_model.setHorizontalHeaderLabels(['Name', 'Alpha', 'Delta', 'Obs', 'Program', "S", "M", "A", "W", "C"])
+		obs_model = ObsModel(self.listObs)
 
 		# we remove what was already in the listObs
 		self.listObs.clearSpans()
@@ -666,52 +683,10 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 		"""
 		logging.debug("Updating display model...")
+		self.writeback_observables()
 
-		# load the current display model
-		obs_model = self.listObs.model()
-		model_names = [obs_model.item(i).data(0) for i in range(obs_model.rowCount())]
-
-		# these are the obs we want to display
-		obs_names = [o.name for o in self.observables if o.hidden == False]
-
-		"""
-		3 cases:
-
-		1) name is in obs_names and model_names --> we keep
-		2) name is in obs_names only --> we add to model using get_standard_items
-		3) name is in model_names only --> we remove from model
-
-		"""
-
-		toadd = [n for n in obs_names if not n in model_names]
-		toremove = [n for n in model_names if not n in obs_names]
-
-		# Adding missing obs:
-		for o in [o for o in self.observables if o.name in toadd]:
-			assert o.hidden is False
-
-			# create the QStandardItem objects
-			name, alpha, delta, observability, obsprogram, moondist, sundist, airmass, wind, clouds = self.get_standard_items(
-				o)
-
-			obs_model.appendRow(
-				[name, alpha, delta, observability, obsprogram, sundist, moondist, airmass, wind, clouds])
-			if SETTINGS["misc"]["singletargetlogs"] == "True":
-				logging.debug("Added %s to the model" % o.name)
-
-		# Removing superfluous obs:
-		for o in [o for o in self.observables if o.name in toremove]:
-			assert o.hidden is True
-
-			# todo: stupid loop, optimize that
-			currentnames = [obs_model.item(i).data(0) for i in range(obs_model.rowCount())]
-			toremoveindex = currentnames.index(o.name)
-			obs_model.removeRow(toremoveindex)
-			if SETTINGS["misc"]["singletargetlogs"] == "True":
-				logging.debug("Removed %s from the model" % o.name)
-
-		# refresh the display
-		self.listObs.setModel(obs_model)
+		# the model keeps the check states of the observables it already displays
+		self.listObs.model().set_observables([o for o in self.observables if o.hidden == False])
 
 		msg = "Model refreshed"
 		logging.info(msg)
@@ -810,43 +785,26 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		if firstload:
 			self.init_display_model()
 
-		# compute observability for the new obs and create/add them to the self observables
+		# create/add the new obs to the self observables
 		if firstload:
-			for o in new_observables:
-				if SETTINGS["misc"]["singletargetlogs"] == "True":
-					logging.debug("Computing observability of {}".format(o.name))
-				o.compute_observability(self.currentmeteo, cloudscheck=self.cloudscheck, verbose=False, cwvalidity=float(SETTINGS['validity']['cloudwindanalysis']))
-			self.observables = new_observables
-
-
-		else:
-			# add the observable only if not already in the model, otherwise keep the original one and make it visible if it was hidden
-			current_obs_names = [o.name for o in self.observables]
-			unhide_names = []
-			for o in new_observables:
-				# handle duplicates by keeping the old ones
-				if o.name in current_obs_names:
-					unhide_names.append(o.name)
-
-				else:
-					if SETTINGS["misc"]["singletargetlogs"] == "True":
-						logging.debug("Computing observability of {}".format(o.name))
-					o.compute_observability(self.currentmeteo, cloudscheck=self.cloudscheck, verbose=False, cwvalidity=float(SETTINGS['validity']['cloudwindanalysis']))
-					self.observables.append(o)
-
-
+			self.observables = []
+			self.observables_index = {}
+
+		# add the observable only if not already loaded, otherwise keep the original one and make it visible if it was hidden
+		unhide_names = []
+		for o in new_observables:
+			if o.name in self.observables_index:
+				self.observables_index[o.name].hidden = False
+				unhide_names.append(o.name)
+			else:
+				self.observables.append(o)
+				self.observables_index[o.name] = o
+		if unhide_names:
 			logging.debug("Duplicate targets that are not loaded: {}".format(unhide_names))
-			# unhide duplicates that are reloaded.
-			for o in self.observables:
-				if o.name in unhide_names:
-					o.hidden = False
-
-
-
 
 		# update the display model first
 		self.update_and_display_model()
-		# refresh the observability
+		# refresh the observability, the new obs are computed with the others in the background
 		self.update_obs()
 
 
@@ -918,12 +876,17 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			delta = self.newTargetDialog.deltaValue.text()
 			obsprogram = self.newTargetDialog.obsprogramValue.currentText()
 
-			# create the observable, compute its observability with respect to the current meteo
-			myobs = obs.Observable(name=name, obsprogram=obsprogram, alpha=alpha, delta=delta)
-			myobs.compute_observability(self.currentmeteo, cloudscheck=self.cloudscheck, verbose=False, cwvalidity=float(SETTINGS['validity']['cloudwindanalysis']))
+			# a target already loaded is kept, and made visible if it was hidden
+			if name in self.observables_index:
+				logging.warning("{} is already loaded, I don't add it again".format(name))
+				self.observables_index[name].hidden = False
+			else:
+				# create the observable, its observability is computed with the others by update_obs
+				myobs = obs.Observable(name=name, obsprogram=obsprogram, alpha=alpha, delta=delta)
 
-			# add it to the pool of existing targets
-			self.observables.append(myobs)
+				# add it to the pool of existing targets
+				self.observables.append(myobs)
+				self.observables_index[name] = myobs
 			# update the display model first
 			self.update_and_display_model()
 			# refresh the observability
@@ -934,69 +897,174 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		"""
 		Update the observability of the observables, and update the display model
 
+		The weather report and the all sky are downloaded in their own thread (see :meth:`meteo_refresh`), the observability being computed again once they arrive. Meanwhile, the observability is computed in the background with the current weather, see :meth:`refresh_observability`.
+
 		.. note:: Works only on the non hidden observables
 
 		.. note:: Assumes all the hidden=False observables are in the model - no more, no less - but this should ALWAYS be the case.
 		"""
-
 		logging.debug("Updating observability...")
-		# refresh the observables observability flags that have hidden == False
-		run.refresh_status(self.currentmeteo, self.observables)
-		for o in self.observables:
-			if o.hidden is False:
-				if SETTINGS["misc"]["singletargetlogs"] == "True":
-					logging.debug("Computing observability of {}".format(o.name))
-				o.compute_observability(self.currentmeteo, cloudscheck=self.cloudscheck, verbose=False)
+		self.scheduler.request("weather", *(["allsky"] if self.cloudscheck else []))
+		self.run_scheduler()
+		self.refresh_observability()
 
-		# load the display model and the current header
-		obs_model = self.listObs.model()
-		headers, i, go_on = [], 0, True
-		while go_on:
-			h = obs_model.horizontalHeaderItem(i)  # will return None if there's no header...
-			if not h:
-				go_on = False
-			else:
-				headers.append(h.data(0))
-				i += 1
+	def get_observability_inputs(self):
+		"""
+		:return: what the observability depends on: the obs_time, the weather, the all sky image, the clouds analysis mode and the displayed observables
+		"""
+		meteo = self.currentmeteo
+		model = self.listObs.model()
+		return (meteo.name, meteo.time.jd, str(meteo.lastest_weatherupdate_time), str(meteo.get_wind()), str(meteo.get_gust()), str(getattr(meteo.allsky, "last_im_refresh", None)), self.cloudscheck, id(model), getattr(model, "generation", None))
 
-		observability_index = headers.index("Obs")
-		moondist_index = headers.index("M")
-		sundist_index = headers.index("S")
-		airmass_index = headers.index("A")
-		wind_index = headers.index("W")
-		clouds_index = headers.index("C")
+	def schedule_observability(self):
+		"""
+		Starts computing the observability in the background (see :meth:`refresh_observability`), unless its inputs did not change since it was last computed.
+		"""
+		if self.scheduler.update_inputs("observability", self.get_observability_inputs()):
+			self.refresh_observability()
+		else:
+			logging.debug("The observability is up to date")
 
-		# we use the obs name as a reference to update the model
-		model_names = [obs_model.item(i).data(0) for i in range(obs_model.rowCount())]
+	def refresh_observability(self, site=False, visibility=False, chunksize=2000):
+		"""
+		Starts computing the observability of the non hidden observables in the background (see :class:`ComputeService`), against a snapshot of the current meteo at the obs_time. The results are displayed by :meth:`on_computeResult`.
 
-		# compute observability and refresh the model
-		for o in self.observables:
-			if o.hidden is False:
-
-				name, alpha, delta, observability, obsprogram, moondist, sundist, airmass, wind, clouds = self.get_standard_items(o)
-
-				# make sur we update the correct observable in the model...
-				obs_index = model_names.index(o.name)
-				obs_model.setItem(obs_index, observability_index, QtGui.QStandardItem(str(o.observability)))
-				obs_model.setItem(obs_index, moondist_index, moondist)
-				obs_model.setItem(obs_index, sundist_index, sundist)
-				obs_model.setItem(obs_index, airmass_index, airmass)
-				obs_model.setItem(obs_index, wind_index, wind)
-				obs_model.setItem(obs_index, clouds_index, clouds)
-				if SETTINGS["misc"]["singletargetlogs"] == "True":
-					logging.debug("observable %s updated" % o.name)
-			else:
-				if SETTINGS["misc"]["singletargetlogs"] == "True":
-					logging.debug("observable %s hidden, status not updated" % o.name)
+		A request supersedes the one still running, if any: the site information and the visibility it was computing are computed by the new request instead.
 
-		# refresh the display
-		self.listObs.setModel(obs_model)
+		:param site: boolean, whether to also compute the site information, see :meth:`site_display`
+		:param visibility: boolean, whether to also compute the visibility grid, see :meth:`visibilitytool_draw`
+		:param chunksize: number of observables computed between two progress reports
+		"""
+		if self.compute_pending is not None:
+			site = site or self.compute_pending["site"]
+			visibility = visibility or self.compute_pending["visibility"]
+		self.compute_pending = {"site": site, "visibility": visibility}
+		self.scheduler.update_inputs("observability", self.get_observability_inputs(), count=False)
 
-		msg = "Observability refreshed"
-		logging.info(msg)
-		self.print_status(msg, color=SETTINGS['color']['success'])
+		# the time only moves the Sun and the Moon, which is fast. The downloads are left to meteo_refresh
+		snapshot = self.currentmeteo.update(obs_time=self.currentmeteo.time, minimal=True)
+
+		obssets = self.get_obssets(chunksize)
+		visibility = self.get_visibility_params(snapshot) if visibility else None
+
+		self.compute.submit(functools.partial(self.compute_refresh, snapshot=snapshot, obssets=obssets, site=site, visibility=visibility, cloudscheck=self.cloudscheck))
+
+	def get_obssets(self, chunksize=2000):
+		"""
+		Splits the non hidden observables in :class:`~obs.ObservableSet` of chunksize observables. The sets are kept as long as the displayed observables do not change, so that each refresh only recomputes what its new inputs affect (e.g. only the wind flags after a new weather report).
+
+		:param chunksize: number of observables per set
+		:return: copies of the sets, to be computed in the background. The computed copies replace the sets in :meth:`on_computeResult`.
+		"""
+		model = self.listObs.model()
+		key = (id(model), getattr(model, "generation", None), chunksize)
+		if key != self.obssets_key:
+			observables = [o for o in self.observables if o.hidden == False]
+			self.obssets = [obs.ObservableSet(observables[ii:ii + chunksize]) for ii in range(0, len(observables), chunksize)]
+			self.obssets_key = key
+		return [obsset.copy() for obsset in self.obssets]
+
+	def compute_refresh(self, report, snapshot, obssets, site=False, visibility=None, cloudscheck=True):
+		"""
+		The job of :meth:`refresh_observability`, running in the :class:`ComputeService`. Does not touch the widgets nor the observables.
+
+		:param report: function reporting the progress, see :meth:`ComputeService.report`
+		:param snapshot: a :class:`~meteo.MeteoSnapshot`
+		:param obssets: list of :class:`~obs.ObservableSet` to compute
+		:param site: boolean, whether to compute the site information
+		:param visibility: the parameters of the visibility grid to compute (see :meth:`get_visibility_params`), or None
+		:param cloudscheck: boolean, whether to consider the clouds in the observability
+
+		:return: dictionary of the results: the snapshot, the computed obssets and, if asked for, the site information and the visibility parameters
+		"""
+		results = {"snapshot": snapshot, "obssets": obssets}
+		total = len(obssets) + int(site) + int(visibility is not None)
+		done = 0
+
+		if site:
+			results["site"] = self.compute_site(snapshot)
+			done += 1
+			report(done, total)
+
+		if visibility is not None:
+			# the grid is cached by the visibility tool, drawing it afterwards is fast
+			self.visibilitytool.compute_visibility(snapshot, **visibility)
+			results["visibility"] = visibility
+			done += 1
+			report(done, total)
+
+		for obsset in obssets:
+			obsset.compute_observability(snapshot, cloudscheck=cloudscheck, cwvalidity=float(SETTINGS['validity']['cloudwindanalysis']))
+			done += 1
+			report(done, total)
+
+		return results
+
+	@QtCore.pyqtSlot(int, int, int)
+	def on_computeProgress(self, request, done, total):
+		"""
+		Displays the progress of the background computations
+		"""
+		if request != self.compute.request:
+			return
+		self.print_status("Updating observability... {}/{}".format(done, total), SETTINGS['color']['warn'])
+
+	@QtCore.pyqtSlot(int, object)
+	def on_computeResult(self, request, results):
+		"""
+		When the background computations of :meth:`refresh_observability` are done, this method is being called. It displays the results straight from the arrays of the computed sets, the observables themselves are only updated when they are read, see :meth:`writeback_observables`.
+		"""
+		if request != self.compute.request:
+			logging.debug("Results of the superseded compute request {} ignored".format(request))
+			return
+		self.compute_pending = None
+
+		obssets = results["obssets"]
+		self.unwritten = obssets
+		# refresh the display model straight from the arrays of the sets
+		self.listObs.model().update_values(obssets)
+
+		# the computed copies of the current sets replace them, with the inputs they were computed from
+		if len(obssets) == len(self.obssets) and all(computed.observables is obsset.observables for computed, obsset in zip(obssets, self.obssets)):
+			self.obssets = obssets
 
+		if "site" in results:
+			self.site_display(results["site"])
 
+		if "visibility" in results:
+			# draws the cached grid and the selected targets
+			self.visibilitytool_draw()
+
+		logging.info("Observability refreshed")
+		self.print_status("Observability update done.", SETTINGS["color"]["success"])
+
+	def writeback_observables(self):
+		"""
+		Writes the results of the last observability refresh back to the observables (see :meth:`~obs.ObservableSet.writeback`), before something reads them: the display model when it is reset, or the hiding criteria.
+		"""
+		for obsset in self.unwritten:
+			obsset.writeback()
+		self.unwritten = []
+
+	@QtCore.pyqtSlot(int, str)
+	def on_computeFailed(self, request, msg):
+		"""
+		When the background computations of :meth:`refresh_observability` failed, this method is being called.
+		"""
+		if request != self.compute.request:
+			return
+		self.compute_pending = None
+		logging.error("Observability update failed: {}".format(msg))
+		self.print_status("Observability update failed\n{}".format(msg[:50]), SETTINGS['color']['limit'])
+
+	def closeEvent(self, event):
+		"""
+		Stops the refreshes and the background computations when the window is closed
+		"""
+		self.timer.stop()
+		self.threadMeteoRefresh.cancel()
+		self.compute.shutdown()
+		super(POUET, self).closeEvent(event)
 
 	def check_obs_status(self, obs_model):
 		"""
@@ -1004,15 +1072,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		:param obs_model: observables model
 		:return: states of model observables
 		"""
-		#0 is not checked, 1 is partially checked, 2 is checked --> 0 or 2 for us
-		#obs_model = self.listObs.model()
-
-		states = [obs_model.item(i, 0).checkState() for i in range(obs_model.rowCount())]
-		names = [obs_model.item(i, 0).data(0) for i in range(obs_model.rowCount())]
-
-		states = [0 if s == 0 else 1 for s in states]
-
-		return states, names
+		return obs_model.get_check_states()
 
 	def save_obs(self):
 		"""
@@ -1053,6 +1113,11 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		"""
 		logging.debug("Checking criterias to hide observables...")
 
+		# the running computation is for the observables displayed so far, it is started again once they are hidden
+		computing = self.compute_pending is not None
+		if computing:
+			self.compute.cancel()
+
 		checked = self.toggleCheckedObs.isChecked()
 		unchecked = self.toggleUncheckedObs.isChecked()
 		matchname = self.toggleNameObs.isChecked()
@@ -1079,13 +1144,13 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			for i, s in enumerate(states):
 				if not s:
 					# hide from self
-					self.observables[[o.name for o in self.observables].index(names[i])].hidden = True
+					self.observables_index[names[i]].hidden = True
 
 		if unchecked:
 			for i, s in enumerate(states):
 				if s:
 					# hide from self
-					self.observables[[o.name for o in self.observables].index(names[i])].hidden = True
+					self.observables_index[names[i]].hidden = True
 
 		# other criterias
 		criteria = []
@@ -1170,11 +1235,15 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 				self.toggleDeltaMaxObs.setChecked(False)
 				logging.warning("Delta max field not valid - I discard it...")
 
+		self.writeback_observables()
 		run.hide_observables(self.observables, criteria)
 
 		# ALWAYS update the display after changing the hidden flag
 		self.update_and_display_model()
 
+		if computing:
+			self.refresh_observability()
+
 	def unhide_observables(self):
 		"""
 		Set the hidden flag of all the observables to False
@@ -1198,8 +1267,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		else:
 			out_state = 0
 
-		for ii in range(obs_model.rowCount()):
-			obs_model.item(ii, 0).setCheckState(out_state)
+		obs_model.set_check_states(out_state == 2)
 
 		self.listObs_check_state = out_state
 
@@ -1219,7 +1287,7 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			return
 
 		status, names = self.check_obs_status(self.listObs.model())
-		d = [names[i] for i, s in enumerate(status) if s == 1]
+		d = set(names[i] for i, s in enumerate(status) if s == 1)
 
 		alphas = []
 		deltas = []
@@ -1235,14 +1303,14 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 			ord_names.append(target.name)
 
-			az, elev = self.currentmeteo.get_AzAlt(target.alpha, target.delta, self.currentmeteo.time)
-			as_x, as_y = self.currentmeteo.allsky.station.get_image_coordinates(az.radian, elev.radian)
-
 			alphas.append(target.alpha.value)
 			deltas.append(target.delta.value)
-			as_xs.append(as_x)
-			as_ys.append(as_y)
-			are_obs.append(target.observability)
+			are_obs.append(getattr(target, "observability", None))
+
+		# all the selected targets at once
+		if len(ord_names) > 0:
+			az, elev = self.currentmeteo.get_AzAlt(np.deg2rad(np.array(alphas) * 15.), np.deg2rad(deltas), self.currentmeteo.time)
+			as_xs, as_ys = self.currentmeteo.allsky.station.get_image_coordinates(az, elev)
 
 		#-------- Plots on visibility layer
 
@@ -1267,18 +1335,24 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			self.allskylayerTargets.show_targets(as_xs, as_ys, ord_names)
 			logging.info("Plotted {} targets in All Sky".format(len(d)))
 
-	def weather_display(self):
+	def weather_refresh(self):
 		"""
-		Prompts a weather report update and displays the results in the `station` tab.
+		Prompts a weather report update, in a thread (see :meth:`meteo_refresh`), unless the last report is too recent.
 		"""
-		logging.debug("Starting weather update...")
 		if not self.currentmeteo.lastest_weatherupdate_time is None and (Time.now() - self.currentmeteo.lastest_weatherupdate_time).to(u.s).value < float(SETTINGS['validity']['weatherreportfrequency']):
 			logging.info("Last weather report was downloaded more recently than {} seconds ago, I don't download it again".format(SETTINGS['validity']['weatherreportfrequency']))
-			draw_wind = False
+			self.weather_display()
 		else:
-			self.currentmeteo.updateweather()
-			draw_wind = True
+			self.scheduler.request("weather")
+			self.run_scheduler()
+
+	def weather_display(self, draw_wind=False):
+		"""
+		Displays the current weather report in the `station` tab.
 
+		:param draw_wind: boolean, whether to redraw the all sky with the new wind
+		"""
+		logging.debug("Displaying the weather...")
 		self.weather_reached_limit = False
 		self.weather_reached_warn = False
 
@@ -1313,65 +1387,49 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 		self.does_warn_station()
 
-	def site_display(self):
+	def compute_site(self, meteo):
 		"""
-		Computes and displays information about the site and the position of the bright objects in the `station` tab.
+		Computes the information about the site and the position of the bright objects displayed by :meth:`site_display`. Does not touch the widgets, so that it can run in the :class:`ComputeService`.
+
+		:param meteo: a :class:`~meteo.MeteoSnapshot`, at the obs_time
+		:return: dictionary of the texts to display, plus the altitude of the sun (in degree)
 		"""
-		logging.debug("Starting Site update...")
-		self.siteLocationValue.setText(str('Lat={:s}\tLon={:s}\tElev={:s} m'.format(self.currentmeteo.location.get("location", "longitude"), self.currentmeteo.location.get("location", "latitude"), self.currentmeteo.location.get("location", "elevation"))))
+		site = {"location": str('Lat={:s}\tLon={:s}\tElev={:s} m'.format(meteo.location.get("location", "longitude"), meteo.location.get("location", "latitude"), meteo.location.get("location", "elevation")))}
+
+		obs_time = meteo.time
 
-		obs_time = self.currentmeteo.time
+		# Bright objects now, from the ephemeris table of the night
+		ephemeris = meteo.get_ephemeris(obs_time)
 
-		# Bright objects now
-		sunAz, sunAlt = self.currentmeteo.get_sun(obs_time)
+		sunAz, sunAlt = meteo.get_sun(obs_time)
 		sunAlt = sunAlt.to(u.degree).value
 		sunAz = sunAz.to(u.degree).value
 
-		_, sunAltp1 = self.currentmeteo.get_sun(obs_time + TimeDelta(10.0*60., format='sec'))
-		sunAltp1 = sunAltp1.to(u.degree).value
-		sundAlt = sunAltp1 - sunAlt
-
-		if sundAlt > 0:
+		if ephemeris.get_trend("sun", obs_time) > 0:
 			sunState = "rising"
 		else:
 			sunState = "declining"
 
-		self.sunCoordinatesValues.setText(str('RA={:s}  DEC={:s}'.format(self.currentmeteo.sun.ra.__str__(), self.currentmeteo.sun.dec.__str__())))
-		self.sunAltazValue.setText(str('{:2.1f}° ({:s})\t{:2.1f}°'.format(sunAlt, sunState, sunAz)))
+		sunRa, sunDec = ephemeris.get_radec("sun", obs_time)
+		site["sunCoordinates"] = str('RA={:s}  DEC={:s}'.format(angles.Angle(sunRa, unit="radian").to_string(unit=u.hour, sep=':', precision=2), angles.Angle(sunDec, unit="radian").to_string(unit=u.degree, sep=':', precision=1)))
+		site["sunAltaz"] = str('{:2.1f}° ({:s})\t{:2.1f}°'.format(sunAlt, sunState, sunAz))
+		site["sunAlt"] = sunAlt
 
-		self.station_reached_limit = False
-		self.station_reached_warn = False
-
-		if sunAlt > -6:
-			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['limit']))
-			self.station_reached_limit = True
-		elif sunAlt > -12:
-			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['warn']))
-			self.station_reached_warn = True
-		else:
-			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['nominal']))
-
-		moonAz, moonAlt = self.currentmeteo.get_moon(obs_time)
+		moonAz, moonAlt = meteo.get_moon(obs_time)
 		moonAlt = moonAlt.to(u.degree).value
 		moonAz = moonAz.to(u.degree).value
 
-		_, moonAltp1 = self.currentmeteo.get_moon(obs_time + TimeDelta(10.0*60., format='sec'))
-		moonAltp1 = moonAltp1.to(u.degree).value
-		moondAlt = moonAltp1 - moonAlt
-
-		if moondAlt > 0:
+		if ephemeris.get_trend("moon", obs_time) > 0:
 			moonState = "rising"
 		else:
 			moonState = "declining"
 
-		self.moonCoordinatesValues.setText(str('RA={:s}  DEC={:s}'.format(self.currentmeteo.moon.ra.__str__(), self.currentmeteo.moon.dec.__str__())))
-		self.moonAltazValue.setText(str('{:2.1f}° ({:s})\t{:2.1f}°'.format(moonAlt, moonState, moonAz)))
-
-		self.brightLastUpdateValue.setText("computed for {}".format(str(obs_time).split('.')[0]))
+		moonRa, moonDec = ephemeris.get_radec("moon", obs_time)
+		site["moonCoordinates"] = str('RA={:s}  DEC={:s}'.format(angles.Angle(moonRa, unit="radian").to_string(unit=u.hour, sep=':', precision=2), angles.Angle(moonDec, unit="radian").to_string(unit=u.degree, sep=':', precision=1)))
+		site["moonAltaz"] = str('{:2.1f}° ({:s})\t{:2.1f}°'.format(moonAlt, moonState, moonAz))
 
-		self.does_warn_station()
+		site["brightLastUpdate"] = "computed for {}".format(str(obs_time).split('.')[0])
 
-		logging.debug("Bright objects update done")
 		# Night here only (we change the obs_time so this must the last things to run!)
 
 		cobs_time = copy.copy(obs_time)
@@ -1392,19 +1450,60 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			night_date = cobs_time - TimeDelta(1, format="jd")
 			day_before = cobs_time - TimeDelta(1, format="jd")
 
-		sunrise, sunset = self.currentmeteo.get_twilights(night_date, twilight='civil')
-		self.nightStartCivilValue.setText(str('{:s}'.format(str(sunset))))
-		self.nightEndCivilValue.setText(str('{:s}'.format(str(sunrise))))
+		for twilight in ["civil", "nautical", "astronomical"]:
+			sunrise, sunset = meteo.get_twilights(night_date, twilight=twilight)
+			site[twilight] = (str('{:s}'.format(str(sunset))), str('{:s}'.format(str(sunrise))))
+
+		site["nightLastUpdate"] = "for night {} to {}".format(str(day_before).split('.')[0], str(day_after).split('.')[0])
+
+		return site
+
+	def site_display(self, site=None):
+		"""
+		Displays information about the site and the position of the bright objects in the `station` tab.
+
+		:param site: the information computed by :meth:`compute_site`. If None, it is computed for the current meteo.
+		"""
+		logging.debug("Starting Site update...")
+		if site is None:
+			site = self.compute_site(self.currentmeteo.snapshot())
+
+		self.siteLocationValue.setText(site["location"])
+
+		self.sunCoordinatesValues.setText(site["sunCoordinates"])
+		self.sunAltazValue.setText(site["sunAltaz"])
+
+		self.station_reached_limit = False
+		self.station_reached_warn = False
 
-		sunrise, sunset = self.currentmeteo.get_twilights(night_date, twilight='nautical')
-		self.nightStartNauticalValue.setText(str('{:s}'.format(str(sunset))))
-		self.nightEndNauticalValue.setText(str('{:s}'.format(str(sunrise))))
+		if site["sunAlt"] > -6:
+			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['limit']))
+			self.station_reached_limit = True
+		elif site["sunAlt"] > -12:
+			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['warn']))
+			self.station_reached_warn = True
+		else:
+			self.sunAltazValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['nominal']))
+
+		self.moonCoordinatesValues.setText(site["moonCoordinates"])
+		self.moonAltazValue.setText(site["moonAltaz"])
+
+		self.brightLastUpdateValue.setText(site["brightLastUpdate"])
+
+		self.does_warn_station()
+
+		logging.debug("Bright objects update done")
 
-		sunrise, sunset = self.currentmeteo.get_twilights(night_date, twilight='astronomical')
-		self.nightStartAstroValue.setText(str('{:s}'.format(str(sunset))))
-		self.nightEndAstroValue.setText(str('{:s}'.format(str(sunrise))))
+		self.nightStartCivilValue.setText(site["civil"][0])
+		self.nightEndCivilValue.setText(site["civil"][1])
 
-		self.nightLastUpdateValue.setText("for night {} to {}".format(str(day_before).split('.')[0], str(day_after).split('.')[0]))
+		self.nightStartNauticalValue.setText(site["nautical"][0])
+		self.nightEndNauticalValue.setText(site["nautical"][1])
+
+		self.nightStartAstroValue.setText(site["astronomical"][0])
+		self.nightEndAstroValue.setText(site["astronomical"][1])
+
+		self.nightLastUpdateValue.setText(site["nightLastUpdate"])
 		logging.debug("Night update done")
 
 	def allsky_refresh(self):
@@ -1412,10 +1511,8 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 		Starts a refresh of the all sky by erasing the image and starting a new thread to get the new image and analyse it.
 		"""
 		logging.debug("Refreshing the all sky...")
-		self.print_status("Refreshing All Sky...", SETTINGS['color']['warn'])
-		self.allskylayer.erase()
-		self.threadAllskyUpdate.start()
-		logging.info("All sky refresh done")
+		self.scheduler.request("allsky")
+		self.run_scheduler()
 
 	def allsky_redisplay(self):
 		"""
@@ -1441,18 +1538,29 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 		.. note:: if there is a too large delta time between weather report and obs_time, does not display weather info (threshold defined in global settings, `validity`/`weatherreport`)
 		"""
+		meteo = self.currentmeteo.snapshot()
+		params = self.get_visibility_params(meteo)
+		self.visibilitytool.visbility_draw(meteo=meteo, **params)
+
+		logging.info("Drawn visibility with airmass={:1.1f}, anglemoon={:d}d".format(params["airmass"], int(params["anglemoon"])))
+
+	def get_visibility_params(self, meteo):
+		"""
+		Reads the parameters of the visibility in the widgets.
+
+		:param meteo: to compare the obs_time and the time of the weather report
+		:return: dictionary of the airmass, anglemoon and check_wind parameters of :meth:`VisibilityView.compute_visibility`
+		"""
 		airmass = self.visibilityAirmassValue.value()
 		anglemoon = self.visibilityMoonAngleValue.value()
 
-		if self.currentmeteo.lastest_weatherupdate_time is None or np.abs((self.currentmeteo.time - self.currentmeteo.lastest_weatherupdate_time).to(u.s).value / 60.) > float(SETTINGS['validity']['weatherreport']):
+		if meteo.lastest_weatherupdate_time is None or np.abs((meteo.time - meteo.lastest_weatherupdate_time).to(u.s).value / 60.) > float(SETTINGS['validity']['weatherreport']):
 			check_wind = False
 			logging.info("Visibility is not considering the wind, too much difference between date weather report and obs time")
 		else:
 			check_wind = True
 
-		self.visibilitytool.visbility_draw(meteo=self.currentmeteo, airmass=airmass, anglemoon=float(anglemoon), check_wind=check_wind)
-
-		logging.info("Drawn visibility with airmass={:1.1f}, anglemoon={:d}d".format(airmass, anglemoon))
+		return {"airmass": airmass, "anglemoon": float(anglemoon), "check_wind": check_wind}
 
 	def visibilitytool_draw(self):
 		"""
@@ -1464,19 +1572,14 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 
 	def auto_refresh(self):
 		"""
-		Auto-refresh of the weather report and the all sky.
+		Auto-refresh of the weather report and the all sky, called at each tick of the timer. Only the sources that are due are refreshed, see :class:`~scheduler.RefreshScheduler`.
 
 		.. note:: the user can choose in the config tab the frequency of the update and if to update the all sky and the weather report
 		"""
-		logging.debug("Auto-refresh started...")
-		self.print_status("Auto-refresh started...", SETTINGS['color']['warn'])
-
-		if self.configCloudsAutoRefreshValue.checkState() == 2:
-			self.allsky_refresh()
-		if self.configWindAutoRefreshValue.checkState() == 2:
-			self.weather_display()
-		if self.configWindAutoRefreshValue.checkState() == 2 and self.configCloudsAutoRefreshValue.checkState() == 0:
-			self.allsky_redisplay()
+		self.scheduler.enable("weather", self.configWindAutoRefreshValue.checkState() == 2)
+		self.scheduler.enable("allsky", self.configCloudsAutoRefreshValue.checkState() == 2 and self.cloudscheck)
+		self.run_scheduler()
+		logging.debug(str(self.scheduler))
 
 		if self.currentmeteo.lastest_weatherupdate_time is None or (Time.now() - self.currentmeteo.lastest_weatherupdate_time).to(u.s).value / 60. > float(SETTINGS['validity']['weatherreport']):
 			self.allSkyUpdateWindValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['warn']))
@@ -1489,8 +1592,6 @@ class POUET(QtWidgets.QMainWindow, design.Ui_POUET):
 			self.allSkyUpdateValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['warn']))
 		else:
 			self.allSkyUpdateValue.setStyleSheet("QLabel { color : %s; }" % format(SETTINGS['color']['nominal']))
-		logging.info("Auto-refresh done.")
-		self.print_status("Auto-refresh done.", SETTINGS['color']['success'])
 
 
 class MyLogger(logging.Handler):
@@ -1743,17 +1844,17 @@ class AllSkyView(FigureCanvas):
 
 		wpl = float(meteo.location.get("weather", "windWarnLevel"))
 		wsl = float(meteo.location.get("weather", "windLimitLevel"))
-		WD = meteo.winddirection
-		WS = meteo.windspeed
+		WD, WS = meteo.get_wind()
+		gust = meteo.get_gust()
 		WDd = WD
 		WD = np.deg2rad(WD)
 
-		if WS is not None and WS > wpl:
+		if WS is not None and (WS > wpl or gust > wsl):
 			wdcoordinatesx = np.cos(north - WD) * r0 + cx
 			wdcoordinatesy = np.sin(north - WD) * r0 + cy
 			Nd = np.rad2deg(north)  # + 90.
 
-			if WS > wsl:
+			if gust > wsl:
 				cw = SETTINGS['color']['limit']
 				self.axis.add_patch(Wedge([cx, cy], r0, Nd - WDd, Nd - WDd + 360, fill=False, hatch='//', edgecolor=cw))
 				self.axis.annotate('WIND LIMIT\nREACHED', xy=(cx, cy), rotation=0,
@@ -1977,6 +2078,10 @@ class VisibilityView(FigureCanvas):
 
 		self.setParent(parent)
 
+		# visibility grids, see compute_visibility. They can be computed in the ComputeService
+		self.cache = {}
+		self.cachelock = threading.Lock()
+
 		self.axis.patch.set_facecolor("None")
 
 		FigureCanvas.setStyleSheet(self, "background-color:transparent;")
@@ -2003,77 +2108,100 @@ class VisibilityView(FigureCanvas):
 			self.axis.annotate('{}'.format(name), xy=(x-0.2, y), color='k',horizontalalignment='left', verticalalignment='center', size=7)
 		self.draw()
 
-	def visbility_draw(self, meteo, airmass, anglemoon, check_wind=True):
+	def compute_visibility(self, meteo, airmass, anglemoon, check_wind=True):
 		"""
-		Draws the visibility plot
+		Evaluates the visibility criteria on the whole right ascension / declination grid at once.
+
+		The results are cached on the site, the time (by bins of one minute), the airmass and moon angle limits and the wind state, so re-drawing the plot (i.e. when showing targets or toggling an option) does not recompute them.
 
 		:param meteo: to get the obs_time and the station params
 		:param airmass: airmass max criterion
 		:param anglemoon: min moon angle allowed
 		:param check_wind: checks in meteo the current wind and compare this to the value in the station setting?
 
-		.. note:: if above wind warning: displays the region 90deg away from the wind in orange. If above limit whole plot in red
+		:return: dictionary of 2D arrays (declination x right ascension): ra, dec (radians), vis (1 or NaN), sep (moon separation in degrees or NaN) and wind (1 or NaN), plus do_plot_contour and cw (color of the wind area or None)
 		"""
-		logging.debug("Displaying targets in the visibility plot...")
-		self.axis.clear()
-		self.cax.clear()
+		wpl = float(meteo.location.get("weather", "windWarnLevel"))
+		wsl = float(meteo.location.get("weather", "windLimitLevel"))
+		WD, WS = meteo.get_wind()
+
+		if check_wind and meteo.get_gust() >= wsl:
+			windstate = "limit"
+		elif check_wind and WS >= wpl:
+			windstate = ("warn", WD)
+		else:
+			windstate = None
+
+		key = (meteo.name, int(np.floor(meteo.time.mjd * 1440.)), airmass, anglemoon, windstate)
+		with self.cachelock:
+			if key in self.cache:
+				logging.debug("Using the cached visibility grid")
+				return self.cache[key]
 
+		logging.debug("Computing the visibility grid...")
 		ras, decs = util.grid_points()
 		ra_g, dec_g = np.meshgrid(ras, decs)
-		sep = np.zeros_like(ra_g)
-		vis = np.zeros_like(ra_g)
-		wind = np.zeros_like(ra_g) * np.nan
 
-		tel_lat, tel_lon, tel_elev = meteo.get_telescope_params()
+		az, alt = meteo.get_AzAlt(ra_g, dec_g, meteo.time)
+		vis = np.where(util.elev2airmass(el=alt, alt=meteo.elev) < airmass, 1., np.nan)
+		visible = np.isfinite(vis)
 
+		tel_lat, tel_lon, tel_elev = meteo.get_telescope_params()
 		observer = ephem.Observer()
-		obs_time = meteo.time
-		observer.date = obs_time.iso
+		observer.date = meteo.time.iso
 		observer.lat = tel_lat.to_string(unit=u.degree, decimal=True)
 		observer.lon = tel_lon.to_string(unit=u.degree, decimal=True)
-
 		observer.elevation = tel_elev
 
 		moon = ephem.Moon()
 		moon.compute(observer)
+		sep = np.rad2deg(angle_utilities.angular_separation(float(moon.ra), float(moon.dec), ra_g, dec_g))
+		# Don't forget that the angular diam of the Moon is ~0.5 deg
+		sep[np.logical_not(visible & (sep - 0.5 > anglemoon))] = np.nan
 
-		wpl = float(meteo.location.get("weather", "windWarnLevel"))
-		wsl = float(meteo.location.get("weather", "windLimitLevel"))
-		WD = meteo.winddirection
-		WS = meteo.windspeed
+		wind = np.zeros_like(ra_g) * np.nan
+		cw = None
+		if windstate == "limit":
+			wind[visible] = 1.
+			cw = SETTINGS['color']['limit']
+		elif windstate is not None:
+			ws = angle_utilities.angular_separation(np.deg2rad(WD), 0., az, 0.)
+			wind[visible & (ws < np.pi / 2.)] = 1.
+			cw = SETTINGS['color']['warn']
 
-		do_plot_contour = False
-		for i, ra in enumerate(ras):
-			for j, dec in enumerate(decs):
-				star = ephem.FixedBody()
-				star._ra = ra
-				star._dec = dec
-				star.compute(observer)
+		result = {"ra": ra_g, "dec": dec_g, "vis": vis, "sep": sep, "wind": wind, "do_plot_contour": np.isfinite(sep).any(), "cw": cw}
 
-				if util.elev2airmass(el=star.alt + 0, alt=observer.elevation) < airmass:
-					vis[j, i] = 1
-					s = ephem.separation((moon.ra, moon.dec), (ra, dec)) + 0.
+		# only the most recent grids are kept
+		with self.cachelock:
+			if len(self.cache) >= 8:
+				del self.cache[next(iter(self.cache))]
+			self.cache[key] = result
 
-					if np.rad2deg(s) - 0.5 > anglemoon:  # Don't forget that the angular diam of the Moon is ~0.5 deg
-						sep[j, i] = np.rad2deg(s)
-						do_plot_contour = True
+		return result
 
-					else:
-						sep[j, i] = np.nan
-
-					if check_wind and WS >= wsl:
-						wind[j, i] = 1.
-						cw = SETTINGS['color']['limit']
-					elif check_wind and WS >= wpl:
-						cw = SETTINGS['color']['warn']
-						ws = ephem.separation((star.alt, np.deg2rad(WD)), (star.alt, star.az))
-						if ws < np.pi / 2.:
-							wind[j, i] = 1.
-				else:
-					sep[j, i] = np.nan
-					vis[j, i] = np.nan
+	def visbility_draw(self, meteo, airmass, anglemoon, check_wind=True):
+		"""
+		Draws the visibility plot
 
-			del star
+		:param meteo: to get the obs_time and the station params
+		:param airmass: airmass max criterion
+		:param anglemoon: min moon angle allowed
+		:param check_wind: checks in meteo the current wind and compare this to the value in the station setting?
+
+		.. note:: if above wind warning: displays the region 90deg away from the wind in orange. If above limit whole plot in red
+		"""
+		logging.debug("Displaying targets in the visibility plot...")
+		self.axis.clear()
+		self.cax.clear()
+
+		tel_lat, tel_lon, tel_elev = meteo.get_telescope_params()
+		obs_time = meteo.time
+
+		grid = self.compute_visibility(meteo, airmass, anglemoon, check_wind=check_wind)
+		ra_g, dec_g = grid["ra"], grid["dec"]
+		vis, sep, wind = grid["vis"], grid["sep"], grid["wind"]
+		do_plot_contour = grid["do_plot_contour"]
+		cw = grid["cw"]
 
 		#########################################################
 
@@ -2092,7 +2220,7 @@ class VisibilityView(FigureCanvas):
 			cbar = self.figure.colorbar(CS, ax=self.axis, cax=self.cax, ticks=t)
 			cbar.ax.set_yticklabels(tl, fontsize=9)
 
-		if check_wind and WS >= wpl:
+		if cw is not None:
 			cmap = LinearSegmentedColormap.from_list('mycmap', [(0., 'red'),
 																(1, cw)]
 													 )
@@ -2131,33 +2259,415 @@ class VisibilityView(FigureCanvas):
 		
 
 class ObsModel(QtCore.QAbstractTableModel):
-	#todo: Is that used somewhere? looks like not...test what happens when removing it.
-	def __init__(self, parent, *args):
+	"""
+	Table model of the observables list, backed by arrays of the observability results (one entry per displayed observable).
 
-		QtCore.QAbstractTableModel.__init__(self, parent, *args)
+	Nothing is created per cell: the texts and colors are computed in :meth:`data` when the view asks for them, i.e. only for the visible rows. A refresh of the observability (see :meth:`update_values`) emits a single `dataChanged` signal spanning the columns whose values changed.
+	"""
+	headers = ['Name', 'Alpha', 'Delta', 'Obs', 'Program', "S", "M", "A", "W", "C", "N"]
+
+	# the arrays behind the columns refreshed by update_values, and the ones used to sort the other columns
+	valuecolumns = {"Obs": "observability", "S": "sundist", "M": "moondist", "A": "airmass", "W": "winddist", "C": "cloudcover", "N": "nowcastcover"}
+	sortcolumns = {"Name": "names", "Alpha": "alpha", "Delta": "delta", "Program": "obsprograms"}
 
-	def rowCount(self, parent):
-		return len(self.mylist)
+	def __init__(self, parent=None, FLAG='---'):
+		"""
+		:param parent: the parent QObject, usually the table view
+		:param FLAG: A string representing how non-defined variables, such as wind for non-visible observables, are represented.
+		"""
+		QtCore.QAbstractTableModel.__init__(self, parent)
+		self.FLAG = FLAG
+		self.brushes = {name: QtGui.QBrush(QtGui.QColor(SETTINGS['color'][name])) for name in ['success', 'warn', 'limit', 'nodata']}
+		self.set_observables([])
+
+	def set_observables(self, observables):
+		"""
+		Displays a new list of observables. The check states of the observables that were already displayed are kept.
+
+		:param observables: list of :class:`~obs.Observable`, in the order they are displayed
+		"""
+		self.beginResetModel()
+		checked = set(name for name, state in zip(getattr(self, "names", []), getattr(self, "checked", [])) if state)
+
+		self.observables = list(observables)
+		self.rows = {o.name: ii for ii, o in enumerate(self.observables)}
+		self.order = np.arange(len(self.observables))
+		self.names = np.array([o.name for o in self.observables], dtype=object)
+		self.alpha = np.array([o.alpha.radian for o in self.observables], dtype=float)
+		self.delta = np.array([o.delta.radian for o in self.observables], dtype=float)
+		self.obsprograms = np.array([o.obsprogram for o in self.observables], dtype=object)
+		self.checked = np.array([name in checked for name in self.names], dtype=bool)
+		self.coordinates = {}
+		# tells when the displayed observables changed
+		self.generation = getattr(self, "generation", 0) + 1
+
+		self.read_values()
+		# keeps the rows sorted as they were
+		if getattr(self, "sortkey", None) is not None:
+			self.order = self.get_order(*self.sortkey)
+		self.endResetModel()
+
+	def read_values(self):
+		"""
+		Reads the observability results from the observables themselves, see :meth:`~obs.Observable.compute_observability`
+		"""
+		def angle(o, name):
+			value = getattr(o, name, None)
+			return np.nan if value is None else value.degree
+
+		def attribute(o, name, default=np.nan):
+			value = getattr(o, name, default)
+			return default if value is None else value
+
+		self.observability = np.array([attribute(o, "observability") for o in self.observables], dtype=float)
+		self.sundist = np.array([angle(o, "angletosun") for o in self.observables], dtype=float)
+		self.moondist = np.array([angle(o, "angletomoon") for o in self.observables], dtype=float)
+		self.airmass = np.array([attribute(o, "airmass") for o in self.observables], dtype=float)
+		self.winddist = np.array([angle(o, "angletowind") for o in self.observables], dtype=float)
+		self.cloudcover = np.array([attribute(o, "cloudcover") for o in self.observables], dtype=float)
+		# the predicted cloud cover, rounded like the cloud cover (see :meth:`~obs.ObservableSet.compute_observability`)
+		self.nowcastcover = 1. - np.floor(np.array([attribute(o, "predictedcloudfree") for o in self.observables], dtype=float) * 10.) / 10.
+		self.status = {flag: np.array([bool(attribute(o, "obs_{}".format(flag), False)) for o in self.observables], dtype=bool) for flag in ["moondist", "highairmass", "airmass", "wind", "wind_info", "clouds_info"]}
+
+	def update_values(self, obsset=None):
+		"""
+		Refreshes the observability results and notifies the view once for all the changed columns.
+
+		:param obsset: the :class:`~obs.ObservableSet` whose :meth:`~obs.ObservableSet.compute_observability` has just been called, or a list of them, their arrays are used directly. Their observables that are not displayed any more are ignored. If None, the results are read from the observables.
+		"""
+		before = {column: getattr(self, name) for column, name in self.valuecolumns.items()}
+		status = self.status
+
+		obssets = [obsset] if isinstance(obsset, obs.ObservableSet) else obsset
+		if obssets is None or any(obsset.observability is None for obsset in obssets):
+			self.read_values()
+		else:
+			for name in ["observability", "sundist", "moondist", "airmass", "winddist", "cloudcover", "nowcastcover"]:
+				setattr(self, name, getattr(self, name).copy())
+			self.status = {flag: values.copy() for flag, values in self.status.items()}
+
+			for obsset in obssets:
+				rows = np.array([self.rows.get(name, -1) for name in obsset.names], dtype=int)
+				displayed = rows >= 0
+				rows = rows[displayed]
+
+				self.observability[rows] = obsset.observability[displayed]
+				self.sundist[rows] = np.rad2deg(obsset.angletosun[displayed])
+				self.moondist[rows] = np.rad2deg(obsset.angletomoon[displayed])
+				self.airmass[rows] = obsset.airmass[displayed]
+				self.winddist[rows] = np.rad2deg(obsset.angletowind[displayed])
+				# as in writeback, the cloud cover is only known where the cloud map covers the target
+				known = obsset.cloudfree[displayed] <= 1.
+				self.cloudcover[rows[known]] = obsset.cloudcover[displayed][known]
+				self.nowcastcover[rows] = 1. - np.floor(obsset.predictedcloudfree[displayed] * 10.) / 10.
+				for flag in self.status:
+					self.status[flag][rows] = obsset.flags[flag][displayed]
+
+		# a column changed if its values or the flags that color it changed
+		colorflags = {"M": ["moondist"], "A": ["airmass", "highairmass"], "W": ["wind", "wind_info"], "C": ["clouds_info"]}
+		changed = []
+		for column, name in self.valuecolumns.items():
+			same = np.array_equal(before[column], getattr(self, name), equal_nan=True)
+			same &= all(np.array_equal(status[flag], self.status[flag]) for flag in colorflags.get(column, []))
+			if not same:
+				changed.append(self.headers.index(column))
+
+		if changed and len(self.observables) > 0:
+			self.dataChanged.emit(self.index(0, min(changed)), self.index(len(self.observables) - 1, max(changed)), [QtCore.Qt.DisplayRole, QtCore.Qt.BackgroundRole])
+
+	def rowCount(self, parent=QtCore.QModelIndex()):
+		if parent.isValid():
+			return 0
+		return len(self.observables)
+
+	def columnCount(self, parent=QtCore.QModelIndex()):
+		if parent.isValid():
+			return 0
+		return len(self.headers)
+
+	def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+		if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+			return self.headers[section]
+		return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+
+	def flags(self, index):
+		flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsDragEnabled
+		if index.column() == 0:
+			flags |= QtCore.Qt.ItemIsUserCheckable
+		return flags
+
+	def data(self, index, role=QtCore.Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		ii = self.order[index.row()]
+		column = self.headers[index.column()]
+
+		if role == QtCore.Qt.CheckStateRole:
+			if column == "Name":
+				return QtCore.Qt.Checked if self.checked[ii] else QtCore.Qt.Unchecked
+			return None
+		if role == QtCore.Qt.DisplayRole:
+			return self.get_text(ii, column)
+		if role == QtCore.Qt.BackgroundRole:
+			color = self.get_color(ii, column)
+			return None if color is None else self.brushes[color]
+		return None
+
+	def get_text(self, ii, column):
+		"""
+		:param ii: index of the observable
+		:param column: header of the column
+		:return: the text displayed in the cell
+		"""
+		if column == "Name":
+			return self.names[ii]
+		if column == "Program":
+			return self.obsprograms[ii]
+		if column in ["Alpha", "Delta"]:
+			# the sexagesimal strings are slow to build, they are only built once for the rows that get displayed
+			if ii not in self.coordinates:
+				o = self.observables[ii]
+				self.coordinates[ii] = (o.alpha.to_string(unit=u.hour, sep=':', pad=True), o.delta.to_string(unit=u.degree, sep=':', pad=True))
+			return self.coordinates[ii][0 if column == "Alpha" else 1]
+		if column in self.valuecolumns and not np.isfinite(getattr(self, self.valuecolumns[column])[ii]):
+			# not computed yet
+			return self.FLAG
+		if column == "Obs":
+			return "{:1.1f}".format(self.observability[ii])
+		if column == "S":
+			return "{:03.0f}".format(self.sundist[ii])
+		if column == "M":
+			return "{:03.0f}".format(self.moondist[ii])
+		if column == "A":
+			return "%.2f" % self.airmass[ii]
+		if column == "W":
+			if self.status["wind_info"][ii]:
+				return "{:03.0f}".format(self.winddist[ii])
+			return self.FLAG
+		if column == "C":
+			if self.status["clouds_info"][ii] and self.cloudcover[ii] <= 1:
+				return "{:1.1f}".format(self.cloudcover[ii])
+			return self.FLAG
+		if column == "N":
+			if self.nowcastcover[ii] <= 1:
+				return "{:1.1f}".format(self.nowcastcover[ii])
+			return self.FLAG
+
+	def get_color(self, ii, column):
+		"""
+		:param ii: index of the observable
+		:param column: header of the column
+		:return: the name of the color of the cell in the `color` section of the settings, or None
+		"""
+		if column == "M":
+			return "success" if self.status["moondist"][ii] else "limit"
+		if column == "A":
+			if self.status["airmass"][ii]:
+				return "success"
+			return "warn" if self.status["highairmass"][ii] else "limit"
+		if column == "W":
+			if not self.status["wind_info"][ii]:
+				return "nodata"
+			return "success" if self.status["wind"][ii] else "limit"
+		if column == "C":
+			if not self.status["clouds_info"][ii] or not self.cloudcover[ii] <= 1:
+				return "nodata"
+			if self.cloudcover[ii] <= 0.25:
+				return "success"
+			return "warn" if self.cloudcover[ii] <= 0.75 else "limit"
+		if column == "N":
+			if not self.nowcastcover[ii] <= 1:
+				return "nodata"
+			if self.nowcastcover[ii] <= 0.25:
+				return "success"
+			return "warn" if self.nowcastcover[ii] <= 0.75 else "limit"
+		return None
+
+	def setData(self, index, value, role=QtCore.Qt.EditRole):
+		if not index.isValid() or index.column() != 0 or role != QtCore.Qt.CheckStateRole:
+			return False
+		self.checked[self.order[index.row()]] = value == QtCore.Qt.Checked
+		self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+		return True
+
+	def sort(self, column, order=QtCore.Qt.AscendingOrder):
+		"""
+		Sorts the rows by the values of a column, the observables themselves are not reordered. The sort is kept when new observables are displayed.
+		"""
+		self.sortkey = (column, order)
+
+		self.layoutAboutToBeChanged.emit()
+		persistent = self.persistentIndexList()
+		previous = [self.order[index.row()] for index in persistent]
+
+		self.order = self.get_order(column, order)
+
+		rows = np.empty_like(self.order)
+		rows[self.order] = np.arange(len(self.order))
+		self.changePersistentIndexList(persistent, [self.index(rows[ii], index.column()) for ii, index in zip(previous, persistent)])
+		self.layoutChanged.emit()
+
+	def get_order(self, column, order=QtCore.Qt.AscendingOrder):
+		"""
+		:param column: index of the column to sort by
+		:param order: Qt sort order
+		:return: the indices of the observables in the order of the rows
+		"""
+		header = self.headers[column]
+		keys = getattr(self, self.valuecolumns.get(header) or self.sortcolumns[header])
+		if keys.dtype == object:
+			keys = keys.astype(str)
+
+		indices = np.argsort(keys, kind="stable")
+		if order == QtCore.Qt.DescendingOrder:
+			indices = indices[::-1]
+		return indices
+
+	def get_name(self, row):
+		"""
+		:param row: row in the view
+		:return: the name of the observable displayed in that row
+		"""
+		return self.names[self.order[row]]
+
+	def get_check_states(self):
+		"""
+		:return: the check states (0 or 1) and the names of the observables, in the order of the rows
+		"""
+		return [int(state) for state in self.checked[self.order]], list(self.names[self.order])
+
+	def set_check_states(self, checked):
+		"""
+		Checks or unchecks all the observables.
+
+		:param checked: boolean
+		"""
+		self.checked[:] = bool(checked)
+		if len(self.observables) > 0:
+			self.dataChanged.emit(self.index(0, 0), self.index(len(self.observables) - 1, 0), [QtCore.Qt.CheckStateRole])
 
-class ThreadAllskyUpdate(QtCore.QThread):
+class ThreadMeteoRefresh(QtCore.QThread):
 	"""
-	Class to handle the all sky update in a new thread
+	Class to download the weather report and the all sky at the same time in a new thread, see :meth:`meteo.Meteo.fetch`
 	"""
-	allskyUpdate = QtCore.pyqtSignal(list)
+	meteoUpdate = QtCore.pyqtSignal(dict)
 
 	def __init__(self, parent=None):
-		super(ThreadAllskyUpdate, self).__init__(parent)
+		super(ThreadMeteoRefresh, self).__init__(parent)
 		self.parent = parent
+		self.refresh = fetch.Refresh()
+		self.meteo = None
+		self.weather = True
+		self.allsky = True
 
 	def run(self):
 		"""
-		We should not directly update the GUI allsky, so we get it from the parent (at its current state) and returns it by emitting a signal
+		We should not directly update the GUI allsky, so we download it in a copy of the parent one (at its current state) and return it by emitting a signal
+		"""
+		logging.debug("threadMeteoRefresh firing up.")
+		self.meteo = self.parent.currentmeteo
+		allskycopy = copy.copy(self.meteo.allsky) if self.allsky and self.meteo.cloudscheck else None
+		results = self.meteo.fetch(weather=self.weather, allsky=allskycopy, refresh=self.refresh, donotdownloadtime=float(SETTINGS['validity']['allskyfrequency']))
+		self.meteoUpdate.emit(results)
+
+	def cancel(self):
+		"""
+		Cancels the downloads still running. Can be called from the GUI thread.
+		"""
+		self.refresh.cancel()
+
+class ComputeCancelled(Exception):
+	"""
+	Raised in a job of the :class:`ComputeService` when a newer request supersedes it, see :meth:`ComputeService.report`
+	"""
+
+
+class ComputeService(QtCore.QObject):
+	"""
+	Class to run the computations of the refreshes (observability, site information, visibility) in a pool of worker threads, so that the GUI stays responsive.
+
+	A job is a callable computing from a :class:`~meteo.MeteoSnapshot`, it must not touch the widgets. Its results are posted back to the GUI thread by the `resultReady` signal. Submitting a job cancels the one still running: a job calls the `report` function it is given between its steps, which raises :class:`ComputeCancelled` once the job is superseded. The results of a superseded job are never posted.
+	"""
+	progress = QtCore.pyqtSignal(int, int, int)
+	resultReady = QtCore.pyqtSignal(int, object)
+	failed = QtCore.pyqtSignal(int, str)
+
+	def __init__(self, parent=None, workers=1):
+		"""
+		:param parent: parent QObject
+		:param workers: number of worker threads
+		"""
+		super(ComputeService, self).__init__(parent)
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compute")
+		self.lock = threading.Lock()
+		self.request = 0
+		self.cancelled = threading.Event()
+		self.closed = False
+
+	def submit(self, job):
+		"""
+		Runs a job in a worker thread, cancelling the previous one if it is still running.
+
+		:param job: callable taking a `report(done, total)` function as only argument and returning the results
+		:return: the number of the request, given with the signals, or None if the service was shut down
+		"""
+		if self.closed:
+			logging.debug("The compute service is shut down, the job is not run")
+			return None
+		with self.lock:
+			self.cancelled.set()
+			self.cancelled = threading.Event()
+			self.request += 1
+			request, cancelled = self.request, self.cancelled
+		self.executor.submit(self.run, job, request, cancelled)
+		return request
+
+	def run(self, job, request, cancelled):
+		"""
+		Runs a job in the worker thread and posts its results, unless it was superseded.
+		"""
+		if cancelled.is_set():
+			logging.debug("Compute request {} superseded before it started".format(request))
+			return
+		try:
+			results = job(functools.partial(self.report, request, cancelled))
+		except ComputeCancelled:
+			logging.debug("Compute request {} superseded".format(request))
+			return
+		except Exception as e:
+			logging.exception("Compute request {} failed".format(request))
+			if not cancelled.is_set():
+				self.failed.emit(request, str(e))
+			return
+		if not cancelled.is_set():
+			self.resultReady.emit(request, results)
+
+	def report(self, request, cancelled, done, total):
+		"""
+		Called by the jobs between their steps, emits the progress of the job.
+
+		:raise: :class:`ComputeCancelled` if the job was superseded
+		"""
+		if cancelled.is_set():
+			raise ComputeCancelled()
+		self.progress.emit(request, done, total)
+
+	def cancel(self):
+		"""
+		Cancels the job still running, if any. Can be called from the GUI thread.
+		"""
+		with self.lock:
+			self.cancelled.set()
+
+	def shutdown(self, wait=False):
+		"""
+		Cancels the job still running and stops the worker threads.
+
+		:param wait: boolean, whether to wait for the job still running to stop
 		"""
-		logging.debug("threadAllsky firing up.")
-		allskycopy = copy.copy(self.parent.currentmeteo.allsky)
-		allskycopy.update(float(SETTINGS['validity']['allskyfrequency']))
-		self.allskyUpdate.emit([allskycopy])
-		logging.info("Updated All Sky")
+		self.closed = True
+		self.cancel()
+		self.executor.shutdown(wait=wait)
 
 def main():
 	app = QtWidgets.QApplication(sys.argv)  # A new instance of QApplication
@@ -10,6 +10,7 @@ Observables interact only with Meteo to get their constaints (position to the mo
 """
 
 import astropy.coordinates.angles as angles
+from astropy import units as u
 from astropy.time import Time
 from datetime import datetime, timedelta
 #todo: using requests instead of urllib, that has versioning issues ?
@@ -17,13 +18,18 @@ from datetime import datetime, timedelta
 import ephem
 import numpy as np
 import os, sys, inspect
+import asyncio, functools, copy, collections, threading
+import requests
 
 
-import util, clouds
+import util, clouds, nowcast, history, fetch, weatherseries, stationclient
 
 import logging
 logger = logging.getLogger(__name__)
 
+herepath = os.path.dirname(os.path.abspath(inspect.stack()[0][1]))
+SETTINGS = util.readconfig(os.path.join(herepath, "config/settings.cfg"))
+
 
 #todo: there are a lot of obs_time=Time.now() still in the code, it should be cleared from these!
 
@@ -71,9 +77,16 @@ class Meteo:
         
         self.cloudscheck = cloudscheck
         self.cloudmap = None
+        # Sun and Moon ephemeris of the last nights queried, the least recently used one is dropped first
+        self.ephemerides = collections.OrderedDict()
+        self.ephemerides_lock = threading.Lock()
 
 
         self.allsky = clouds.Clouds(name=name, fimage=fimage, debugmode=debugmode)
+        self.nowcast = nowcast.Nowcast()
+        self.history = None
+        self.recorded_frame = None
+        self.weatherseries = weatherseries.WeatherSeries(name, directory=None if debugmode else os.path.expanduser(SETTINGS['misc']['cachedir']), maxage=float(SETTINGS['misc']['weatherseriesdays']))
 
         self.update()
 
@@ -107,25 +120,67 @@ class Meteo:
         try:
             self.allsky.update()
             self.cloudmap = self.allsky.observability_map
+            self.record_allsky(self.allsky)
         except:
             logger.warning("Could not retrieve cloud map")
             self.cloudmap = None
 
+    def record_allsky(self, allsky):
+        """
+        Feeds a newly analysed all-sky frame to the cloud nowcast and, unless in debug mode, to the history of the night (see :class:`~history.AllSkyHistory`). Nothing is done if the frame was already recorded.
+
+        :param allsky: the :class:`~clouds.Clouds` object that analysed the frame
+        """
+        if not allsky.new_frame or allsky.observability_map is None or allsky.frame_hash == self.recorded_frame:
+            return
+        self.recorded_frame = allsky.frame_hash
+        self.nowcast.add(allsky.last_im_refresh, allsky.observability_map)
+
+        capacity = int(SETTINGS['misc']['historysize'])
+        if allsky.debugmode or capacity <= 0:
+            return
+        obs_night = self.get_obs_night(allsky.last_im_refresh)
+        try:
+            if self.history is None or self.history.obs_night != obs_night:
+                self.history = history.AllSkyHistory(os.path.expanduser(SETTINGS['misc']['historydir']), self.name, obs_night, np.shape(allsky.observability_map), capacity=capacity)
+            self.history.append(allsky.last_im_refresh, allsky.observability_map, nstars=allsky.nstars if allsky.nstars is not None else -1, frame=allsky.im_original)
+        except (IOError, OSError):
+            logger.warning("Could not record the all-sky frame in the history")
+
+    def predict_cloudmap(self, obs_time):
+        """
+        Predicts the cloud map at a given time from the motion of the clouds in the last all-sky frames, see :class:`~nowcast.Nowcast`
+
+        :param obs_time: Astropy Time object
+        :return: the predicted map (or None if no map is available) and its confidence, between 0 and 1
+        """
+        return self.nowcast.predict(obs_time)
+
     def update(self, obs_time=Time.now(), minimal=False):
         """
         Update the time-dependent parameters: Sun and moon position, wind speed and direction, cloud coverage map. Wrapper around the :meth:`~meteo.updatemoonpos`, :meth:`~meteo.updatesunpos`, :meth:`~meteo.updateweather` and :meth:`~meteo.updateclouds`
 
         :param obs_time: Astropy Time object. If None, use the current time as default.
         :param minimal: boolean. If True, update only the moon and sun position. Useful for predictions where wind and cloud coverage cannot be estimated.
+        :return: a :class:`~meteo.MeteoSnapshot` of the updated meteo
         """
         logger.debug("Starting meteo update...")
         self.time=obs_time
         self.updatemoonpos(obs_time=obs_time)
         self.updatesunpos(obs_time=obs_time)
         if not minimal:
-            self.updateweather()
-            if self.cloudscheck:
-                self.updateclouds()
+            # the weather report and the all sky are downloaded at the same time, the all sky in a copy so that the snapshots taken before are left untouched
+            self.apply_refresh(self.fetch(weather=True, allsky=copy.copy(self.allsky) if self.cloudscheck else None))
+        return self.snapshot()
+
+    def snapshot(self, obs_time=None):
+        """
+        Freezes the current state of the meteo, to compute the observability without being affected by the next updates.
+
+        :param obs_time: Astropy Time object. If None, use the meteo time. Otherwise, the Sun and Moon positions are computed at that time, the weather and clouds being the current ones.
+        :return: a :class:`~meteo.MeteoSnapshot`
+        """
+        return MeteoSnapshot(self, obs_time)
 
     def __str__(self, obs_time=Time.now()):
         # not very elegant
@@ -158,110 +213,327 @@ class Meteo:
         Updates the weather-related parameters from the site weather report.
         """
         logger.debug("Updating meteo from online weather report...")
-        self.winddirection, self.windspeed, self.temperature, self.humidity = self.weatherReport.get(debugmode=self.debugmode)
-        
+        self.set_weather(self.weatherReport.get(debugmode=self.debugmode), report_time=getattr(self.weatherReport, "report_time", None))
+
+    def set_weather(self, values, report_time=None):
         """
-        self.winddirection = WD
-        self.windspeed = WS
-        self.temperature = Temps 
-        self.humidity = RH
+        Sets the weather-related parameters
+
+        :param values: wind direction, wind speed, temperature and humidity as returned by the station weather report, -9999 if unknown
+        :param report_time: Astropy Time object, when the report was downloaded. If None, now.
         """
+        self.winddirection, self.windspeed, self.temperature, self.humidity = values
         
         checkvals = np.array([self.winddirection, self.windspeed, self.temperature, self.humidity])
         li = np.where(checkvals == -9999)[0]
         
         if not len(li) == len(checkvals):
-            self.lastest_weatherupdate_time = Time.now()
+            self.lastest_weatherupdate_time = report_time if report_time is not None else Time.now()
+            self.weatherseries.append(self.lastest_weatherupdate_time, *values)
+
+    def get_wind(self, obs_time=None):
+        """
+        Wind on which the wind warnings are decided: the average of the weather reports of the last `windsmoothing` minutes (see the settings), so that a single gust or lull does not flip the observability of the targets. If the series has no report in this window, or the wind of the last report is unknown, the last report is used as it is. The wind limit is decided on :meth:`get_gust`.
+
+        :param obs_time: Astropy Time object, end of the averaging window. If None, the time of the last weather report.
+        :return: wind direction (in degree) and wind speed (in m/s)
+        """
+        if self.winddirection == -9999 or self.windspeed == -9999 or self.lastest_weatherupdate_time is None:
+            return self.winddirection, self.windspeed
+
+        if obs_time is None:
+            obs_time = self.lastest_weatherupdate_time
+        window = float(SETTINGS['validity']['windsmoothing'])
+        winddirection = self.weatherseries.rolling('winddirection', obs_time, window=window)
+        windspeed = self.weatherseries.rolling('windspeed', obs_time, window=window)
+        return (self.winddirection if np.isnan(winddirection) else winddirection), (self.windspeed if np.isnan(windspeed) else windspeed)
+
+    def get_gust(self, obs_time=None):
+        """
+        Wind speed on which the wind limit (closing of the telescope) is decided: the maximum of the weather reports of the last `windsmoothing` minutes, and at least the last report, so that the limit is never averaged away.
+
+        :param obs_time: Astropy Time object, end of the window. If None, the time of the last weather report.
+        :return: wind speed (in m/s)
+        """
+        if self.windspeed == -9999 or self.lastest_weatherupdate_time is None:
+            return self.windspeed
+
+        if obs_time is None:
+            obs_time = self.lastest_weatherupdate_time
+        windspeed = self.weatherseries.rolling('windspeed', obs_time, window=float(SETTINGS['validity']['windsmoothing']), statistic='max')
+        return self.windspeed if np.isnan(windspeed) else max(windspeed, self.windspeed)
+
+    def get_weather(self, obs_time, maxgap=None):
+        """
+        Weather at any time covered by the weather reports received so far, interpolated between the reports.
+
+        :param obs_time: Astropy Time object, scalar or array
+        :param maxgap: time (in min) to the nearest report after which the weather is unknown (NaN). If None, the validity of the weather report (see the settings).
+        :return: dictionary of the wind direction, wind speed, temperature and humidity, with the shape of obs_time
+        """
+        if maxgap is None:
+            maxgap = float(SETTINGS['validity']['weatherreport'])
+        return {quantity: self.weatherseries.interpolate(quantity, obs_time, maxgap=maxgap) for quantity in weatherseries.QUANTITIES}
+
+    def get_refresh_jobs(self, weather=True, allsky=None):
+        """
+        :param weather: boolean, whether to download the weather report
+        :param allsky: the :class:`~clouds.Clouds` object in which to download the all-sky image, or None not to download it
+        :return: dictionary of the download jobs and of their timeouts, by source name, see :class:`~fetch.Refresh`
+        """
+        jobs, timeouts = {}, {}
+        if weather:
+            jobs['weather'] = self.fetch_weather
+            timeouts['weather'] = float(SETTINGS['validity']['weathertimeout'])
+        if allsky is not None:
+            jobs['allsky'] = functools.partial(self.fetch_allsky, allsky)
+            timeouts['allsky'] = float(SETTINGS['validity']['downloadtimeout'])
+        return jobs, timeouts
+
+    async def fetch_weather(self):
+        """
+        Downloads and reads the weather report. The download is run in a thread, going through the pooled and retrying :class:`~stationclient.StationClient`. The weather report only records the result once it is back, so that a download abandoned after its timeout changes nothing.
+
+        :return: wind direction, wind speed, temperature and humidity
+        """
+        try:
+            values = await asyncio.get_event_loop().run_in_executor(None, functools.partial(self.weatherReport.read, debugmode=self.debugmode))
+        except stationclient.READ_ERRORS as e:
+            return self.weatherReport.fallback(e)
+        return self.weatherReport.accept(values)
+
+    async def fetch_allsky(self, allsky):
+        """
+        Downloads the all-sky image, conditionally on the last frame, see :meth:`~clouds.Clouds.download_image`. The download is run in a thread, the image being decoded (but not analysed) once it is back, so that a download abandoned after its timeout changes nothing.
+
+        :param allsky: the :class:`~clouds.Clouds` object in which to download the image
+        :return: allsky
+        :raise FetchError: if the download fails
+        """
+        allsky.new_frame = False
+        if allsky.fimage is not None:
+            allsky.retrieve_image()
+            return allsky
+
+        try:
+            response = await asyncio.get_event_loop().run_in_executor(None, allsky.download_image)
+        except requests.RequestException as e:
+            raise fetch.FetchError("Cannot download {}: {}".format(allsky.station.params['url'], e))
+        allsky.failed_connection = False
+        allsky.read_response(response.status_code, response.headers, response.content)
+        return allsky
+
+    def fetch(self, weather=True, allsky=None, refresh=None, donotdownloadtime=1.5, timeouts=None):
+        """
+        Downloads the weather report and the all-sky image at the same time, then analyses the image. The meteo itself is not changed, see :meth:`apply_refresh`.
+
+        This blocks until all the downloads are done or timed out, the GUI calls it from a worker thread.
+
+        :param weather: boolean, whether to download the weather report
+        :param allsky: the :class:`~clouds.Clouds` object in which to download and analyse the all-sky image, or None not to download it
+        :param refresh: a :class:`~fetch.Refresh`, to be able to cancel the downloads from another thread. If None, a new one is used.
+        :param donotdownloadtime: minimum elapsed time (in min) before re-downloading an all-sky image
+        :param timeouts: dictionary of timeouts (in s) by source name, replacing the ones of the settings
+
+        :return: dictionary of the results by source name: the weather values for `weather` and the allsky object for `allsky`, or the exception of a failed or cancelled download
+        """
+        if allsky is not None and allsky.is_recent(donotdownloadtime):
+            logger.info("Last image was downloaded more recently than {} minutes ago, I don't download it again".format(donotdownloadtime))
+            allsky = None
+
+        jobs, defaults = self.get_refresh_jobs(weather=weather, allsky=allsky)
+        defaults.update(timeouts or {})
+        if refresh is None:
+            refresh = fetch.Refresh()
+        results = refresh.run(jobs, defaults)
+
+        if 'allsky' in results and not isinstance(results['allsky'], asyncio.CancelledError):
+            if isinstance(results['allsky'], BaseException):
+                logger.warning("Cannot download All Sky image. Either you or the server is offline!")
+                allsky.failed_connection = True
+            try:
+                allsky.analyse()
+            except Exception as e:
+                logger.warning("Could not analyse the all sky image: {}".format(repr(e)))
+            results['allsky'] = allsky
+        return results
+
+    def apply_refresh(self, results):
+        """
+        Updates the weather and the cloud map with the results of :meth:`fetch`. The cancelled downloads are ignored, the failed weather report sets the weather to unknown (-9999).
+
+        :param results: dictionary of results by source name, as returned by :meth:`fetch`
+        """
+        weather = results.get('weather')
+        if weather is not None and not isinstance(weather, asyncio.CancelledError):
+            if isinstance(weather, BaseException):
+                logger.warning("Cannot download weather data. Either you or the weather server is offline!")
+                weather = (-9999, -9999, -9999, -9999)
+                self.set_weather(weather)
+            else:
+                self.set_weather(weather, report_time=getattr(self.weatherReport, "report_time", None))
+
+        allsky = results.get('allsky')
+        if isinstance(allsky, clouds.Clouds):
+            self.allsky = allsky
+            self.cloudmap = allsky.observability_map
+            self.record_allsky(allsky)
     
     def get_moon(self, obs_time=Time.now()):
         """
         Compute the altitude and azimuth of the moon at the given time
 
-        :param obs_time:  Astropy Time object. If None, use the current time as default.
-        :return: altitude and azimuth angles as Astropy Angle objects
+        :param obs_time:  Astropy Time object, scalar or array. If None, use the current time as default.
+        :return: azimuth and altitude angles as Astropy Angle objects
         """
         logger.debug("Computing Moon coordinates...")
-        observer = ephem.Observer()
-        observer.date = obs_time.iso
-        observer.lat, observer.lon, observer.elevation = self.lat.degree, self.lon.degree, self.elev
-    
-        self.moon = ephem.Moon()
-        self.moon.compute(observer)
+        alpha, delta = self.get_body_radec("moon", obs_time)
     
-        # Warning, ass-coding here: output of moon.ra is different from moon.ra.__str__()... clap clap clap
-        alpha = angles.Angle(self.moon.ra.__str__(), unit="hour")
-        delta = angles.Angle(self.moon.dec.__str__(), unit="degree")
+        Az, Alt = self.get_AzAlt(alpha, delta, obs_time)
     
         # return Az, Alt as Angle object
-        return self.get_AzAlt(alpha, delta, obs_time)
+        return angles.Angle(Az, unit="radian"), angles.Angle(Alt, unit="radian")
     
     
     def get_sun(self, obs_time=Time.now()):
         """
-        Compute the altitude and azimuth of the moon at the given time
+        Compute the altitude and azimuth of the Sun at the given time
 
-        :param obs_time:  Astropy Time object. If None, use the current time as default.
-        :return: altitude and azimuth angles as Astropy Angle objects
+        :param obs_time:  Astropy Time object, scalar or array. If None, use the current time as default.
+        :return: azimuth and altitude angles as Astropy Angle objects
         """
         logger.debug("Computing Sun coordinates...")
-        observer = ephem.Observer()
-        observer.date = obs_time.iso
-        observer.lat, observer.lon, observer.elevation = self.lat.degree, self.lon.degree, self.elev
+        alpha, delta = self.get_body_radec("sun", obs_time)
     
-        self.sun = ephem.Sun()
-        self.sun.compute(observer)
-    
-        # Warning, ass-coding here: output of sun.ra is different from sun.ra.__str__()... clap clap clap - again
-        alpha = angles.Angle(self.sun.ra.__str__(), unit="hour")
-        delta = angles.Angle(self.sun.dec.__str__(), unit="degree")
+        Az, Alt = self.get_AzAlt(alpha, delta, obs_time)
     
         # return Az, Alt as Angle object
-        return self.get_AzAlt(alpha, delta, obs_time)
-    
-    def get_AzAlt(self, alpha, delta, obs_time=None, ref_dir=0):
-    
+        return angles.Angle(Az, unit="radian"), angles.Angle(Alt, unit="radian")
+
+    def get_body_radec(self, body, obs_time):
         """
-        #todo: can't we do it with astropy as well?
-        idea from http://aa.usno.navy.mil/faq/docs/Alt_Az.php
-    
-        Compute the azimuth and altitude of a source at a given time (by default current time of execution), given its alpha and delta coordinates.
+        Right ascension and declination of the Sun or the Moon, interpolated in the ephemeris table of the night when it covers obs_time, see :meth:`~meteo.Meteo.get_ephemeris`.
 
-        :param alpha: Astrophy Angle object, right ascencion of the target you want to translate into altaz
-        :param delta: Astrophy Angle object, declination of the target you want to translate into altaz
-        :param obs_time: Astropy Time object. If None, use the current time as default.
-        :param ref_dir: float, zero point of the azimuth. Default is 0, corresponding to North.
-        :return: altitude and azimuth angles as Astropy Angle objects
+        :param body: string, "sun" or "moon"
+        :param obs_time: Astropy Time object, scalar or array
+        :return: right ascension and declination in radians, floats or numpy arrays with the shape of obs_time
         """
-        if not obs_time:
-            obs_time = self.time
+        ephemeris = self.get_ephemeris(obs_time if obs_time.isscalar else obs_time.ravel()[0])
+        if ephemeris.covers(obs_time):
+            return ephemeris.get_radec(body, obs_time)
+        return self.get_radec(Ephemeris.bodies[body](), obs_time)
 
-        lat, lon, elev = self.lat, self.lon, self.elev
+    def get_ephemeris(self, obs_time=None, maxnights=3):
+        """
+        Sun and Moon ephemeris table of the night of obs_time. The tables of the last few nights are kept, so that going back and forth between two nights does not recompute them.
+
+        :param obs_time: Astropy Time object. If None, use the meteo time.
+        :param maxnights: number of nights kept
+        :return: an :class:`~meteo.Ephemeris`
+        """
+        obs_night = self.get_obs_night(obs_time)
+        key = (self.name, self.lat.degree, self.lon.degree, self.elev, obs_night)
+
+        with self.ephemerides_lock:
+            if key in self.ephemerides:
+                self.ephemerides.move_to_end(key)
+            else:
+                self.ephemerides[key] = Ephemeris(self, obs_night)
+                while len(self.ephemerides) > maxnights:
+                    self.ephemerides.popitem(last=False)
+            return self.ephemerides[key]
+
+    def get_radec(self, body, obs_time):
+        """
+        Compute the apparent right ascension and declination of a Solar System body seen from the site, solving the body once per time.
+
+        :param body: PyEphem body, i.e. ephem.Moon() or ephem.Sun(). It is left computed at the last time.
+        :param obs_time: Astropy Time object, scalar or array.
+        :return: right ascension and declination in radians, floats or numpy arrays with the shape of obs_time
+        """
+        observer = ephem.Observer()
+        observer.lat, observer.lon, observer.elevation = self.lat.degree, self.lon.degree, self.elev
+
+        mjds = np.atleast_1d(obs_time.mjd)
+        alpha, delta = np.zeros(np.shape(mjds)), np.zeros(np.shape(mjds))
+        for ii, mjd in enumerate(mjds.flat):
+            observer.date = ephem.Date(mjd - 15019.5) # PyEphem dates are Dublin Julian Days
+            body.compute(observer)
+
+            # Warning, ass-coding here: output of body.ra is different from body.ra.__str__()... clap clap clap
+            # body.ra and body.dec are floats in radians, hence the array mode of get_AzAlt
+            alpha.flat[ii], delta.flat[ii] = float(body.ra), float(body.dec)
+
+        if obs_time.isscalar:
+            return alpha[0], delta[0]
+        return alpha, delta
     
+    def get_sidereal_time(self, obs_time):
+        """
+        Compute the Greenwich apparent sidereal time, once per distinct time.
+
+        :param obs_time: Astropy Time object, scalar or array
+        :return: sidereal time in hours, float or numpy array with the shape of obs_time
+        """
+        jd = np.asarray(obs_time.jd)
+        ujd, inverse = np.unique(jd, return_inverse=True)
+
         # Untouched code from Azimuth.py
-        D = obs_time.jd - 2451545.0
+        D = ujd - 2451545.0
         GMST = 18.697374558 + 24.06570982441908*D
         epsilon= np.deg2rad(23.4393 - 0.0000004*D)
         eqeq= -0.000319*np.sin(np.deg2rad(125.04 - 0.052954*D)) - 0.000024*np.sin(2.*np.deg2rad(280.47 + 0.98565*D))*np.cos(epsilon)
         GAST = GMST + eqeq
         GAST -= np.floor(GAST/24.)*24.
+
+        GAST = GAST[inverse].reshape(jd.shape)
+        if GAST.ndim == 0:
+            return float(GAST)
+        return GAST
+
+    def get_AzAlt(self, alpha, delta, obs_time=None, ref_dir=0):
     
-        LHA = angles.Angle((GAST-alpha.hour)*15+lon.degree, unit="degree")
-        if LHA > 0: LHA += angles.Angle(np.floor(LHA/360.)*360., unit="degree")
-        else: LHA -= angles.Angle(np.floor(LHA/360.)*360., unit="degree")
-    
-        sina=np.cos(LHA.radian)*np.cos(delta.radian)*np.cos(lat.radian)+np.sin(delta.radian)*np.sin(lat.radian)
-        Alt = angles.Angle(np.arcsin(sina),unit="radian")
-    
-        num = -np.sin(LHA.radian)
-        den = np.tan(delta.radian)*np.cos(lat.radian)-np.sin(lat.radian)*np.cos(LHA.radian)
-    
-        Az = angles.Angle(np.arctan2(num,den), unit="radian")
-        Az-=angles.Angle(ref_dir, unit="degree")
+        """
+        #todo: can't we do it with astropy as well?
+        idea from http://aa.usno.navy.mil/faq/docs/Alt_Az.php
     
+        Compute the azimuth and altitude of a source at a given time (by default current time of execution), given its alpha and delta coordinates.
+
+        There are two modes:
+
+        * Astropy Angle objects in, Astropy Angle objects out. If only one of alpha and delta is an Angle, the other one is taken in radians.
+        * Array mode: floats or numpy arrays (in radians) in, numpy arrays (in radians) out. alpha, delta and obs_time are broadcasted against each other, i.e. use ``alpha[:, np.newaxis]`` and an array of times to get a (targets x times) result.
+
+        :param alpha: Astrophy Angle object or float/numpy array in radians, right ascencion of the target you want to translate into altaz
+        :param delta: Astrophy Angle object or float/numpy array in radians, declination of the target you want to translate into altaz
+        :param obs_time: Astropy Time object, scalar or array. If None, use the current time as default.
+        :param ref_dir: float, zero point of the azimuth. Default is 0, corresponding to North.
+        :return: azimuth and altitude angles as Astropy Angle objects, or as numpy arrays in radians in array mode
+        """
+        if obs_time is None:
+            obs_time = self.time
+
+        if isinstance(alpha, angles.Angle) or isinstance(delta, angles.Angle):
+            Az, Alt = self.get_AzAlt(u.Quantity(alpha, u.radian).value, u.Quantity(delta, u.radian).value, obs_time=obs_time, ref_dir=ref_dir)
+            return angles.Angle(Az, unit="radian"), angles.Angle(Alt, unit="radian")
+
+        lat, lon = self.lat.radian, self.lon.radian
+
+        GAST = self.get_sidereal_time(obs_time)
+
+        LHA = np.deg2rad(GAST * 15.) + lon - alpha
+
+        sina = np.cos(LHA)*np.cos(delta)*np.cos(lat)+np.sin(delta)*np.sin(lat)
+        Alt = np.arcsin(sina)
+
+        num = -np.sin(LHA)
+        den = np.tan(delta)*np.cos(lat)-np.sin(lat)*np.cos(LHA)
+
+        Az = np.arctan2(num, den) - np.deg2rad(ref_dir)
+
         # I changed this to get the same angle as the edp, using 0 (North) as reference
-        if Az.degree < 0:
-            Az+=angles.Angle(360, unit="degree")
-    
+        Az = np.mod(Az, 2. * np.pi)
+
         return Az, Alt
     
     def get_telescope_params(self):
@@ -277,13 +549,14 @@ class Meteo:
         
         return self.lat, self.lon, self.elev
 
-    def get_nighthours(self, obs_night, twilight="nautical", nhours=100):
+    def get_nighthours(self, obs_night, twilight="nautical", nhours=100, asarray=False):
         """
         Computes a list of astropy Time objects, spanning to the different hours of the nights between twilights.
 
         :param obs_night: string formatted as YYYY-MM-DD. Night where the observations start.
         :param twilight: string, can be "civil", "nautical" or "astronomical", corresponding to Sun elevation of -6, -12 or -18 degree from the horizon, respectively.
         :param nhours: integer, number of hours you want in the list
+        :param asarray: boolean. If True, return a single Astropy Time array instead of a list.
 
         :return: list of Astropy Time objects, regularly spaced between twilights.
 
@@ -298,9 +571,43 @@ class Meteo:
         sunrise_time = Time('%i-%02i-%02i %i:%i:%.03f' % sunrise, format='iso', scale='utc').mjd
     
         mjds = np.linspace(sunset_time, sunrise_time, num=nhours)
+        if asarray:
+            return Time(mjds, format='mjd', scale='utc')
         times = [Time(mjd, format='mjd', scale='utc') for mjd in mjds]
     
         return times
+
+    def get_obs_night(self, obs_time=None):
+        """
+        Computes the night a given time belongs to, i.e. the date of the evening for times before midday UT.
+
+        :param obs_time: Astropy Time object. If None, use the meteo time.
+        :return: string formatted as YYYY-MM-DD
+        """
+        if obs_time is None:
+            obs_time = self.time
+        if obs_time.datetime.hour < 12:
+            obs_night = Time(obs_time.mjd - 1, format='mjd', scale='utc')
+        else:
+            obs_night = Time(obs_time.mjd, format='mjd', scale='utc')
+        return obs_night.iso.split()[0]
+
+    def night_grid(self, obs_night=None, nhours=100, twilight="nautical"):
+        """
+        Samples a night between twilights and computes the Sun and Moon positions once per time sample.
+
+        :param obs_night: string formatted as YYYY-MM-DD. Night where the observations start. If None, use the night of the meteo time.
+        :param nhours: integer, number of time samples
+        :param twilight: string, can be "civil", "nautical" or "astronomical", see :meth:`~meteo.Meteo.get_twilights`
+
+        :return: a :class:`~meteo.NightGrid`, to be fed to :meth:`~obs.ObservableSet.compute_observability` or :class:`~obs.ObservabilityMatrix`
+        """
+        logger.debug("Computing the night grid...")
+        if obs_night is None:
+            obs_night = self.get_obs_night()
+
+        times = self.get_nighthours(obs_night, twilight=twilight, nhours=nhours, asarray=True)
+        return NightGrid(self, times, obs_night=obs_night)
     
     def get_twilights(self, obs_night, twilight="nautical"):
         """
@@ -342,3 +649,252 @@ class Meteo:
         return sunrise, sunset
 
 #todo: generalize get_sun and get_moon into a single get_distance_to_obj function.
+
+
+class NightGrid:
+    """
+    Sun and Moon positions over an array of times, computed once per time sample.
+
+    A NightGrid behaves like a :class:`~meteo.Meteo` whose time is an array: the site, weather and clouds attributes are the ones of the parent meteo, which is left untouched.
+    """
+    def __init__(self, meteo, times, obs_night=None):
+        """
+        :param meteo: the parent :class:`~meteo.Meteo` object
+        :param times: Astropy Time array
+        :param obs_night: string formatted as YYYY-MM-DD, the night the times belong to, for reference only
+        """
+        self.meteo = meteo
+        self.time = times
+        self.obs_night = obs_night
+
+        self.moonaz, self.moonalt = meteo.get_moon(times)
+        self.sunaz, self.sunalt = meteo.get_sun(times)
+
+    def __getattr__(self, name):
+        # everything that is not time-dependent is taken from the parent meteo
+        if name == "meteo":
+            raise AttributeError(name)
+        return getattr(self.meteo, name)
+
+    def __len__(self):
+        return len(self.time)
+
+
+class MeteoSnapshot:
+    """
+    Frozen state of a :class:`~meteo.Meteo` at a given time: Sun and Moon positions, weather, smoothed wind, a read-only cloud map and the cloud nowcast.
+
+    A snapshot is never modified, so that it can be handed to observability computations running in other threads while the meteo is refreshed, and several snapshots at different times can be evaluated at the same time. Like a :class:`~meteo.NightGrid`, it takes the site attributes from the parent meteo, the methods that default to the meteo time using the snapshot time instead. The methods that change the meteo are not available.
+    """
+    mutators = ("update", "updatemoonpos", "updatesunpos", "updateweather", "updateclouds", "set_weather", "apply_refresh", "record_allsky")
+
+    def __init__(self, meteo, obs_time=None):
+        """
+        :param meteo: the parent :class:`~meteo.Meteo` object
+        :param obs_time: Astropy Time object. If None, the meteo time, and the Sun and Moon positions of the meteo are reused.
+        """
+        state = {"meteo": meteo}
+        if obs_time is None or obs_time is meteo.time:
+            state.update(time=meteo.time, moonaz=meteo.moonaz, moonalt=meteo.moonalt, sunaz=meteo.sunaz, sunalt=meteo.sunalt)
+        else:
+            state["time"] = obs_time
+            state["moonaz"], state["moonalt"] = meteo.get_moon(obs_time)
+            state["sunaz"], state["sunalt"] = meteo.get_sun(obs_time)
+
+        state.update(winddirection=meteo.winddirection, windspeed=meteo.windspeed, temperature=meteo.temperature, humidity=meteo.humidity, lastest_weatherupdate_time=meteo.lastest_weatherupdate_time)
+        state["wind"] = meteo.get_wind()
+        state["gust"] = meteo.get_gust()
+
+        # the refresh replaces the cloud map and the all sky of the meteo, it does not write in them
+        cloudmap = meteo.cloudmap
+        if cloudmap is not None:
+            cloudmap = cloudmap.view()
+            cloudmap.flags.writeable = False
+        state.update(cloudmap=cloudmap, allsky=meteo.allsky, nowcast=meteo.nowcast.copy())
+        self.__dict__.update(state)
+
+    def __getattr__(self, name):
+        # everything that is not time-dependent is taken from the parent meteo
+        if name == "meteo" or name in self.mutators:
+            raise AttributeError("{} is not available on a meteo snapshot".format(name))
+        return getattr(self.meteo, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("A meteo snapshot cannot be modified, take a new one with Meteo.snapshot")
+
+    def __delattr__(self, name):
+        raise AttributeError("A meteo snapshot cannot be modified, take a new one with Meteo.snapshot")
+
+    def __str__(self):
+        return Meteo.__str__(self)
+
+    def get_wind(self, obs_time=None):
+        """
+        :param obs_time: ignored, the wind is the one of the meteo when the snapshot was taken, see :meth:`~meteo.Meteo.get_wind`
+        :return: wind direction (in degree) and wind speed (in m/s)
+        """
+        return self.wind
+
+    def get_gust(self, obs_time=None):
+        """
+        :param obs_time: ignored, the wind is the one of the meteo when the snapshot was taken, see :meth:`~meteo.Meteo.get_gust`
+        :return: wind speed (in m/s)
+        """
+        return self.gust
+
+    def predict_cloudmap(self, obs_time):
+        """
+        See :meth:`~meteo.Meteo.predict_cloudmap`, from the cloud maps known when the snapshot was taken
+        """
+        return self.nowcast.predict(obs_time)
+
+    def get_AzAlt(self, alpha, delta, obs_time=None, ref_dir=0):
+        """
+        See :meth:`~meteo.Meteo.get_AzAlt`, the default time being the snapshot time
+        """
+        return self.meteo.get_AzAlt(alpha, delta, obs_time=self.time if obs_time is None else obs_time, ref_dir=ref_dir)
+
+    def get_obs_night(self, obs_time=None):
+        """
+        See :meth:`~meteo.Meteo.get_obs_night`, the default time being the snapshot time
+        """
+        return self.meteo.get_obs_night(self.time if obs_time is None else obs_time)
+
+    def get_ephemeris(self, obs_time=None):
+        """
+        See :meth:`~meteo.Meteo.get_ephemeris`, the default time being the snapshot time
+        """
+        return self.meteo.get_ephemeris(self.time if obs_time is None else obs_time)
+
+    def night_grid(self, obs_night=None, nhours=100, twilight="nautical"):
+        """
+        See :meth:`~meteo.Meteo.night_grid`, the weather and clouds of the grid being the ones of the snapshot
+        """
+        if obs_night is None:
+            obs_night = self.get_obs_night()
+        times = self.meteo.get_nighthours(obs_night, twilight=twilight, nhours=nhours, asarray=True)
+        return NightGrid(self, times, obs_night=obs_night)
+
+
+class Ephemeris:
+    """
+    Sun and Moon positions over a whole night, sampled once on a fine time grid.
+
+    Any time of the night is then served by interpolating the right ascension and declination, the altitude and azimuth being computed exactly from the interpolated coordinates. The table spans from midday UT of the night date to midday UT of the next day (plus a small margin), i.e. all the times :meth:`~meteo.Meteo.get_obs_night` assigns to that night.
+    """
+    bodies = {"sun": ephem.Sun, "moon": ephem.Moon}
+
+    def __init__(self, meteo, obs_night, step=5.):
+        """
+        :param meteo: the :class:`~meteo.Meteo` object giving the site
+        :param obs_night: string formatted as YYYY-MM-DD. Night where the observations start.
+        :param step: float, time between two samples, in minutes
+        """
+        logger.debug("Computing the Sun and Moon ephemeris of night {}...".format(obs_night))
+        self.meteo = meteo
+        self.obs_night = obs_night
+        self.site = (meteo.name, meteo.lat.degree, meteo.lon.degree, meteo.elev)
+        self.step = step
+
+        start = Time('%s 12:00:00' % obs_night, format='iso', scale='utc').mjd - 1. / 24.
+        self.mjd = start + np.arange(int(np.ceil((1. + 2. / 24.) * 1440. / step)) + 1) * step / 1440.
+        self.time = Time(self.mjd, format='mjd', scale='utc')
+
+        self.ra, self.dec, self.az, self.alt = {}, {}, {}, {}
+        self.error = 0.
+        for name, body in self.bodies.items():
+            ra, dec = meteo.get_radec(body(), self.time)
+            self.ra[name] = np.unwrap(ra)
+            self.dec[name] = dec
+            self.az[name], self.alt[name] = meteo.get_AzAlt(ra, dec, self.time)
+
+            # The error of a linear interpolation is bounded by max|f''| step^2 / 8, estimated with the second differences
+            error = np.hypot(np.diff(self.ra[name] * np.cos(dec), 2), np.diff(dec, 2))
+            self.error = max(self.error, np.rad2deg(np.max(np.abs(error))) / 8.)
+
+        logger.debug("Ephemeris interpolation error bound: {:.2e} degree".format(self.error))
+
+    def covers(self, obs_time):
+        """
+        :param obs_time: Astropy Time object, scalar or array
+        :return: boolean, True if all the times are within the table
+        """
+        mjd = obs_time.mjd
+        return bool(np.all((mjd >= self.mjd[0]) & (mjd <= self.mjd[-1])))
+
+    def get_radec(self, body, obs_time):
+        """
+        Interpolated right ascension and declination of a body.
+
+        :param body: string, "sun" or "moon"
+        :param obs_time: Astropy Time object, scalar or array, within the table
+        :return: right ascension and declination in radians, floats or numpy arrays with the shape of obs_time
+        """
+        mjd = obs_time.mjd
+        alpha = np.mod(np.interp(mjd, self.mjd, self.ra[body]), 2. * np.pi)
+        delta = np.interp(mjd, self.mjd, self.dec[body])
+        if obs_time.isscalar:
+            return float(alpha), float(delta)
+        return alpha, delta
+
+    def get_AzAlt(self, body, obs_time):
+        """
+        Azimuth and altitude of a body.
+
+        :param body: string, "sun" or "moon"
+        :param obs_time: Astropy Time object, scalar or array, within the table
+        :return: azimuth and altitude in radians, floats or numpy arrays with the shape of obs_time
+        """
+        alpha, delta = self.get_radec(body, obs_time)
+        return self.meteo.get_AzAlt(alpha, delta, obs_time)
+
+    def get_trend(self, body, obs_time):
+        """
+        Altitude trend of a body, in degrees per hour: positive if rising, negative if declining.
+
+        :param body: string, "sun" or "moon"
+        :param obs_time: Astropy Time object, scalar or array, within the table
+        :return: float or numpy array with the shape of obs_time
+        """
+        dt = 1. / 1440.
+        mjd = np.clip(obs_time.mjd, self.mjd[0] + dt, self.mjd[-1] - dt)
+        _, altbefore = self.get_AzAlt(body, Time(mjd - dt, format='mjd', scale='utc'))
+        _, altafter = self.get_AzAlt(body, Time(mjd + dt, format='mjd', scale='utc'))
+        return np.rad2deg(altafter - altbefore) / (2. * dt * 24.)
+
+    def get_risings_settings(self, body, horizon=0.):
+        """
+        Times at which a body crosses a given altitude within the table.
+
+        :param body: string, "sun" or "moon"
+        :param horizon: float, altitude of the horizon, in degrees
+        :return: two lists of Astropy Time objects, the risings and the settings
+        """
+        alt = np.rad2deg(self.alt[body]) - horizon
+        crossings = np.where(np.sign(alt[:-1]) != np.sign(alt[1:]))[0]
+
+        risings, settings = [], []
+        for ii in crossings:
+            mjd = self.mjd[ii] + (self.mjd[ii + 1] - self.mjd[ii]) * alt[ii] / (alt[ii] - alt[ii + 1])
+            if alt[ii + 1] > alt[ii]:
+                risings.append(Time(mjd, format='mjd', scale='utc'))
+            else:
+                settings.append(Time(mjd, format='mjd', scale='utc'))
+        return risings, settings
+
+    def get_transits(self, body):
+        """
+        Times of the upper transits of a body within the table, i.e. when its altitude is maximal.
+
+        :param body: string, "sun" or "moon"
+        :return: list of Astropy Time objects
+        """
+        alt = self.alt[body]
+        maxima = np.where((alt[1:-1] >= alt[:-2]) & (alt[1:-1] > alt[2:]))[0] + 1
+
+        transits = []
+        for ii in maxima:
+            # vertex of the parabola through the three samples around the maximum
+            offset = 0.5 * (alt[ii - 1] - alt[ii + 1]) / (alt[ii - 1] - 2. * alt[ii] + alt[ii + 1])
+            transits.append(Time(self.mjd[ii] + offset * (self.mjd[ii + 1] - self.mjd[ii]), format='mjd', scale='utc'))
+        return transits
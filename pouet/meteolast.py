@@ -0,0 +1,97 @@
+"""
+Parser of the `meteo.last` weather reports of the ESO weather stations (see :file:`config/meteoDebugMode.last`).
+
+A report is a header line with the date, time and name of the weather station, followed by one line per sensor: quantity and sensor number (e.g. `WS1`, `T 2`), unit, averaging interval, then the instantaneous, average, maximum, minimum and standard deviation values. Archives are simply concatenated reports.
+"""
+
+import re
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# one record per sensor reading, the sensor number is 0 for the quantities measured by a single sensor
+RECORD_DTYPE = np.dtype([
+    ('station', 'U16'), ('time', 'datetime64[m]'),
+    ('quantity', 'U4'), ('sensor', 'i2'), ('unit', 'U4'), ('interval', 'U4'),
+    ('inst', 'f8'), ('ave', 'f8'), ('max', 'f8'), ('min', 'f8'), ('dev', 'f8'),
+])
+
+# value of the readings not available
+MISSING = 9999.
+
+
+class MeteoLastParser():
+    """
+    Reads all the sensor readings of one or many reports in a single pass of a compiled regular expression over the text.
+    """
+
+    pattern = re.compile(r"""
+        ^(?P<date>\d{4}-\d{2}-\d{2})[ \t]+(?P<time>\d{2}:\d{2})[ \t]+(?P<station>\S+)[ \t\r]*$
+        |
+        ^(?P<quantity>[A-Za-z]+)[ \t]?(?P<sensor>\d?)[ \t]+(?P<unit>\S+)[ \t]+(?P<interval>\d+[A-Za-z])
+        (?P<values>(?:[ \t]+[-+]?[\d.]+){5})[ \t\r]*$
+        """, re.M | re.X)
+
+    def parse(self, data):
+        """
+        :param data: content of one or many concatenated reports, as a string
+        :return: numpy record array with :data:`RECORD_DTYPE`, one record per sensor reading in the order of the text. The missing readings are NaN.
+        """
+        station, when = "", "NaT"
+        stations, times, sensors, values = [], [], [], []
+        for date, hour, name, quantity, sensor, unit, interval, readings in self.pattern.findall(data):
+            if not quantity:
+                station, when = name, "{}T{}".format(date, hour)
+                continue
+            stations.append(station)
+            times.append(when)
+            sensors.append((quantity.upper(), int(sensor or 0), unit, interval))
+            values.append(readings)
+
+        records = np.zeros(len(sensors), dtype=RECORD_DTYPE)
+        if len(sensors) == 0:
+            return records.view(np.recarray)
+        records['station'] = stations
+        records['time'] = np.array(times, dtype='datetime64[m]')
+        records['quantity'], records['sensor'], records['unit'], records['interval'] = zip(*sensors)
+
+        readings = np.array(" ".join(values).split(), dtype=float).reshape(-1, 5)
+        readings[readings == MISSING] = np.nan
+        for ii, field in enumerate(['inst', 'ave', 'max', 'min', 'dev']):
+            records[field] = readings[:, ii]
+        return records.view(np.recarray)
+
+    def parse_file(self, filename):
+        """
+        :param filename: path to a report or an archive of reports
+        :return: see :meth:`parse`
+        """
+        logger.debug("Parsing the weather reports of {}...".format(filename))
+        with open(filename, mode='r') as f:
+            return self.parse(f.read())
+
+
+def get_latest(records):
+    """
+    :param records: record array returned by :meth:`MeteoLastParser.parse`
+    :return: the records of the latest report of each weather station
+    """
+    if len(records) == 0:
+        return records
+    latest = np.zeros(len(records), dtype=bool)
+    for station in np.unique(records['station']):
+        mine = records['station'] == station
+        latest |= mine & ((records['time'] == np.max(records['time'][mine])) | np.isnat(records['time']))
+    return records[latest]
+
+
+def get_readings(records, quantity, field='ave'):
+    """
+    :param records: record array returned by :meth:`MeteoLastParser.parse`
+    :param quantity: name of the quantity, e.g. `WS`
+    :param field: which value of the readings, `inst`, `ave`, `max`, `min` or `dev`
+    :return: array of the values of all the sensors of this quantity, in the order of the records
+    """
+    return records[field][records['quantity'] == quantity.upper()]
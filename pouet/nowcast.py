@@ -0,0 +1,164 @@
+"""
+Define the Nowcast class, predicting the cloud coverage of the next minutes from the motion of the clouds between consecutive all-sky frames.
+
+The observability maps of the last frames are kept in memory. The motion of the clouds is estimated by phase correlation between consecutive maps, then the latest map is shifted along this motion to predict the map a few minutes ahead.
+
+The motion is estimated on the pixel grid of the fisheye image, not on the sky: a cloud layer moving at a constant speed covers fewer pixels per minute near the horizon than at the zenith. The predictions are thus less reliable close to the horizon, where the velocity measured over the whole image overestimates the motion.
+"""
+
+import collections
+import numpy as np
+import scipy.ndimage as ndimage
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Nowcast():
+    """
+    Keeps the last observability maps (see :meth:`~clouds.Clouds.get_observability_map`) and extrapolates them in the future.
+
+    The clouds are assumed to move as a whole, with a constant velocity in the image. This is a crude approximation of the motion on the sky, but it is good enough over a few tens of minutes.
+    """
+
+    def __init__(self, maxmaps=6, horizon=30.):
+        """
+        :param maxmaps: number of maps kept in memory
+        :param horizon: time (in min) after which the confidence of a prediction is divided by e
+        """
+        self.maps = collections.deque(maxlen=maxmaps)
+        # velocity and correlation peak of each pair of consecutive maps, the oldest being dropped with the oldest map
+        self.motions = collections.deque(maxlen=maxmaps - 1)
+        self.horizon = horizon
+
+        self.velocity = None
+        self.confidence = 0.
+
+    def __len__(self):
+        return len(self.maps)
+
+    def copy(self):
+        """
+        :return: a copy that is not affected by the maps added later to this nowcast, the maps themselves being shared as they are never modified
+        """
+        other = Nowcast(maxmaps=self.maps.maxlen, horizon=self.horizon)
+        other.maps.extend(self.maps)
+        other.motions.extend(self.motions)
+        other.velocity, other.confidence = self.velocity, self.confidence
+        return other
+
+    def get_last_time(self):
+        """
+        :return: the MJD of the last map, or None if there is no map in memory
+        """
+        return self.maps[-1][0] if len(self.maps) > 0 else None
+
+    def add(self, obs_time, cloudmap):
+        """
+        Adds a new map and updates the cloud motion estimate. Only the pair formed by the new map and the previous one is correlated, the other pairs are already known.
+
+        :param obs_time: Astropy Time object, time of the all-sky frame
+        :param cloudmap: the observability map of the frame
+        """
+        if cloudmap is None:
+            return
+        if len(self.maps) > 0:
+            if obs_time.mjd <= self.maps[-1][0]:
+                logger.debug("Frame is not newer than the last one, not used for nowcasting")
+                return
+            if np.shape(cloudmap) != np.shape(self.maps[-1][1]):
+                logger.info("All-sky frame size changed, restarting the nowcasting")
+                self.maps.clear()
+
+        cloudmap = np.asarray(cloudmap, dtype=float)
+        if len(self.maps) > 0:
+            t0, map0 = self.maps[-1]
+            shift, peak = phase_correlation(map0, cloudmap)
+            self.motions.append((shift / ((obs_time.mjd - t0) * 1440.), peak))
+        else:
+            self.motions.clear()
+
+        self.maps.append((obs_time.mjd, cloudmap))
+        self.update_motion()
+
+    def update_motion(self):
+        """
+        Estimates the cloud velocity (in px per minute) from the motions measured on all the consecutive pairs of maps in memory.
+
+        The confidence (between 0 and 1) is the mean height of the correlation peaks, lowered if the velocities measured on the different pairs disagree.
+        """
+        if len(self.motions) == 0:
+            self.velocity = None
+            self.confidence = 0.
+            return
+
+        logger.debug("Estimating the cloud motion over {} maps...".format(len(self.maps)))
+        velocities = np.array([velocity for velocity, peak in self.motions])
+        peaks = [peak for velocity, peak in self.motions]
+        self.velocity = np.mean(velocities, axis=0)
+        spread = np.max(np.std(velocities, axis=0)) if len(velocities) > 1 else 0.
+        self.confidence = float(np.clip(np.mean(peaks), 0., 1.) / (1. + spread))
+        logger.debug("Cloud motion: {} px/min, confidence {:.2f}".format(self.velocity, self.confidence))
+
+    def predict(self, obs_time):
+        """
+        Predicts the observability map at a given time, by shifting the latest map along the cloud motion.
+
+        :param obs_time: Astropy Time object
+        :return: the predicted map (NaN where the clouds come from outside of the image) and its confidence between 0 and 1. The map is None if there is no map in memory.
+        """
+        if len(self.maps) == 0:
+            return None, 0.
+
+        t0, lastmap = self.maps[-1]
+        lead = (obs_time.mjd - t0) * 1440.
+        if self.velocity is None or lead <= 0:
+            return lastmap, self.confidence if lead > 0 else 1.
+
+        shift = self.velocity * lead
+        prediction = ndimage.shift(np.nan_to_num(lastmap), shift, order=1, mode='constant', cval=np.nan)
+        prediction[np.isnan(ndimage.shift(lastmap, shift, order=0, mode='constant', cval=np.nan))] = np.nan
+
+        return prediction, self.confidence * np.exp(-lead / self.horizon)
+
+
+def phase_correlation(reference, image):
+    """
+    Finds the translation between two images by phase correlation.
+
+    :param reference: 2D array, NaN are ignored
+    :param image: 2D array with the same shape, NaN are ignored
+
+    :return: the shift (array, one value per axis, in px) such that image is reference moved by shift, and the height of the correlation peak (1 for a perfect match)
+    """
+    window = np.outer(np.hanning(np.shape(reference)[0]), np.hanning(np.shape(reference)[1]))
+
+    def prepare(im):
+        im = np.asarray(im, dtype=float)
+        valid = np.isfinite(im)
+        if not valid.any():
+            return np.zeros_like(im)
+        im = np.where(valid, im - np.mean(im[valid]), 0.)
+        return im * window
+
+    fref = np.fft.fft2(prepare(reference))
+    fim = np.fft.fft2(prepare(image))
+    cross = fim * np.conj(fref)
+    cross /= np.abs(cross) + 1e-12
+    correlation = np.real(np.fft.ifft2(cross))
+
+    peak = np.unravel_index(np.argmax(correlation), correlation.shape)
+    shift = np.zeros(2)
+    for axis, size in enumerate(correlation.shape):
+        # sub-pixel position from a parabola through the peak and its neighbours
+        before, after = list(peak), list(peak)
+        before[axis] = (peak[axis] - 1) % size
+        after[axis] = (peak[axis] + 1) % size
+        cm, c0, cp = correlation[tuple(before)], correlation[peak], correlation[tuple(after)]
+        denominator = cm - 2. * c0 + cp
+        offset = 0.5 * (cm - cp) / denominator if denominator != 0 else 0.
+        shift[axis] = peak[axis] + offset
+        if shift[axis] > size / 2.:
+            shift[axis] -= size
+
+    return shift, float(correlation[peak])
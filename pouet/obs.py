@@ -6,11 +6,12 @@ from numpy import cos, rad2deg, isnan, arange
 import numpy as np
 import os, sys, inspect
 import copy as pythoncopy
-from astropy.time import Time
+from astropy.time import Time, TimeDelta
 from astropy import units as u
 from astropy.coordinates import angles, angle_utilities, SkyCoord
 import astropy.table
 import importlib
+import collections
 import util
 
 import logging
@@ -142,7 +143,7 @@ class Observable:
 		"""
 		if SETTINGS["misc"]["singletargetlogs"] == "True":
 			logger.debug("Computing angletowind for {}...".format(self.name))
-		winddirection = meteo.winddirection
+		winddirection, _ = meteo.get_wind()
 		if winddirection < 0 or winddirection > 360:
 			self.angletowind = None
 			return
@@ -295,16 +296,18 @@ class Observable:
 		# check the wind:
 		self.obs_wind, self.obs_wind_info = True, True
 		if not future:
-			if meteo.windspeed > 0. and meteo.windspeed < 100. and self.angletowind is not None:
-				if self.angletowind.degree < 90 and meteo.windspeed >= float(meteo.location.get("weather", "windWarnLevel")):
+			_, windspeed = meteo.get_wind()
+			gust = meteo.get_gust()
+			if windspeed > 0. and windspeed < 100. and self.angletowind is not None:
+				if self.angletowind.degree < 90 and windspeed >= float(meteo.location.get("weather", "windWarnLevel")):
 					self.obs_wind = False
 					observability = 0
-					msg += '\nWA:%0.1f/WS:%0.1f' % (self.angletowind.degree, meteo.windspeed)
+					msg += '\nWA:%0.1f/WS:%0.1f' % (self.angletowind.degree, windspeed)
 
-				if meteo.windspeed >= float(meteo.location.get("weather", "windLimitLevel")):
+				if gust >= float(meteo.location.get("weather", "windLimitLevel")):
 					self.obs_wind = False
 					observability = 0
-					msg += '\nWS:%s' % meteo.windspeed
+					msg += '\nWS:%0.1f' % gust
 			else:
 				self.obs_wind_info = False
 				warnings += '\nNo wind info'
@@ -374,6 +377,544 @@ class Observable:
 		self.observability = observability
 
 
+class AttributesTable(dict):
+	"""
+	Attributes of the targets of an obsprogram, as columns: `table[key]` is the list of the values of `key`, one per target, None for the targets that do not define it.
+
+	This is what the optional `observability_batch` function of the obsprogram modules receives, see :meth:`~obs.ObservableSet.compute_observability`.
+	"""
+	def __init__(self, attributes):
+		"""
+		:param attributes: list of the attributes dictionaries (or None) of the targets
+		"""
+		dict.__init__(self)
+		self.ntargets = len(attributes)
+		for ii, values in enumerate(attributes):
+			for key, value in (values or {}).items():
+				self.setdefault(key, [None] * self.ntargets)[ii] = value
+
+
+class ObservableSet:
+	"""
+	Columnar container holding a whole catalogue of observables.
+
+	The coordinates, limits and program of every target are stored in numpy arrays, so that :meth:`~obs.ObservableSet.update` and :meth:`~obs.ObservableSet.compute_observability` follow the exact same recipe as their :class:`~obs.Observable` counterparts, but for all the targets at once.
+
+	The results are stored as arrays attributes (altitude, azimuth, airmass, angletomoon,...). Use :meth:`~obs.ObservableSet.writeback` to propagate them to the underlying observables.
+
+	The computation is split in stages, each one recording the inputs it was computed from: `geometry` (site, time, Sun and Moon → altaz, airmass, angles to the Moon and the Sun), `wind` (geometry, wind and its limits → wind flags), `clouds` (geometry, cloud map → cloud flags), `nowcast` (geometry, cloud nowcast → cloudfree values predicted `nowcastlead` minutes ahead, which do not change the observability) and `program` (time, obsprogram attributes → program flag). When the set is computed again, only the stages whose inputs changed are run again, e.g. a new weather report only re-evaluates the wind flags. The number of runs of each stage is counted in `evaluations`.
+
+	The program stage evaluates the targets grouped by obsprogram: a program that defines an `observability_batch(attributes_table, obs_time)` function is called once for all its targets and times, with their attributes as an :class:`~obs.AttributesTable`. The other programs fall back to their `observability` function, called for every target and time.
+	"""
+	def __init__(self, observables):
+		"""
+		:param observables: list of :class:`~obs.Observable`
+		"""
+		self.observables = list(observables)
+
+		self.names = np.array([o.name for o in self.observables], dtype=object)
+		self.alpha = np.array([o.alpha.radian for o in self.observables], dtype=float)
+		self.delta = np.array([o.delta.radian for o in self.observables], dtype=float)
+		self.obsprograms = np.array([o.obsprogram for o in self.observables], dtype=object)
+		self.minangletomoon = np.array([o.minangletomoon for o in self.observables], dtype=float)
+		self.maxairmass = np.array([o.maxairmass for o in self.observables], dtype=float)
+		self.internalobs = np.array([getattr(o, 'internalobs', 1) for o in self.observables], dtype=float)
+
+		# indices of the targets of each obsprogram module
+		self.programs = collections.OrderedDict()
+		for ii, o in enumerate(self.observables):
+			self.programs.setdefault(getattr(o, "program", None), []).append(ii)
+
+		self.observability = None
+		self.flags = None
+		# cloudfree values predicted at the end of an exposure and the confidence of the prediction, see predict_cloudfree
+		self.predictedcloudfree = None
+		self.nowcastconfidence = 0.
+
+		# inputs of the last run of each stage, see is_stale
+		self.inputs = {}
+		self.evaluations = collections.Counter()
+		# runs of each stage and values already propagated to the observables, see writeback
+		self.writtenevaluations = collections.Counter()
+		self.writtenvalues = {}
+
+	def __len__(self):
+		return len(self.observables)
+
+	def copy(self):
+		"""
+		:return: a shallow copy of the set, sharing the arrays computed so far but with its own record of the inputs of the stages, so that computing one does not affect the other
+		"""
+		other = pythoncopy.copy(self)
+		other.inputs = dict(self.inputs)
+		other.evaluations = collections.Counter(self.evaluations)
+		other.writtenevaluations = collections.Counter(self.writtenevaluations)
+		other.writtenvalues = dict(self.writtenvalues)
+		return other
+
+	def is_stale(self, stage, inputs):
+		"""
+		Tells whether a stage of the computation has to run again. The inputs are recorded by :meth:`set_inputs` once the stage has run.
+
+		:param stage: name of the stage
+		:param inputs: list of the values the stage depends on (numbers, strings, arrays or containers of those)
+		:return: True if the inputs differ from the ones of the last run of the stage
+		"""
+		def same(a, b):
+			if a is b:
+				return True
+			if type(a) != type(b):
+				return False
+			if isinstance(a, np.ndarray):
+				return a.shape == b.shape and a.dtype == b.dtype and np.array_equal(a, b, equal_nan=a.dtype.kind == 'f')
+			if isinstance(a, (list, tuple)):
+				return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+			if isinstance(a, dict):
+				return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+			if isinstance(a, float):
+				return a == b or (np.isnan(a) and np.isnan(b))
+			try:
+				return bool(a == b)
+			except ValueError:
+				# e.g. tables, compared element-wise
+				return False
+
+		return stage not in self.inputs or not same(self.inputs[stage], inputs)
+
+	def set_inputs(self, stage, inputs):
+		"""
+		Records the inputs a stage was computed from, see :meth:`is_stale`
+		"""
+		self.inputs[stage] = inputs
+		self.evaluations[stage] += 1
+
+	def update(self, meteo):
+		"""
+		Vectorized version of :meth:`~obs.Observable.update`: altitude, azimuth, angle to wind, airmass, angle to moon and angle to sun, all in radians.
+
+		If the meteo time is an array of times (see :meth:`~meteo.Meteo.night_grid`), the results are (targets x times) arrays.
+
+		The positions are only computed again if the site, the time or the Sun and Moon positions changed since the last call (`geometry` stage).
+
+		:param meteo: a Meteo object, whose time attribute has been actualized beforehand
+		"""
+		inputs = [meteo.name, meteo.lat.degree, meteo.lon.degree, meteo.elev, np.atleast_1d(meteo.time.jd),
+				  np.atleast_1d(meteo.moonaz.radian), np.atleast_1d(meteo.moonalt.radian), np.atleast_1d(meteo.sunaz.radian), np.atleast_1d(meteo.sunalt.radian)]
+		if self.is_stale("geometry", inputs):
+			logger.debug("Updating parameters for {} observables...".format(len(self)))
+			alpha, delta = self.alpha, self.delta
+			if not meteo.time.isscalar:
+				alpha, delta = alpha[:, np.newaxis], delta[:, np.newaxis]
+			self.azimuth, self.altitude = meteo.get_AzAlt(alpha, delta, obs_time=meteo.time)
+
+			self.airmass = util.elev2airmass(self.altitude, meteo.elev)
+			self.angletomoon = angle_utilities.angular_separation(meteo.moonaz.radian, meteo.moonalt.radian, self.azimuth, self.altitude)
+			self.angletosun = angle_utilities.angular_separation(meteo.sunaz.radian, meteo.sunalt.radian, self.azimuth, self.altitude)
+			self.set_inputs("geometry", inputs)
+
+		# nan is our None here, the wind direction is out of band
+		winddirection, _ = meteo.get_wind()
+		if winddirection < 0 or winddirection > 360:
+			self.angletowind = np.ones_like(self.azimuth) * np.nan
+		else:
+			self.angletowind = angle_utilities.angular_separation(np.deg2rad(winddirection), 0., self.azimuth, 0.)
+
+	def is_cloudfree(self, meteo):
+		"""
+		Vectorized version of :meth:`~obs.Observable.is_cloudfree`, using the altaz coordinates in memory
+
+		:param meteo: a Meteo object, whose cloudmap attribute has been actualized beforehand
+
+		:return: array of cloudfree values, with the same error codes as the scalar version (2: connection error, 3: error during the computation)
+		"""
+		ERROR_CONN = 2.
+		ERROR_COMPUTE = 3.
+
+		if meteo.cloudmap is None:
+			logger.warning("No cloud map in meteo object")
+			return np.ones_like(self.azimuth) * ERROR_CONN
+
+		# a single lookup in the cloud map for the whole set
+		cloudfree = np.round(meteo.allsky.geometry.lookup(meteo.cloudmap, self.azimuth, self.altitude, fill=ERROR_COMPUTE), 3)
+
+		return cloudfree
+
+	def predict_cloudfree(self, meteo, obs_time):
+		"""
+		Predicts the cloudfree values of the set at a given time, from the nowcast of the clouds (see :meth:`~meteo.Meteo.predict_cloudmap`), i.e. to know which targets will still be clear at the end of an exposure. The current parameters of the set are not modified.
+
+		:param meteo: a Meteo object, whose nowcast has been fed with the last cloud maps
+		:param obs_time: Astropy Time object, scalar
+
+		:return: array of predicted cloudfree values (NaN where unknown) and the confidence of the prediction, between 0 and 1
+		"""
+		cloudmap, confidence = meteo.predict_cloudmap(obs_time)
+		if cloudmap is None:
+			return np.ones(len(self)) * np.nan, 0.
+
+		azimuth, altitude = meteo.get_AzAlt(self.alpha, self.delta, obs_time=obs_time)
+		return np.round(meteo.allsky.geometry.lookup(cloudmap, azimuth, altitude), 3), confidence
+
+	def compute_observability(self, meteo, cwvalidity=30, cloudscheck=True, future=False):
+		"""
+		Vectorized version of :meth:`~obs.Observable.compute_observability`. The observability of each target is computed with the same conditions (moon, airmass, wind, clouds, internal flag and program), but without any message.
+
+		If the meteo time is an array of times (see :meth:`~meteo.Meteo.night_grid`), the results are (targets x times) arrays, and the clouds and wind are only considered for the times close enough to now.
+
+		:param meteo: a Meteo object, whose time attribute has been actualized beforehand
+		:param cwvalidity: float, current weather validity: time (in minutes) after/before which the allsky cloud coverage and wind are not taken into account in the observability, effectively setting the future variable to True
+		:param cloudscheck: boolean, if set to True then use the cloud coverage in the observability computation.
+		:param future: boolean, if set to True then cloud coverage and wind are note taken into account in the observability.
+
+		:return: the observability array and a dictionary of boolean arrays, one per flag (moondist, highairmass, airmass, wind, wind_info, clouds, clouds_info, internal, program)
+		"""
+		logger.debug("Computing observability for {} observables...".format(len(self)))
+		self.update(meteo=meteo)
+		shape = np.shape(self.altitude)
+		observability = np.ones(shape)
+
+		# per-target values as columns, to broadcast against the times if needed
+		column = (-1,) + (1,) * (len(shape) - 1)
+
+		# current is True for the times where the clouds and wind are considered
+		current = np.logical_not(future) & (np.abs((meteo.time - Time.now()).to(u.s).value) / 60. <= cwvalidity)
+		current = np.broadcast_to(current, shape)
+
+		flags = {}
+
+		# check the moondistance:
+		flags["moondist"] = ~(np.rad2deg(self.angletomoon) < self.minangletomoon.reshape(column))
+		observability[~flags["moondist"]] *= 0.8
+
+		# high airmass
+		flags["highairmass"] = ~(self.airmass > 1.5)
+		observability[~flags["highairmass"]] *= 0.7
+
+		# check the airmass:
+		flags["airmass"] = ~(self.airmass > self.maxairmass.reshape(column))
+		observability[~flags["airmass"]] = 0
+
+		# check the wind:
+		winddirection, windspeed = meteo.get_wind()
+		gust = meteo.get_gust()
+		warnlevel, limitlevel = float(meteo.location.get("weather", "windWarnLevel")), float(meteo.location.get("weather", "windLimitLevel"))
+		inputs = [self.evaluations["geometry"], winddirection, windspeed, gust, warnlevel, limitlevel, current]
+		if self.is_stale("wind", inputs):
+			wind = np.ones(shape, dtype=bool)
+			wind_info = np.zeros(shape, dtype=bool)
+			if windspeed > 0. and windspeed < 100.:
+				wind_info = current & np.isfinite(self.angletowind)
+				if windspeed >= warnlevel:
+					wind[wind_info & (np.rad2deg(self.angletowind) < 90)] = False
+				if gust >= limitlevel:
+					wind[wind_info] = False
+			self.windflags = {"wind": wind, "wind_info": wind_info}
+			self.set_inputs("wind", inputs)
+		flags.update(self.windflags)
+		observability[~flags["wind"]] = 0
+
+		# check the clouds
+		inputs = [self.evaluations["geometry"], bool(cloudscheck), current, meteo.cloudmap if cloudscheck else None]
+		if self.is_stale("clouds", inputs):
+			self.cloudfree = np.ones(shape) * np.nan
+			if cloudscheck and current.any():
+				self.cloudfree[current] = self.is_cloudfree(meteo)[current]
+			with np.errstate(invalid='ignore'):
+				self.cloudcover = 1. - np.floor(self.cloudfree * 10.) / 10.
+			self.set_inputs("clouds", inputs)
+		cloudy = self.cloudfree <= 0.5
+		maybe = ~cloudy & (self.cloudfree <= 0.9)
+		flags["clouds"] = np.full(shape, bool(cloudscheck))
+		flags["clouds"][cloudy | maybe] = False
+		flags["clouds_info"] = self.cloudfree <= 1.
+		observability[cloudy] = 0
+		observability[maybe] *= self.cloudfree[maybe]
+
+		# the cloudfree values predicted at the end of an exposure, to rank the targets. They do not change the observability
+		lead = float(SETTINGS["validity"]["nowcastlead"])
+		inputs = [self.evaluations["geometry"], bool(cloudscheck), current, lead, len(meteo.nowcast), meteo.nowcast.get_last_time()]
+		if self.is_stale("nowcast", inputs):
+			self.predictedcloudfree = np.ones(shape) * np.nan
+			self.nowcastconfidence = 0.
+			if cloudscheck and meteo.time.isscalar and current.all():
+				self.predictedcloudfree, self.nowcastconfidence = self.predict_cloudfree(meteo, meteo.time + TimeDelta(lead * 60., format='sec'))
+			self.set_inputs("nowcast", inputs)
+
+		# check the internal observability flag
+		flags["internal"] = np.broadcast_to((self.internalobs != 0).reshape(column), shape)
+		observability[~flags["internal"]] = 0
+
+		### Program specific conditions:
+		inputs = [np.atleast_1d(meteo.time.jd), [pythoncopy.copy(o.attributes) for o in self.observables]]
+		if self.is_stale("program", inputs):
+			program = np.ones(shape, dtype=bool)
+			for module, indices in self.programs.items():
+				if module is None:
+					continue
+				attributes = [self.observables[ii].attributes for ii in indices]
+				if hasattr(module, "observability_batch") and all(a is None or isinstance(a, dict) for a in attributes):
+					pobs = np.asarray(module.observability_batch(AttributesTable(attributes), meteo.time))
+					program[indices] = pobs.reshape((len(indices),) + shape[1:]) != 0
+					continue
+				times = [meteo.time] if meteo.time.isscalar else meteo.time
+				for jj, time in enumerate(times):
+					for ii in indices:
+						pobs, _, _ = module.observability(self.observables[ii].attributes, time)
+						if pobs == 0: program[(ii, jj)[:len(shape)]] = False
+			self.programflags = program
+			self.set_inputs("program", inputs)
+		flags["program"] = self.programflags
+		observability[~flags["program"]] = 0
+
+		self.observability = observability
+		self.flags = flags
+
+		return observability, flags
+
+	def get_windows(self, meteo, obs_night=None, twilight="nautical"):
+		"""
+		Rise, transit and set times and observing windows of the whole set for a given night, see :class:`~obs.ObservingWindows`
+
+		:param meteo: a Meteo object, used for the site and the ephemeris
+		:param obs_night: string formatted as YYYY-MM-DD. Night where the observations start. If None, use the night of the meteo time.
+		:param twilight: string, can be "civil", "nautical" or "astronomical"
+
+		:return: an :class:`~obs.ObservingWindows`
+		"""
+		return ObservingWindows(self, meteo, obs_night=obs_night, twilight=twilight)
+
+	def writeback(self):
+		"""
+		Propagates the results of the last :meth:`~obs.ObservableSet.compute_observability` (or of the last :meth:`~obs.ObservableSet.update` if the observability was not computed) to the underlying observables, so they look as if they had been computed one by one.
+
+		Only the results of the stages that ran since the last writeback are propagated, and only to the observables whose values changed, e.g. after a new weather report only the wind flags and the observability of the targets they changed for are written. The observables are assumed not to be modified by anything else meanwhile.
+		"""
+		stages = set(stage for stage in self.evaluations if self.evaluations[stage] != self.writtenevaluations[stage])
+		logger.debug("Writing back the stages {} of {} observables...".format(sorted(stages), len(self)))
+
+		def angle(value):
+			return angles.Angle(value, unit="radian")
+
+		def windangle(value):
+			return None if np.isnan(value) else angles.Angle(value, unit="radian")
+
+		# attribute of the observables: values of the set, conversion
+		fields = collections.OrderedDict()
+		if "geometry" in stages:
+			fields.update(altitude=(self.altitude, angle), azimuth=(self.azimuth, angle), airmass=(self.airmass, None), angletomoon=(self.angletomoon, angle), angletosun=(self.angletosun, angle))
+		# the angle to the wind follows the wind direction of every update
+		fields["angletowind"] = (self.angletowind, windangle)
+
+		if self.observability is not None:
+			if "geometry" in stages:
+				fields.update(obs_moondist=(self.flags["moondist"], None), obs_highairmass=(self.flags["highairmass"], None), obs_airmass=(self.flags["airmass"], None))
+			if "wind" in stages:
+				fields.update(obs_wind=(self.flags["wind"], None), obs_wind_info=(self.flags["wind_info"], None))
+			if "clouds" in stages:
+				fields.update(cloudfree=(self.cloudfree, None), obs_clouds=(self.flags["clouds"], None), obs_clouds_info=(self.flags["clouds_info"], None))
+			if "nowcast" in stages:
+				fields["predictedcloudfree"] = (self.predictedcloudfree, None)
+			fields.update(obs_internal=(self.flags["internal"], None), observability=(self.observability, None))
+
+		for name, (values, convert) in fields.items():
+			previous = self.writtenvalues.get(name)
+			if previous is None or np.shape(previous) != np.shape(values):
+				changed = range(len(self))
+			else:
+				same = previous == values
+				if values.dtype.kind == 'f':
+					same |= np.isnan(previous) & np.isnan(values)
+				changed = np.flatnonzero(~same.reshape(len(self), -1).all(axis=1))
+
+			for ii in changed:
+				o = self.observables[ii]
+				if name == "cloudfree":
+					# the cloud cover is only known where the cloud map covers the target
+					if not np.isnan(self.cloudfree[ii]):
+						o.cloudfree = self.cloudfree[ii]
+						if o.cloudfree <= 1.:
+							o.cloudcover = self.cloudcover[ii]
+					continue
+				setattr(o, name, values[ii] if convert is None else convert(values[ii]))
+			self.writtenvalues[name] = values
+
+		self.writtenevaluations = collections.Counter(self.evaluations)
+
+
+class ObservabilityMatrix:
+	"""
+	Observability of a whole catalogue along a night, as (targets x times) arrays: observability, airmass and distance to the moon (in degree).
+
+	The Sun and Moon positions are computed once per time sample (see :meth:`~meteo.Meteo.night_grid`), then every target is evaluated against every sample at once.
+	"""
+	def __init__(self, observables, meteo, obs_night=None, nhours=100, twilight="nautical", cloudscheck=False, cwvalidity=30):
+		"""
+		:param observables: list of :class:`~obs.Observable` or an :class:`~obs.ObservableSet`
+		:param meteo: a Meteo object, used for the site, the weather and the clouds. It is not modified.
+		:param obs_night: string formatted as YYYY-MM-DD. Night where the observations start. If None, use the night of the meteo time.
+		:param nhours: integer, number of time samples between twilights
+		:param twilight: string, can be "civil", "nautical" or "astronomical"
+		:param cloudscheck: boolean, if set to True then use the cloud coverage for the samples close enough to now (see cwvalidity)
+		:param cwvalidity: float, time (in minutes) after/before which the allsky cloud coverage and wind are not taken into account
+		"""
+		if isinstance(observables, ObservableSet):
+			# we do not want to overwrite the current status of the set, nor the inputs of its stages
+			observableset = observables.copy()
+		else:
+			observableset = ObservableSet(observables)
+
+		grid = meteo.night_grid(obs_night=obs_night, nhours=nhours, twilight=twilight)
+		logger.debug("Computing the observability matrix of {} observables x {} times...".format(len(observableset), len(grid)))
+
+		self.obs_night = grid.obs_night
+		self.times = grid.time
+		self.names = observableset.names
+
+		self.observability, self.flags = observableset.compute_observability(grid, cwvalidity=cwvalidity, cloudscheck=cloudscheck)
+		self.airmass = observableset.airmass
+		self.angletomoon = np.rad2deg(observableset.angletomoon)
+		self.altitude = np.rad2deg(observableset.altitude)
+
+	def index(self, name):
+		"""
+		:param name: string, name of an observable
+		:return: row index of the observable in the matrices
+		"""
+		return list(self.names).index(name)
+
+
+class ObservingWindows:
+	"""
+	Rise, transit and set times of a whole catalogue for a given night, and the time intervals where each target is below its maximum airmass, i.e. above its limiting altitude, and far enough from the Moon.
+
+	The airmass windows are solved in closed form from the hour angle at which each target reaches its limiting altitude, for all the targets at once. The moon distance is evaluated on the Sun and Moon ephemeris table of the night (see :meth:`~meteo.Meteo.get_ephemeris`), its crossings being interpolated between the table samples.
+
+	All the times are MJD floats. The windows of a target are stored as a (n, 2) array of [start, end] intervals, usually with zero or one row.
+	"""
+	# sidereal days per solar day
+	SIDEREAL_RATE = 1.00273790935
+
+	def __init__(self, observables, meteo, obs_night=None, twilight="nautical"):
+		"""
+		:param observables: list of :class:`~obs.Observable` or an :class:`~obs.ObservableSet`
+		:param meteo: a Meteo object, used for the site and the ephemeris. It is not modified.
+		:param obs_night: string formatted as YYYY-MM-DD. Night where the observations start. If None, use the night of the meteo time.
+		:param twilight: string, can be "civil", "nautical" or "astronomical", the night starts and ends at the corresponding twilights
+		"""
+		if not isinstance(observables, ObservableSet):
+			observables = ObservableSet(observables)
+		if obs_night is None:
+			obs_night = meteo.get_obs_night()
+		logger.debug("Computing the observing windows of {} observables for night {}...".format(len(observables), obs_night))
+
+		self.obs_night = obs_night
+		self.twilight = twilight
+		self.names = observables.names
+		self.rows = {name: ii for ii, name in enumerate(self.names)}
+
+		dusk, dawn = meteo.get_nighthours(obs_night, twilight=twilight, nhours=2, asarray=True).mjd
+		self.start, self.end = dusk, dawn
+
+		lat = meteo.lat.radian
+		alpha, delta = observables.alpha, observables.delta
+		omega = 2. * np.pi * self.SIDEREAL_RATE # hour angle rate, in radians per day
+
+		# transit closest to the middle of the night
+		middle = Time(0.5 * (dusk + dawn), format='mjd', scale='utc')
+		lha = np.deg2rad(meteo.get_sidereal_time(middle) * 15.) + meteo.lon.radian - alpha
+		lha = np.mod(lha + np.pi, 2. * np.pi) - np.pi
+		self.transit = middle.mjd - lha / omega
+
+		# hour angles at which the targets cross the horizon and their airmass limit
+		with np.errstate(invalid='ignore', divide='ignore'):
+			horizon = self._hour_angle(0., lat, delta)
+			limit = self._hour_angle(util.airmass2elev(observables.maxairmass, meteo.elev), lat, delta)
+
+		# nan if the target never rises or never sets
+		self.rise = np.where((horizon > 0) & (horizon < np.pi), self.transit - horizon / omega, np.nan)
+		self.set = np.where((horizon > 0) & (horizon < np.pi), self.transit + horizon / omega, np.nan)
+
+		# The airmass windows around the previous, closest and next transits, clipped to the night
+		period = 1. / self.SIDEREAL_RATE
+		starts = np.clip(self.transit[:, np.newaxis] + np.array([-period, 0., period]) - limit[:, np.newaxis] / omega, dusk, dawn)
+		ends = np.clip(self.transit[:, np.newaxis] + np.array([-period, 0., period]) + limit[:, np.newaxis] / omega, dusk, dawn)
+
+		# Moon distance along the night
+		mjds = np.linspace(dusk, dawn, max(int(np.ceil((dawn - dusk) * 288.)), 1) + 1)
+		moonalpha, moondelta = meteo.get_body_radec("moon", Time(mjds, format='mjd', scale='utc'))
+		angletomoon = np.rad2deg(angle_utilities.angular_separation(moonalpha, moondelta, alpha[:, np.newaxis], delta[:, np.newaxis]))
+		margin = angletomoon - observables.minangletomoon[:, np.newaxis]
+
+		self.airmass_windows = []
+		self.windows = []
+		for ii in range(len(self.names)):
+			airmass_windows = [(a, b) for a, b in zip(starts[ii], ends[ii]) if b > a]
+			self.airmass_windows.append(np.array(airmass_windows).reshape(-1, 2))
+			self.windows.append(self._intersect(airmass_windows, self._positive_intervals(mjds, margin[ii])))
+
+	@staticmethod
+	def _hour_angle(elevation, lat, delta):
+		"""
+		Hour angle (in radians, between 0 and pi) at which a target reaches a given elevation: 0 if it never does, pi if it is always above.
+		"""
+		cosh = (np.sin(elevation) - np.sin(lat) * np.sin(delta)) / (np.cos(lat) * np.cos(delta))
+		return np.arccos(np.clip(cosh, -1., 1.))
+
+	@staticmethod
+	def _positive_intervals(x, y):
+		"""
+		Intervals of x where the sampled function y is positive, the crossings being linearly interpolated.
+		"""
+		positive = y >= 0
+		if not positive.any():
+			return []
+		edges = np.flatnonzero(np.diff(positive.astype(int)))
+		crossings = x[edges] + (x[edges + 1] - x[edges]) * y[edges] / (y[edges] - y[edges + 1])
+		bounds = np.concatenate([[x[0]] if positive[0] else [], crossings, [x[-1]] if positive[-1] else []])
+		return list(zip(bounds[::2], bounds[1::2]))
+
+	@staticmethod
+	def _intersect(intervals, others):
+		"""
+		Intersection of two lists of sorted, disjoint intervals, as a (n, 2) array
+		"""
+		result = []
+		for a, b in intervals:
+			for c, d in others:
+				if min(b, d) > max(a, c):
+					result.append((max(a, c), min(b, d)))
+		return np.array(result).reshape(-1, 2)
+
+	def get_windows(self, name, moon=True):
+		"""
+		:param name: string, name of an observable
+		:param moon: boolean, if True the moon distance is taken into account, otherwise only the airmass
+		:return: (n, 2) array of [start, end] MJDs
+		"""
+		if moon:
+			return self.windows[self.rows[name]]
+		return self.airmass_windows[self.rows[name]]
+
+	def is_observable(self, name, obs_time, moon=True):
+		"""
+		:param name: string, name of an observable
+		:param obs_time: Astropy Time object
+		:param moon: boolean, if True the moon distance is taken into account, otherwise only the airmass
+		:return: boolean, True if obs_time falls into one of the windows of the observable
+		"""
+		windows = self.get_windows(name, moon=moon)
+		return bool(np.any((windows[:, 0] <= obs_time.mjd) & (obs_time.mjd <= windows[:, 1])))
+
+	def get_duration(self, name, moon=True):
+		"""
+		:param name: string, name of an observable
+		:param moon: boolean, if True the moon distance is taken into account, otherwise only the airmass
+		:return: total duration of the windows of the observable, in hours
+		"""
+		windows = self.get_windows(name, moon=moon)
+		return float(np.sum(windows[:, 1] - windows[:, 0])) * 24.
+
+
 def showstatus(observables, meteo, displayall=True, cloudscheck=True):
 	"""
 	print the observability of a list of observables according to a given meteo.
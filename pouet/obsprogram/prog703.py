@@ -1,6 +1,7 @@
 #===================================================================================================
 # Program 703
 #===================================================================================================
+import numpy as np
 
 # Set general constraints
 # If those numbers are object dependent, set to None and compute in observability function
@@ -28,3 +29,12 @@ def observability(attributes, obs_time):
 	warnings = '' # This contains warnings
 	
 	return 1, msg, warnings
+
+#===================================================================================================
+# Optionally, define the observable function of all the targets of the program at once, arguments
+# must be : attributes_table (dictionary of lists, one value per target for each attribute) and
+# obs_time (a time or an array of times); should return an array of 1 and 0, of shape (targets,) or
+# (targets, times). If not defined, the observable function above is called for every target and time
+#===================================================================================================
+def observability_batch(attributes_table, obs_time):
+	return np.ones((attributes_table.ntargets,) + np.shape(obs_time))
@@ -5,6 +5,7 @@
 import sys, os
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 import util
+import numpy as np
 
 # Set general constraints
 # If those numbers are object dependent, set to None and compute in observability function
@@ -35,9 +36,29 @@ def observability(attributes, obs_time):
 	observability = 1
 	
 	time = obs_time.mjd
-	phase = util.takeclosest(attributes['phases'], 'phase', time)
-	if phase['phase'] < 0.03 or phase['phase'] > 0.97:
+	phase = get_phaseindex(attributes).get_phase(time)
+	if phase < 0.03 or phase > 0.97:
 		observability = 0
-	msg += '\nPhase = %.2f' % phase['phase']  # we display the phase anyway
+	msg += '\nPhase = %.2f' % phase  # we display the phase anyway
 	
 	return observability, msg, warnings
+
+#===================================================================================================
+# Optionally, define the observable function of all the targets of the program at once, arguments
+# must be : attributes_table (dictionary of lists, one value per target for each attribute) and
+# obs_time (a time or an array of times); should return an array of 1 and 0, of shape (targets,) or
+# (targets, times). If not defined, the observable function above is called for every target and time
+#===================================================================================================
+def observability_batch(attributes_table, obs_time):
+	indices = [get_phaseindex({'phases': phases, 'phaseindex': index}) for phases, index in zip(attributes_table['phases'], attributes_table.get('phaseindex', [None] * attributes_table.ntargets))]
+	phases = util.PhaseIndex.get_phases(indices, obs_time.mjd)
+	return np.where((phases < 0.03) | (phases > 0.97), 0, 1)
+
+#===================================================================================================
+# The phases sorted by mjd are built when the spreadsheet is loaded (see util.excelimport), or here
+# for the targets defined otherwise
+#===================================================================================================
+def get_phaseindex(attributes):
+	if attributes.get('phaseindex') is not None:
+		return attributes['phaseindex']
+	return util.PhaseIndex(attributes['phases'])
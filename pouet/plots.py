@@ -10,7 +10,7 @@ import urllib
 import logging
 logger = logging.getLogger(__name__)
 
-import util
+import util, obs
 
 def plot_airmass_on_sky(target, meteo, ax=None):
 	"""
@@ -35,25 +35,15 @@ def plot_airmass_on_sky(target, meteo, ax=None):
 	plt.subplots_adjust(right=0.98)
 	plt.subplots_adjust(left=0.02)
 
-	airmasses = []
-	azimuths = []
-	altitudes = []
-	times = []
+	# all the times at once, in radians
+	azimuths, altitudes = meteo.get_AzAlt(target.alpha.radian, target.delta.radian, obs_time=obs_times)
+	airmasses = util.elev2airmass(altitudes, meteo.elev)
 
-	for currenttime in obs_times:
-
-		azimuth, altitude = meteo.get_AzAlt(target.alpha, target.delta, obs_time=currenttime)
-
-		if altitude.degree > 0:
-			azimuths.append(azimuth.radian)
-			altitudes.append(90. - altitude.degree)
-			airmasses.append(util.elev2airmass(altitude.value, meteo.elev))
-			times.append(currenttime)
-		else:
-			azimuths.append(np.nan)
-			altitudes.append(np.nan)
-			airmasses.append(np.nan)
-			times.append(np.nan)
+	below = altitudes <= 0
+	azimuths[below] = np.nan
+	airmasses[below] = np.nan
+	altitudes = 90. - np.rad2deg(altitudes)
+	altitudes[below] = np.nan
 
 	# More axes set-up.
 	# Position of azimuth = 0 (data, not label).
@@ -116,31 +106,18 @@ def shownightobs(observable, meteo, obs_night=None, savefig=False, dirpath=None,
 	"""
 	logger.debug("Creating night observability plot for {}".format(observable.name))
 	if not obs_night:
-		meteo.time.format = 'iso'
-		hour = int(meteo.time.value.split()[1][:2])
-		if hour < 12:
-			obs_night = Time(meteo.time.mjd - 1, format='mjd', scale='utc')
-		else:
-			obs_night = Time(meteo.time.mjd, format='mjd', scale='utc')
-		obs_night.format = 'iso'
-		obs_night = obs_night.value.split()[0]
-
-	# list of times between nautical twilights
-	times = meteo.get_nighthours(obs_night)
-
-	#mymeteo = pythoncopy.deepcopy(meteo) # as we don't want to affect the current meteo, we make a copy that we update with the time
-
-	mymeteo = meteo
-	obss = []
-	moonseps = []
-	airmasses = []
-	for time in times:
-		mymeteo.update(obs_time=time, minimal=True)
-		observable.compute_observability(meteo=mymeteo, displayall=True, cloudscheck=False, verbose=verbose)
-		observable.compute_airmass(mymeteo)
-		obss.append(observable.observability)
-		moonseps.append(observable.angletomoon.degree)
-		airmasses.append(observable.airmass)
+		obs_night = meteo.get_obs_night()
+
+	# all the times between nautical twilights at once, the meteo is not modified
+	matrix = obs.ObservabilityMatrix([observable], meteo, obs_night=obs_night, cloudscheck=False)
+	times = matrix.times
+
+	obss = list(matrix.observability[0])
+	moonseps = list(matrix.angletomoon[0])
+	airmasses = list(matrix.airmass[0])
+	if verbose:
+		for time, o in zip(times, obss):
+			print(("%s | %s | observability=%.2f" % (observable.name, time.iso, o)))
 
 	# create the x ticks labels every hour
 
@@ -0,0 +1,200 @@
+"""
+Batch reanalysis of archived all-sky images, without the GUI.
+
+The frames are analysed in parallel by a pool of processes, as in :meth:`~clouds.Clouds.update`, and one line per frame is appended to an rdb table as soon as it is analysed: number of stars, cloud fraction in each sector of the sky and time spent in each step. The frames already present in the table are skipped, so that an interrupted run can be resumed by running the same command again. The frames that failed are analysed again, the last line of a frame being the one that counts.
+
+Usage example::
+
+    python reprocess.py --station LaSilla --output season.rdb /data/allsky/2019-*/*.JPG
+"""
+
+import os
+import argparse
+import glob
+import time
+import concurrent.futures
+import numpy as np
+
+import clouds
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# name, minimum and maximum elevation, azimuth of the centre and width (in deg). The north is at 0, the east at 90.
+SECTORS = [
+    ("zenith", 60., 90., 0., 360.),
+    ("north", 20., 60., 0., 90.),
+    ("east", 20., 60., 90., 90.),
+    ("south", 20., 60., 180., 90.),
+    ("west", 20., 60., 270., 90.),
+]
+
+COLUMNS = ["filename", "nstars"] + ["clouds_{}".format(sector[0]) for sector in SECTORS] + ["t_load", "t_detect", "t_map"]
+
+# state of each worker process, see init_worker
+_worker = {}
+
+
+def get_sector_masks(geometry):
+    """
+    :param geometry: a :class:`~clouds.StationGeometry`
+    :return: a boolean array per sector of :data:`SECTORS`, True on the pixels of the image within the sector
+    """
+    azimuth, elevation = np.rad2deg(geometry.azimuth), np.rad2deg(geometry.elevation)
+    masks = []
+    for name, elevmin, elevmax, azcentre, azwidth in SECTORS:
+        offset = np.abs((azimuth - azcentre + 180.) % 360. - 180.)
+        masks.append((elevation >= elevmin) & (elevation <= elevmax) & (offset <= azwidth / 2.) & ~geometry.mask)
+    return masks
+
+
+def cloud_fractions(observability, masks, limit=0.5):
+    """
+    :param observability: observability map as returned by :meth:`~clouds.Clouds.get_observability_map`, i.e. indexed as the image
+    :param masks: boolean array per sector, see :meth:`get_sector_masks`
+    :param limit: the pixels with an observability below this limit are cloudy
+    :return: the fraction of cloudy pixels in each sector, NaN if the sector has no valid pixel
+    """
+    fractions = []
+    for mask in masks:
+        values = observability[mask & np.isfinite(observability)]
+        fractions.append(np.mean(values < limit) if len(values) > 0 else np.nan)
+    return fractions
+
+
+def init_worker(name, detect_kwargs, map_kwargs):
+    """
+    Prepares the analysis in a worker process: the station and its geometry are loaded once per process, not once per frame.
+    """
+    analysis = clouds.Clouds(name=name)
+    _worker['analysis'] = analysis
+    _worker['masks'] = get_sector_masks(analysis.geometry)
+    _worker['detect_kwargs'] = detect_kwargs
+    _worker['map_kwargs'] = map_kwargs
+
+
+def process_frame(fimage):
+    """
+    Analyses one frame in a worker process, see :meth:`init_worker`
+
+    :param fimage: path to the image
+    :return: the values of :data:`COLUMNS`. If the frame cannot be analysed, the number of stars is -1 and the cloud fractions are NaN.
+    """
+    analysis = _worker['analysis']
+    row = [fimage, -1] + [np.nan] * len(SECTORS)
+    try:
+        t0 = time.time()
+        analysis.im_masked, analysis.im_original = clouds.loadallsky(fimage, station=analysis.station, return_complete=True, geometry=analysis.geometry)
+        t1 = time.time()
+        if analysis.im_original is None:
+            return row + [t1 - t0, np.nan, np.nan]
+        x, y = analysis.detect_stars(**_worker['detect_kwargs'])
+        t2 = time.time()
+        if x is None or y is None:
+            return row + [t1 - t0, t2 - t1, np.nan]
+        observability = analysis.get_observability_map(x, y, **_worker['map_kwargs'])
+        t3 = time.time()
+    except Exception as e:
+        logger.warning("Could not analyse {}: {}".format(fimage, e))
+        return row + [np.nan] * 3
+
+    return [fimage, len(x)] + cloud_fractions(observability, _worker['masks']) + [t1 - t0, t2 - t1, t3 - t2]
+
+
+def read_processed(foutput):
+    """
+    :param foutput: path to the output table
+    :return: the set of the frames already analysed in the table (empty if the table does not exist). The frames that could not be analysed, with -1 stars, are left out so that they are tried again.
+    """
+    processed = set()
+    if not os.path.exists(foutput):
+        return processed
+    with open(foutput) as f:
+        header = f.readline().rstrip("\n").split("\t")
+        if header != COLUMNS:
+            raise ValueError("{} does not have the expected columns, use another output file".format(foutput))
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            # the last line may be incomplete if the run was interrupted
+            if len(fields) == len(COLUMNS) and not fields[0].startswith("-") and int(fields[1]) >= 0:
+                processed.add(fields[0])
+    return processed
+
+
+def format_row(row):
+    return "\t".join([row[0], str(row[1])] + ["{:.4f}".format(value) for value in row[2:]])
+
+
+def reprocess(fimages, foutput, name="LaSilla", workers=None, detect_kwargs=None, map_kwargs=None, chunksize=4):
+    """
+    Analyses a list of all-sky images in parallel and appends the results to an rdb table, skipping the frames already in the table
+
+    :param fimages: list of paths to the images
+    :param foutput: path to the output table, created if needed
+    :param name: name of the station that took the images
+    :param workers: number of processes. If None, one per CPU.
+    :param detect_kwargs: dictionary of parameters passed to :meth:`~clouds.Clouds.detect_stars`
+    :param map_kwargs: dictionary of parameters passed to :meth:`~clouds.Clouds.get_observability_map`
+    :param chunksize: number of frames sent at once to a process
+
+    :return: the number of frames analysed
+    """
+    processed = read_processed(foutput)
+    todo = [fimage for fimage in fimages if fimage not in processed]
+    logger.info("{} frames to analyse, {} already done".format(len(todo), len(fimages) - len(todo)))
+    if len(todo) == 0:
+        return 0
+
+    needheader = not os.path.exists(foutput)
+    with open(foutput, "a") as f:
+        if needheader:
+            f.write("\t".join(COLUMNS) + "\n")
+            f.write("\t".join(["-" * len(column) for column in COLUMNS]) + "\n")
+        elif f.tell() > 0:
+            # terminates an incomplete last line
+            with open(foutput, "rb") as fr:
+                fr.seek(-1, os.SEEK_END)
+                if fr.read(1) != b"\n":
+                    f.write("\n")
+
+        t0 = time.time()
+        initargs = (name, detect_kwargs or {}, map_kwargs or {})
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+            for ii, row in enumerate(executor.map(process_frame, todo, chunksize=chunksize)):
+                f.write(format_row(row) + "\n")
+                f.flush()
+                if (ii + 1) % 100 == 0:
+                    logger.info("{}/{} frames analysed, {:.1f} frames/s".format(ii + 1, len(todo), (ii + 1) / (time.time() - t0)))
+
+    logger.info("{} frames analysed in {:.1f} s".format(len(todo), time.time() - t0))
+    return len(todo)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Analyses archived all-sky images in parallel, the results are appended to an rdb table.")
+    parser.add_argument("images", nargs="+", help="images or glob patterns of images")
+    parser.add_argument("--station", default="LaSilla", help="name of the station that took the images")
+    parser.add_argument("--output", default="allsky_reprocess.rdb", help="output rdb table, the frames already in it are skipped")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, default is one per CPU")
+    parser.add_argument("--threshold", type=float, default=0.05, help="detection threshold, see Clouds.detect_stars")
+    parser.add_argument("--neighborhood", type=int, default=20, help="footprint of the extrema filters, see Clouds.detect_stars")
+    parser.add_argument("--fwhm", type=float, default=5, help="maximum FWHM of the stars, see Clouds.detect_stars")
+    parser.add_argument("--radius", type=float, default=40, help="distance to the stars of the observable pixels, see Clouds.get_observability_map")
+    parser.add_argument("--maxpxval", type=float, default=180, help="pixel value above which the sky is not observable, see Clouds.get_observability_map")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the debug log")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(format='PID %(process)06d | %(asctime)s | %(levelname)s: %(name)s(%(funcName)s): %(message)s', level=logging.DEBUG if args.verbose else logging.INFO)
+
+    fimages = []
+    for pattern in args.images:
+        fimages += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+
+    detect_kwargs = {'threshold': args.threshold, 'neighborhood_size': args.neighborhood, 'fwhm_threshold': args.fwhm}
+    map_kwargs = {'threshold': args.radius, 'max_pxval': args.maxpxval}
+    reprocess(fimages, args.output, name=args.station, workers=args.workers, detect_kwargs=detect_kwargs, map_kwargs=map_kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,20 +30,23 @@ def refresh_status(meteo, observables=None, minimal=False, obs_time=None):
     """
     Refresh the status
 
-    :param observables:
-    :param obs_time:
-    :return:
+    :param observables: list of :meth:`~obs.Observable`. Only the non hidden ones are updated.
+    :param obs_time: Astropy Time object. If None, use the current meteo time.
+    :return: a :meth:`~obs.ObservableSet` holding the updated non hidden observables, or None if there is none.
     """
     logger.debug("Refreshing the observables status...")
     # update meteo
     if obs_time == None:
         obs_time = meteo.time
 
-    meteo.update(obs_time, minimal=minimal)
+    snapshot = meteo.update(obs_time, minimal=minimal)
 
     if observables:
-        #todo: does using a tuple instead of a list speed up the update process? we should find out !!
-        [obs.update(meteo) for obs in observables if obs.hidden == False]
+        obsset = obs.ObservableSet([o for o in observables if o.hidden == False])
+        if len(obsset) > 0:
+            obsset.update(snapshot)
+            obsset.writeback()
+            return obsset
 
 
 def retrieve_obsprogramlist():
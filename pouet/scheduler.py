@@ -0,0 +1,212 @@
+"""
+Define the RefreshScheduler class, that decides when the GUI refreshes its sources (weather report, all sky...) and its computations (observability).
+
+Each source is refreshed periodically, the requests made while a refresh is queued or running being merged into it. A source that keeps failing is retried less and less often. A computation is only run when its inputs changed since the last time it ran.
+"""
+
+import os, inspect
+import collections
+import time
+
+import util
+
+import logging
+logger = logging.getLogger(__name__)
+
+herepath = os.path.dirname(os.path.abspath(inspect.stack()[0][1]))
+SETTINGS = util.readconfig(os.path.join(herepath, "config/settings.cfg"))
+
+
+class Source():
+    """
+    Freshness of a source: period, times of the last attempt and success, failures and state of its refresh
+    """
+
+    def __init__(self, name, period):
+        """
+        :param name: name of the source
+        :param period: time (in s) between two refreshes
+        """
+        self.name = name
+        self.period = period
+        self.enabled = True
+        self.requested = False
+        self.running = False
+        self.last_attempt = None
+        self.last_success = None
+        self.failures = 0
+        self.next_due = None
+        self.counts = collections.Counter()
+
+
+class RefreshScheduler():
+    """
+    Tracks the freshness of the sources and tells which ones are due for a refresh.
+
+    A source is due when it is enabled and its period has elapsed since its last refresh, or when it is requested. A source that is refreshing is never due again before it is finished: the requests made meanwhile are merged and served once it is over. After a failure, the next periodic refresh is delayed by the period times `backoff` to the number of consecutive failures, up to `maxbackoff`.
+
+    The scheduler does not run anything itself: the caller asks for the due sources with :meth:`due`, starts their refreshes and reports the outcome with :meth:`start` and :meth:`finish`. The times are the ones of `time.monotonic`, unless given.
+    """
+
+    def __init__(self, backoff=2., maxbackoff=None):
+        """
+        :param backoff: factor by which the delay before retrying a failing source grows with each failure
+        :param maxbackoff: maximum delay (in s) before retrying a failing source. If None, `maxrefreshbackoff` in the `validity` section of the settings.
+        """
+        self.backoff = backoff
+        self.maxbackoff = float(SETTINGS['validity']['maxrefreshbackoff']) if maxbackoff is None else maxbackoff
+        self.sources = collections.OrderedDict()
+        self.inputs = {}
+        self.skipped = collections.Counter()
+
+    def add_source(self, name, period):
+        """
+        :param name: name of the source
+        :param period: time (in s) between two refreshes. The source is due at once.
+        """
+        self.sources[name] = Source(name, period)
+
+    def set_period(self, name, period):
+        """
+        Changes the period of a source, the next refresh being rescheduled accordingly
+        """
+        source = self.sources[name]
+        source.period = period
+        if source.last_attempt is not None and source.failures == 0:
+            source.next_due = source.last_attempt + period
+
+    def enable(self, name, enabled=True):
+        """
+        Enables or disables the periodic refresh of a source. A disabled source is only refreshed when requested.
+        """
+        self.sources[name].enabled = enabled
+
+    def request(self, *names):
+        """
+        Asks for the refresh of sources as soon as possible. A request for a source already requested is merged with it.
+        """
+        for name in names:
+            if self.sources[name].requested:
+                self.sources[name].counts['merged'] += 1
+            self.sources[name].requested = True
+
+    @property
+    def queue(self):
+        """
+        The names of the requested sources, that are refreshed as soon as possible, i.e. once their running refresh is finished
+        """
+        return [name for name, source in self.sources.items() if source.requested]
+
+    def due(self, now=None):
+        """
+        :param now: time (in s). If None, now.
+        :return: the names of the sources to refresh now
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        for name, source in self.sources.items():
+            if source.running:
+                continue
+            if source.requested or (source.enabled and (source.next_due is None or now >= source.next_due)):
+                due.append(name)
+        return due
+
+    def start(self, names, now=None):
+        """
+        Marks sources as refreshing, which serves their requests.
+
+        :param names: names of the sources
+        :param now: time (in s). If None, now.
+        """
+        now = time.monotonic() if now is None else now
+        for name in names:
+            source = self.sources[name]
+            source.running = True
+            source.requested = False
+            source.last_attempt = now
+            source.counts['attempts'] += 1
+
+    def finish(self, name, success=True, now=None):
+        """
+        Reports the outcome of the refresh of a source, and schedules its next refresh.
+
+        :param name: name of the source
+        :param success: True if the refresh succeeded, False if it failed, None if it was cancelled (the next refresh being scheduled as if it had not been attempted)
+        :param now: time (in s). If None, now.
+        """
+        now = time.monotonic() if now is None else now
+        source = self.sources[name]
+        if not source.running:
+            return
+        source.running = False
+
+        if success is None:
+            source.counts['cancelled'] += 1
+            source.next_due = now if source.last_success is None else source.last_success + source.period
+        elif success:
+            source.counts['successes'] += 1
+            source.failures = 0
+            source.last_success = now
+            source.next_due = now + source.period
+        else:
+            source.counts['failures'] += 1
+            source.failures += 1
+            delay = min(source.period * self.backoff ** source.failures, max(self.maxbackoff, source.period))
+            source.next_due = now + delay
+            logger.info("Refresh of the {} failed {} times in a row, next attempt in {:.0f} s".format(name, source.failures, delay))
+
+    def is_running(self, name):
+        """
+        :return: True if the source is refreshing
+        """
+        return self.sources[name].running
+
+    def update_inputs(self, name, inputs, count=True):
+        """
+        Records the inputs of a computation, e.g. the obs time and the time of the weather report for the observability.
+
+        :param name: name of the computation
+        :param inputs: hashable description of the inputs
+        :param count: whether the computation is skipped if its inputs did not change, and counted as such. False when the computation runs anyway, e.g. when it was asked for by the user.
+        :return: True if the inputs changed since the last call, i.e. if the computation has to run again
+        """
+        if self.inputs.get(name) == inputs:
+            if count:
+                self.skipped[name] += 1
+            return False
+        self.inputs[name] = inputs
+        return True
+
+    def get_timings(self, now=None):
+        """
+        :param now: time (in s). If None, now.
+        :return: dictionary by source name of the period, the ages (in s) of the last attempt and the last success, the number of consecutive failures, the time (in s) before the next periodic refresh, whether it is enabled, requested or running, and the `counts` of attempts, successes, failures, cancellations and merged requests. The computations skipped because their inputs did not change are counted under `skipped`.
+        """
+        now = time.monotonic() if now is None else now
+
+        def age(t):
+            return None if t is None else now - t
+
+        timings = collections.OrderedDict()
+        for name, source in self.sources.items():
+            timings[name] = {"period": source.period, "last_attempt": age(source.last_attempt), "last_success": age(source.last_success), "failures": source.failures,
+                             "next_due": 0. if source.next_due is None else source.next_due - now, "enabled": source.enabled, "requested": source.requested, "running": source.running,
+                             "counts": {key: source.counts[key] for key in ['attempts', 'successes', 'failures', 'cancelled', 'merged']}}
+        timings["skipped"] = dict(self.skipped)
+        return timings
+
+    def __str__(self):
+        msg = "Refresh queue: {}".format(", ".join(self.queue) or "empty")
+        for name, timing in self.get_timings().items():
+            if name == "skipped":
+                msg += "\nSkipped computations: {}".format(timing)
+                continue
+            last = "never" if timing["last_success"] is None else "{:.0f} s ago".format(timing["last_success"])
+            if timing["running"]:
+                state = "running"
+            elif timing["enabled"] or timing["requested"]:
+                state = "next in {:.0f} s".format(0. if timing["requested"] else max(timing["next_due"], 0.))
+            else:
+                state = "disabled"
+            msg += "\n{}: every {:.0f} s, last success {}, {} failures, {}".format(name, timing["period"], last, timing["failures"], state)
+        return msg
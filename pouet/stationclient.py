@@ -0,0 +1,260 @@
+"""
+HTTP client shared by the station plugins (see :file:`config/LaSilla.py`), and base class of their weather reports.
+
+The client keeps the connections to a server alive between the downloads, retries the failed downloads with an exponential backoff and stops contacting a server that keeps failing for a while (circuit breaker). Meanwhile, the weather reports serve the last report that could be read, as long as it is not older than the validity of a weather report.
+"""
+
+import os, inspect
+import collections
+import threading
+import time
+import numpy as np
+import requests
+import requests.adapters
+import urllib.parse
+from astropy.time import Time
+from astropy import units as u
+
+import util
+from fetch import FetchError
+
+import logging
+logger = logging.getLogger(__name__)
+
+herepath = os.path.dirname(os.path.abspath(inspect.stack()[0][1]))
+SETTINGS = util.readconfig(os.path.join(herepath, "config/settings.cfg"))
+
+
+class StationClient():
+    """
+    Pooled and retrying HTTP client of a server, with a circuit breaker and latency metrics.
+
+    After `maxfailures` consecutive failed downloads, the circuit is open: the server is not contacted for `cooldown` s. The next download is then a trial, that closes the circuit if it succeeds or opens it again otherwise.
+    """
+
+    def __init__(self, connecttimeout=None, readtimeout=None, retries=None, backoff=None, maxfailures=None, cooldown=None, poolsize=4):
+        """
+        The parameters left to None are read from the `validity` section of the settings.
+
+        :param connecttimeout: timeout (in s) of the connection to the server
+        :param readtimeout: timeout (in s) between two bytes of the answer of the server
+        :param retries: number of retries of a failed download
+        :param backoff: time (in s) before the first retry, doubled for each following one
+        :param maxfailures: number of consecutive failed downloads that open the circuit
+        :param cooldown: time (in s) during which the circuit stays open
+        :param poolsize: number of connections kept alive
+        """
+        def setting(value, key):
+            return float(SETTINGS['validity'][key]) if value is None else value
+
+        self.timeout = (setting(connecttimeout, 'connecttimeout'), setting(readtimeout, 'readtimeout'))
+        self.retries = int(setting(retries, 'retries'))
+        self.backoff = setting(backoff, 'retrybackoff')
+        self.maxfailures = int(setting(maxfailures, 'maxfailures'))
+        self.cooldown = setting(cooldown, 'cooldown')
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.openuntil = None
+        self.latencies = collections.deque(maxlen=100)
+        self.counts = collections.Counter()
+
+    @property
+    def is_open(self):
+        """
+        True if the server is not contacted because of its last failures
+        """
+        return self.openuntil is not None and time.time() < self.openuntil
+
+    def get(self, url, headers=None):
+        """
+        Downloads a page, retrying if the server does not answer or answers with a server error.
+
+        :param url: url of the page
+        :param headers: dictionary of additional request headers
+        :return: the `requests` response
+        :raise FetchError: if the circuit is open or all the attempts failed
+        """
+        if self.is_open:
+            with self.lock:
+                self.counts['skipped'] += 1
+            raise FetchError("{} failed {} times in a row, not contacted again before {:.0f} s".format(url, self.failures, self.openuntil - time.time()))
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.counts['retries'] += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            t0 = time.time()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                error = e
+                # the client errors will not go away by asking again
+                if response.status_code < 500 and response.status_code != 429:
+                    break
+                continue
+            except requests.RequestException as e:
+                error = e
+                continue
+
+            latency = time.time() - t0
+            with self.lock:
+                self.latencies.append(latency)
+                self.counts['requests'] += 1
+                if self.openuntil is not None:
+                    logger.info("{} answers again".format(urllib.parse.urlsplit(url).netloc))
+                self.failures = 0
+                self.openuntil = None
+            logger.debug("Downloaded {} in {:.0f} ms".format(url, latency * 1e3))
+            return response
+
+        with self.lock:
+            self.counts['failures'] += 1
+            self.failures += 1
+            if self.failures >= self.maxfailures:
+                self.openuntil = time.time() + self.cooldown
+                logger.warning("{} failed {} times in a row, it is not contacted for {:.0f} s".format(url, self.failures, self.cooldown))
+        raise FetchError("Cannot download {}: {}".format(url, error))
+
+    def get_metrics(self):
+        """
+        :return: dictionary of the number of successful downloads (`requests`), failed downloads (`failures`), retries and downloads not attempted because the circuit was open (`skipped`), and of the median, 90th percentile and maximum latency (in s) of the last successful downloads.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies)
+            metrics = {key: self.counts[key] for key in ['requests', 'failures', 'retries', 'skipped']}
+        for name, value in [('median', 50), ('p90', 90), ('max', 100)]:
+            metrics['latency_{}'.format(name)] = np.percentile(latencies, value) if len(latencies) > 0 else np.nan
+        metrics['open'] = self.is_open
+        return metrics
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url):
+    """
+    :param url: url on a server
+    :return: the :class:`StationClient` of this server, shared by all the plugins
+    """
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = StationClient()
+        return _clients[key]
+
+
+# what read raises when a report cannot be downloaded or interpreted
+READ_ERRORS = (FetchError, UnicodeDecodeError, ValueError, IndexError)
+
+
+class WeatherReport():
+    """
+    Base class of the weather reports of the stations. A station only supplies the url of its report (`url` in the `weather` section of its .cfg file, or by overloading :meth:`get_url`) and a :meth:`parse` method.
+
+    If the report cannot be downloaded, :meth:`get` returns the last report that could be read as long as it is recent enough, `report_time` telling when it was downloaded. The download (:meth:`read`) does not change the report, so that it can be abandoned, see :meth:`~meteo.Meteo.fetch_weather`.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: name of the station, i.e. of its .cfg file
+        """
+        self.name = name
+        self.config = util.readconfig(os.path.join(herepath, "config", "{}.cfg".format(name)))
+        self.last_report = None
+        self.report_time = None
+
+    def get_url(self):
+        """
+        :return: the url of the weather report
+        """
+        return self.config.get("weather", "url")
+
+    def parse(self, data, FLAG=-9999):
+        """
+        Interprets the content of the weather report, to be defined by the station.
+
+        :param data: the content of the report, as a string
+        :param FLAG: what to return for the values that cannot be read
+        :return: Wind direction, speed, temperature and humidity
+        """
+        raise NotImplementedError("The weather report of {} has no parser".format(self.name))
+
+    def get_client(self):
+        """
+        :return: the :class:`StationClient` used to download the report
+        """
+        return get_client(self.get_url())
+
+    def read(self, debugmode, FLAG=-9999):
+        """
+        Downloads the weather report and interprets it. Nothing is changed, see :meth:`accept` and :meth:`fallback`.
+
+        :param debugmode: whether or not POUET is in debugmode. If true, the report is read from :file:`config/meteoDebugMode.last`.
+        :param FLAG: what to return for the values that cannot be read
+        :return: Wind direction, speed, temperature and humidity
+        :raise FetchError: if the report cannot be downloaded, or ValueError (and the like) if it cannot be interpreted
+        """
+        if debugmode:
+            with open(os.path.join(herepath, "config", "meteoDebugMode.last"), mode='r') as f:
+                return self.parse(f.read(), FLAG=FLAG)
+
+        response = self.get_client().get(self.get_url())
+        return self.parse(response.content.decode("utf-8"), FLAG=FLAG)
+
+    def accept(self, values, FLAG=-9999):
+        """
+        Records a report that was just read, as the last report if it could be interpreted.
+
+        :param values: wind direction, speed, temperature and humidity, as returned by :meth:`read`
+        :return: values
+        """
+        self.report_time = Time.now()
+        if not all(value == FLAG for value in values):
+            self.last_report = (values, self.report_time)
+        return values
+
+    def fallback(self, error, FLAG=-9999, maxage=None):
+        """
+        :param error: the exception raised by :meth:`read`
+        :param maxage: time (in min) after which the last report is too old to be used. If None, the validity of the weather report (`weatherreport` in the `validity` section of the settings).
+        :return: the last report that could be read, or FLAG values if there is none or if it is older than maxage
+        """
+        logger.warning("Cannot download weather data. Either you or the weather server is offline! ({})".format(error))
+        if maxage is None:
+            maxage = float(SETTINGS['validity']['weatherreport'])
+        if self.last_report is None or (Time.now() - self.last_report[1]).to(u.min).value > maxage:
+            if self.last_report is not None:
+                logger.warning("The last weather report, downloaded at {}, is too old to be used".format(str(self.last_report[1]).split('.')[0]))
+            self.report_time = None
+            return FLAG, FLAG, FLAG, FLAG
+        values, self.report_time = self.last_report
+        logger.warning("Using the last weather report, downloaded at {}".format(str(self.report_time).split('.')[0]))
+        return values
+
+    def get(self, debugmode, FLAG=-9999):
+        """
+        Downloads the weather report and interprets it.
+
+        :param debugmode: whether or not POUET is in debugmode. If true, the report is read from :file:`config/meteoDebugMode.last`.
+        :param FLAG: what to return in case the weather report cannot be downloaded or treated. Currently, POUET expect -9999 as a placeholder.
+
+        :return: Wind direction, speed, temperature and humidity
+
+        .. warning:: Such a method *must* return the following variables in that precise order: wind direction, wind speed, temperature and humidity
+        """
+        try:
+            values = self.read(debugmode, FLAG=FLAG)
+        except READ_ERRORS as e:
+            return self.fallback(e, FLAG=FLAG)
+        return self.accept(values, FLAG=FLAG)
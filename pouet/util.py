@@ -61,6 +61,70 @@ def takeclosest(dico, key, value):
 		return before
 
 
+def takeclosest_index(values, targets):
+	"""
+	Vectorized version of :func:`takeclosest`, for many target values at once.
+
+	.. warning:: I assume that values is sorted.
+
+	:param values: sorted array of values
+	:param targets: target value, or array of target values
+
+	:return: indices of the elements of values that are the closest to the targets. If two elements are equally close, the highest (i.e. latest) is taken.
+	"""
+	values = np.asarray(values)
+	targets = np.asarray(targets)
+	if len(values) == 1:
+		return np.zeros(np.shape(targets), dtype=int)
+
+	pos = np.clip(np.searchsorted(values, targets, side='left'), 1, len(values) - 1)
+	return np.where(values[pos] - targets <= targets - values[pos - 1], pos, pos - 1)
+
+
+class PhaseIndex:
+	"""
+	Phases of a target along time, e.g. the BEBOP ephemerides, stored as contiguous arrays sorted by MJD.
+
+	It is built once when the target is loaded, so that the phase closest to many times is looked up with a single `searchsorted`, see :func:`takeclosest_index`.
+	"""
+	def __init__(self, phases):
+		"""
+		:param phases: list of dictionaries with (at least) the `mjd` and `phase` keys
+		"""
+		mjd = np.array([phase['mjd'] for phase in phases], dtype=float)
+		order = np.argsort(mjd, kind='stable')
+		self.mjd = mjd[order]
+		self.phase = np.array([phase['phase'] for phase in phases], dtype=float)[order]
+
+	def __len__(self):
+		return len(self.mjd)
+
+	def get_phase(self, mjd):
+		"""
+		:param mjd: time (in MJD), or array of times
+		:return: the phase of the closest entry in time, same shape as mjd. If two entries are equally close, the latest is taken.
+		"""
+		return self.phase[takeclosest_index(self.mjd, mjd)]
+
+	@staticmethod
+	def get_phases(indices, mjd):
+		"""
+		Phases of many targets at once. The targets sharing the same times, as the ones of a BEBOP spreadsheet, are looked up together.
+
+		:param indices: list of :class:`~util.PhaseIndex`
+		:param mjd: time (in MJD), or array of times
+		:return: array of the phases, of shape (targets,) + shape of mjd
+		"""
+		phases = np.empty((len(indices),) + np.shape(mjd))
+		if len(indices) > 0 and all(len(index) == len(indices[0]) and np.array_equal(index.mjd, indices[0].mjd) for index in indices):
+			table = np.array([index.phase for index in indices])
+			phases[...] = table[:, takeclosest_index(indices[0].mjd, mjd)]
+			return phases
+		for ii, index in enumerate(indices):
+			phases[ii, ...] = index.get_phase(mjd)
+		return phases
+
+
 def hilite(string, status, bold):
 	"""
 	Helper to add colors and bold in the terminal
@@ -170,11 +234,11 @@ def elev2airmass(el, alt, threshold=10.):
 	"""
 	Converts the elevation to airmass.
 
-	:param el: float, elevation in radians
+	:param el: float or numpy array, elevation in radians
 	:param alt: float, altitude of the observer in meters
 	:param threshold: maximum allowed airmass, will be returned if actual airmass exceeds the threshold
 
-	:return: airmass
+	:return: airmass, with the same shape as el
 
 	.. note:: This is the code used for the Euler EDP at La Silla."""
 
@@ -182,13 +246,45 @@ def elev2airmass(el, alt, threshold=10.):
 
 	cosz = np.cos(np.pi/2.-el)
 
-	if(cosz< 0.1): # we do not compute Airmass for small value of cosz
-		airmass = threshold
-	else:
-		airmass = (1.0 + altitudeFactor - altitudeFactor / (cosz * cosz)) / cosz
+	if np.ndim(cosz) == 0:
+		if(cosz< 0.1): # we do not compute Airmass for small value of cosz
+			airmass = threshold
+		else:
+			airmass = (1.0 + altitudeFactor - altitudeFactor / (cosz * cosz)) / cosz
+		return airmass
+
+	# array version, same recipe
+	low = cosz < 0.1
+	cosz = np.where(low, 1., cosz)
+	airmass = (1.0 + altitudeFactor - altitudeFactor / (cosz * cosz)) / cosz
+	airmass[low] = threshold
 
 	return airmass
 
+def airmass2elev(airmass, alt):
+	"""
+	Converts the airmass to elevation, inverting :meth:`~util.elev2airmass`.
+
+	:param airmass: float or numpy array, airmass, must be >= 1
+	:param alt: float, altitude of the observer in meters
+
+	:return: elevation in radians, with the same shape as airmass
+	"""
+	altitudeFactor = 0.00087 + alt*(-8.6664803e-8) # altitude factor
+
+	# cosz is the root of airmass * cosz^3 - (1 + altitudeFactor) * cosz^2 + altitudeFactor, close to 1/airmass
+	airmass = np.asarray(airmass, dtype=float)
+	cosz = 1. / airmass
+	for ii in range(5):
+		f = airmass * cosz**3 - (1. + altitudeFactor) * cosz**2 + altitudeFactor
+		fprime = 3. * airmass * cosz**2 - 2. * (1. + altitudeFactor) * cosz
+		cosz = cosz - f / fprime
+
+	el = np.pi/2. - np.arccos(np.clip(cosz, -1., 1.))
+	if np.ndim(el) == 0:
+		return float(el)
+	return el
+
 def check_value(var, flag):
 	"""
 	Check that a value is NaN, replace it with a given flag if True
@@ -254,6 +350,7 @@ def excelimport(filename, obsprogram=None):
 			special properties:
 
 			phases : a list of dictionnaries : [{mjd, phase, hourafterstart }]
+			phaseindex : the phases sorted by mjd, see PhaseIndex
 			comment : a string of comments (exptime, requested phase,...)
 			internalobs : a boolean (0 or 1), allowing or not observability
 			'''
@@ -327,7 +424,7 @@ def excelimport(filename, obsprogram=None):
 				## Tricky stuff here : the jdb in the excel sheet is the mjd + 0.5.
 				phases = [{'mjd': values['%c%i' % (col, 1)] - 0.5, 'hourafterstart': values['%c%i' % (col, 2)],
 				           'phase': values['%c%i' % (col, i)]} for col in phasesnames]
-				attributes = {'phases': phases}
+				attributes = {'phases': phases, 'phaseindex': PhaseIndex(phases)}
 				# observable.phases = phases
 				if values['I%s' % str(i)] == 'yes':
 					attributes['internalobs'] = 1
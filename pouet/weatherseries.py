@@ -0,0 +1,198 @@
+"""
+Define the WeatherSeries class, the time series of the weather reports of a station.
+
+The samples are kept in a growing structured array and appended to a binary file, so that the series survives a restart of POUET. Only the last days are kept, the file being rewritten without the older samples once it holds twice as many days. The values at any time are interpolated between the samples, and statistics are computed over a rolling window, e.g. to base the wind limits on the trend of the last minutes rather than on a single reading.
+"""
+
+import os
+import numpy as np
+from astropy.time import Time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+SAMPLE_DTYPE = np.dtype([('mjd', 'f8'), ('winddirection', 'f4'), ('windspeed', 'f4'), ('temperature', 'f4'), ('humidity', 'f4')])
+
+QUANTITIES = ['winddirection', 'windspeed', 'temperature', 'humidity']
+
+
+class WeatherSeries():
+    """
+    Append-only time series of weather samples (wind direction in degree, wind speed, temperature and humidity). The unknown values are NaN.
+
+    The wind direction is an angle: it is interpolated and averaged through its unit vector.
+    """
+
+    def __init__(self, name, directory=None, maxage=None):
+        """
+        :param name: name of the station, used to name the file
+        :param directory: where to store the series. If None, the series is only kept in memory.
+        :param maxage: how many days of samples to keep, before the last sample. If None, all the samples are kept.
+        """
+        self.name = name
+        self.maxage = maxage
+        self.samples = np.zeros(64, dtype=SAMPLE_DTYPE)
+        self.size = 0
+
+        self.filename = None
+        if directory is not None:
+            self.filename = os.path.join(directory, "{}_weather.dat".format(name))
+            self.load()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def data(self):
+        """
+        The samples, in chronological order
+        """
+        return self.samples[:self.size]
+
+    def load(self):
+        """
+        Reads the samples saved in the file, ignoring an incomplete last sample
+        """
+        if not os.path.exists(self.filename):
+            return
+        count = os.path.getsize(self.filename) // SAMPLE_DTYPE.itemsize
+        samples = np.fromfile(self.filename, dtype=SAMPLE_DTYPE, count=count)
+        # the file is append-only, but it could have been written by another instance
+        samples = samples[np.argsort(samples['mjd'], kind='stable')]
+        self.samples = np.zeros(max(64, 2 * len(samples)), dtype=SAMPLE_DTYPE)
+        self.samples[:len(samples)] = samples
+        self.size = len(samples)
+        logger.debug("{} weather samples of {} loaded".format(self.size, self.name))
+        if self.maxage is not None and self.size > 0 and self.data['mjd'][-1] - self.data['mjd'][0] > self.maxage:
+            self.truncate()
+
+    def truncate(self):
+        """
+        Forgets the samples older than `maxage` days before the last sample, and rewrites the file without them
+        """
+        first = np.searchsorted(self.data['mjd'], self.data['mjd'][-1] - self.maxage, side='left')
+        samples = self.data[first:].copy()
+        self.samples = np.zeros(max(64, 2 * len(samples)), dtype=SAMPLE_DTYPE)
+        self.samples[:len(samples)] = samples
+        self.size = len(samples)
+        logger.debug("{} weather samples of {} older than {} days forgotten".format(first, self.name, self.maxage))
+
+        if self.filename is not None:
+            try:
+                samples.tofile(self.filename + ".tmp")
+                os.replace(self.filename + ".tmp", self.filename)
+            except (IOError, OSError):
+                logger.warning("Could not rewrite the weather samples in {}".format(self.filename))
+
+    def append(self, obs_time, winddirection, windspeed, temperature, humidity, flag=-9999):
+        """
+        Adds a sample at the end of the series. Samples that are not more recent than the last one, or without any known value, are ignored.
+
+        :param obs_time: Astropy Time object, time of the weather report
+        :param winddirection: wind direction (in degree)
+        :param windspeed: wind speed (in m/s)
+        :param temperature: temperature (in C)
+        :param humidity: humidity (in %)
+        :param flag: value of the unknown values
+
+        :return: True if the sample was added
+        """
+        values = np.array([winddirection, windspeed, temperature, humidity], dtype=float)
+        values[values == flag] = np.nan
+        if np.all(np.isnan(values)) or (self.size > 0 and obs_time.mjd <= self.samples['mjd'][self.size - 1]):
+            return False
+
+        if self.size == len(self.samples):
+            self.samples = np.concatenate([self.samples, np.zeros(len(self.samples), dtype=SAMPLE_DTYPE)])
+        sample = self.samples[self.size:self.size + 1]
+        sample['mjd'] = obs_time.mjd
+        for quantity, value in zip(QUANTITIES, values):
+            sample[quantity] = value
+        self.size += 1
+
+        if self.filename is not None:
+            try:
+                if not os.path.isdir(os.path.dirname(self.filename)):
+                    os.makedirs(os.path.dirname(self.filename))
+                with open(self.filename, 'ab') as f:
+                    f.write(sample.tobytes())
+            except (IOError, OSError):
+                logger.warning("Could not save the weather sample in {}".format(self.filename))
+
+        if self.maxage is not None and obs_time.mjd - self.samples['mjd'][0] > 2 * self.maxage:
+            self.truncate()
+        return True
+
+    def get(self, quantity, tstart=None, tstop=None):
+        """
+        :param quantity: one of :data:`QUANTITIES`
+        :param tstart: Astropy Time object, start of the time range. If None, from the first sample.
+        :param tstop: Astropy Time object, end of the time range (included). If None, up to the last sample.
+
+        :return: arrays of the MJDs and of the values of the samples within the time range
+        """
+        mjd = self.samples['mjd'][:self.size]
+        first = 0 if tstart is None else np.searchsorted(mjd, tstart.mjd, side='left')
+        last = self.size if tstop is None else np.searchsorted(mjd, tstop.mjd, side='right')
+        return mjd[first:last], self.samples[quantity][first:last].astype(float)
+
+    def interpolate(self, quantity, obs_time, maxgap=30.):
+        """
+        Linear interpolation of the samples, the first and last values being kept before and after the series.
+
+        :param quantity: one of :data:`QUANTITIES`
+        :param obs_time: Astropy Time object, scalar or array
+        :param maxgap: the value is NaN if there is no sample closer than maxgap (in min), e.g. long after the last report or during a long interruption of the reports
+
+        :return: float or array with the shape of obs_time
+        """
+        mjd, values = self.get(quantity)
+        known = np.isfinite(values)
+        mjd, values = mjd[known], values[known]
+        t = np.atleast_1d(obs_time.mjd).astype(float)
+        if len(mjd) == 0:
+            result = np.ones_like(t) * np.nan
+        else:
+            if quantity == 'winddirection':
+                x = np.interp(t, mjd, np.cos(np.deg2rad(values)))
+                y = np.interp(t, mjd, np.sin(np.deg2rad(values)))
+                result = np.mod(np.rad2deg(np.arctan2(y, x)), 360.)
+            else:
+                result = np.interp(t, mjd, values)
+
+            # distance to the nearest sample
+            after = np.clip(np.searchsorted(mjd, t), 0, len(mjd) - 1)
+            before = np.clip(after - 1, 0, len(mjd) - 1)
+            gap = np.minimum(np.abs(t - mjd[before]), np.abs(t - mjd[after]))
+            result[gap * 1440. > maxgap] = np.nan
+
+        if np.ndim(obs_time.mjd) == 0:
+            return float(result[0])
+        return result.reshape(np.shape(obs_time.mjd))
+
+    def rolling(self, quantity, obs_time=None, window=10., statistic='mean'):
+        """
+        Statistics of the samples over a window of time ending at a given time, e.g. the maximum wind speed over the last 10 minutes.
+
+        :param quantity: one of :data:`QUANTITIES`
+        :param obs_time: Astropy Time object, end of the window. If None, the time of the last sample.
+        :param window: duration of the window (in min)
+        :param statistic: `mean`, `median`, `min`, `max` or `std`. The mean of the wind direction is the direction of the mean unit vector.
+
+        :return: the statistic, NaN if there is no known value in the window
+        """
+        if obs_time is None:
+            if self.size == 0:
+                return np.nan
+            obs_time = Time(self.samples['mjd'][self.size - 1], format='mjd')
+        tstart = Time(obs_time.mjd - window / 1440., format='mjd')
+        _, values = self.get(quantity, tstart, obs_time)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return np.nan
+
+        if quantity == 'winddirection' and statistic == 'mean':
+            angles = np.deg2rad(values)
+            return float(np.mod(np.rad2deg(np.arctan2(np.mean(np.sin(angles)), np.mean(np.cos(angles)))), 360.))
+        return float({'mean': np.mean, 'median': np.median, 'min': np.min, 'max': np.max, 'std': np.std}[statistic](values))
@@ -0,0 +1,172 @@
+"""
+Testing script for the all-sky analysis, v1
+"""
+
+import os, sys, logging, time, copy, threading, functools, tempfile, shutil
+import http.server
+import numpy as np
+from astropy.time import Time, TimeDelta
+import scipy.ndimage as ndimage
+from scipy.spatial import cKDTree
+
+path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), '../pouet')
+sys.path.append(path)
+
+import clouds, nowcast, history, reprocess
+
+
+logging.basicConfig(format='PID %(process)06d | %(asctime)s | %(levelname)s: %(name)s(%(funcName)s): %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reference_observability_map(analysis, x, y, threshold=40, filter_sigma=3, max_pxval=180):
+    """
+    The original pixel by pixel implementation of Clouds.get_observability_map, one KD-tree query per pixel
+    """
+    observability = copy.copy(analysis.im_masked) * 0.
+    notnans = np.where(np.isnan(analysis.im_masked) == False)
+    notnans = list(zip(notnans[0], notnans[1]))
+    tree = cKDTree(np.array([x, y]).T)
+    for nx, ny in notnans:
+        obs = len(tree.query_ball_point((ny, nx), threshold))
+        if obs > 2: observability[nx, ny] = 1.
+        elif obs >= 1: observability[nx, ny] = 0.5
+    observability[ndimage.gaussian_filter(np.nan_to_num(analysis.im_masked), 10) > max_pxval] = 0
+    return ndimage.gaussian_filter(observability, filter_sigma)
+
+
+# analyse the debug all-sky image
+analysis = clouds.Clouds(name="LaSilla", debugmode=True)
+analysis.retrieve_image()
+x, y = analysis.detect_stars()
+logger.info("{} stars detected".format(len(x)))
+
+# the observability map must be the same as the pixel by pixel one
+reference = reference_observability_map(analysis, x, y)
+
+t0 = time.time()
+observability = analysis.get_observability_map(x, y)
+logger.info("Observability map computed in {:.1f} ms".format((time.time() - t0) * 1e3))
+
+assert np.array_equal(observability, reference, equal_nan=True)
+assert np.array_equal(analysis.observability_map, reference.T, equal_nan=True)
+
+# star counts on half-pixel positions, with stars on the edges and outside of the image
+xs, ys = [0., 10.5, 99.5, 120., 50.], [0., 20.5, 59., -30., 45.5]
+counts = clouds.star_density(xs, ys, (60, 100), 25)
+rows, cols = np.mgrid[0:60, 0:100]
+expected = np.sum([(cols - xx)**2 + (rows - yy)**2 <= 25**2 for xx, yy in zip(xs, ys)], axis=0)
+assert np.array_equal(counts, expected)
+
+# the batched star measurements must select the same stars as the one by one fits
+x, y, allx, ally = analysis.detect_stars(return_all=True)
+t0 = time.time()
+fwhms, flags = clouds.measure_stars(analysis.im_original, allx, ally, 18)
+logger.info("{} objects measured in {:.1f} ms, flags: {}".format(len(allx), (time.time() - t0) * 1e3, np.bincount(flags)))
+reference = np.array([clouds.fwhm(analysis.im_original, xx, yy, 18) for xx, yy in zip(allx, ally)])
+assert np.array_equal(np.isnan(fwhms), np.isnan(reference))
+assert np.all(np.isnan(fwhms[flags == clouds.STAR_EDGE]))
+assert np.array_equal(fwhms < 5, reference < 5)
+ok = np.isfinite(reference) & (flags != clouds.STAR_UNPHYSICAL)
+assert np.median(np.abs(fwhms[ok] / reference[ok] - 1.)) < 1e-5
+
+# a fit that cannot improve (infinite pixel) is flagged, a perfect one is not
+stamps = np.ones((100, 100)) * 50.
+gx, gy = np.meshgrid(np.arange(100.), np.arange(100.))
+stamps += 1e5 * np.exp(-0.5 * ((gx - 50.) ** 2 + (gy - 50.) ** 2) / 4.) / 2. / np.sqrt(2. * np.pi)
+assert clouds.measure_stars(stamps, [50.], [50.], 18)[1][0] == clouds.STAR_OK
+stamps[50, 52] = np.inf
+assert clouds.measure_stars(stamps, [50.], [50.], 18)[1][0] == clouds.STAR_NOTCONVERGED
+
+# download the image from a local server, in memory and only if it changed
+handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=os.path.join(path, "config"))
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+downloader = clouds.Clouds(name="LaSilla")
+downloader.station.params['url'] = "http://127.0.0.1:{}/AllSkyDebugMode.jpg".format(server.server_address[1])
+downloader.update(donotdownloadtime=0)
+assert downloader.new_frame and not downloader.failed_connection
+assert np.array_equal(downloader.observability_map, analysis.observability_map, equal_nan=True)
+
+# not modified since the last download
+downloader.retrieve_image()
+assert not downloader.new_frame and not downloader.failed_connection
+
+# downloaded again, but the same frame
+downloader.last_modified = None
+downloader.retrieve_image()
+assert not downloader.new_frame and downloader.update(donotdownloadtime=0) is downloader.observability_map
+
+# server down
+server.shutdown()
+server.server_close()
+downloader.retrieve_image(timeout=1)
+assert downloader.failed_connection
+
+# nowcasting of clouds moving by (2, -1) px per minute
+field = ndimage.gaussian_filter(np.random.RandomState(1).rand(800, 700), 15)
+field = (field > np.median(field)).astype(float)
+mask = np.isnan(analysis.observability_map)
+frame = lambda minutes: np.where(mask, np.nan, ndimage.shift(field, (2. * minutes, -1. * minutes), order=1)[80:720, 110:590])
+
+t0 = Time("2020-10-20 03:00:00", format='iso', scale='utc')
+clearsky = nowcast.Nowcast()
+for minutes in [0, 2, 4, 6]:
+    clearsky.add(t0 + TimeDelta(minutes * 60., format='sec'), frame(minutes))
+assert np.allclose(clearsky.velocity, [2., -1.], atol=0.05)
+
+# a new frame only needs to be correlated with the previous one, and gives the same motion as correlating all the pairs again
+correlate, ncorrelations = nowcast.phase_correlation, []
+nowcast.phase_correlation = lambda *args: ncorrelations.append(1) or correlate(*args)
+for minutes in [8, 10, 12, 14]:
+    clearsky.add(t0 + TimeDelta(minutes * 60., format='sec'), frame(minutes))
+nowcast.phase_correlation = correlate
+assert len(ncorrelations) == 4 and len(clearsky.motions) == len(clearsky.maps) - 1
+pairs = zip(list(clearsky.maps)[:-1], list(clearsky.maps)[1:])
+velocities = [correlate(map0, map1)[0] / ((t1 - tp) * 1440.) for (tp, map0), (t1, map1) in pairs]
+assert np.allclose(clearsky.velocity, np.mean(velocities, axis=0))
+
+prediction, confidence = clearsky.predict(t0 + TimeDelta(28 * 60., format='sec'))
+truth = frame(28)
+valid = np.isfinite(prediction) & np.isfinite(truth)
+logger.info("Nowcast 14 min ahead: confidence {:.2f}, {:.1%} of the pixels right".format(confidence, np.mean(np.abs(prediction - truth)[valid] < 0.5)))
+assert 0 < confidence < 1 and np.mean(np.abs(prediction - truth)[valid] < 0.5) > 0.95
+
+# history of the night, on disk
+directory = tempfile.mkdtemp()
+records = history.AllSkyHistory(directory, "LaSilla", "2020-10-19", np.shape(analysis.observability_map), capacity=5)
+for minutes in range(7):
+    records.append(t0 + TimeDelta(minutes * 60., format='sec'), analysis.observability_map, nstars=minutes, frame=analysis.im_original)
+assert len(records) == 5
+
+# re-opened as after a restart, the two oldest records were overwritten
+records = history.AllSkyHistory(directory, "LaSilla", "2020-10-19", np.shape(analysis.observability_map), capacity=5)
+mjds, nstars, maps, frames = records.get_range(t0 + TimeDelta(150., format='sec'), t0 + TimeDelta(300., format='sec'))
+assert list(nstars) == [3, 4, 5] and maps.shape == (3, 320, 240) and frames.shape == (3, 120, 160)
+valid = np.isfinite(maps[0]) & np.isfinite(analysis.observability_map[::2, ::2])
+assert np.allclose(maps[0][valid], analysis.observability_map[::2, ::2][valid], atol=0.1)
+records.append(t0 + TimeDelta(600., format='sec'), analysis.observability_map)
+assert list(records.get_range()[1]) == [3, 4, 5, 6, -1]
+
+# batch reanalysis, resumed after an interruption in the middle of a line
+fimages = [os.path.join(directory, "frame{}.jpg".format(ii)) for ii in range(3)]
+for fimage in fimages:
+    shutil.copy(os.path.join(path, "config", "AllSkyDebugMode.jpg"), fimage)
+foutput = os.path.join(directory, "reprocess.rdb")
+assert reprocess.reprocess(fimages[:2], foutput, workers=2) == 2
+with open(foutput, "a") as f:
+    f.write(fimages[2] + "\t24")
+assert reprocess.reprocess(fimages, foutput, workers=2) == 1 and reprocess.reprocess(fimages, foutput) == 0
+with open(foutput) as f:
+    rows = [line.split("\t") for line in f.read().splitlines()[2:]]
+assert [row[0] for row in rows if len(row) == len(reprocess.COLUMNS)] == fimages
+assert all(int(row[1]) == len(x) for row in rows[:2])
+# a frame that could not be analysed is tried again
+failed = os.path.join(directory, "frame3.jpg")
+shutil.copy(fimages[0], failed)
+with open(foutput, "a") as f:
+    f.write(reprocess.format_row([failed, -1] + [np.nan] * (len(reprocess.COLUMNS) - 2)) + "\n")
+assert failed not in reprocess.read_processed(foutput)
+assert reprocess.reprocess(fimages + [failed], foutput) == 1 and reprocess.read_processed(foutput) == set(fimages + [failed])
+shutil.rmtree(directory)
@@ -0,0 +1,180 @@
+"""
+Testing script for the concurrent downloads of the weather report and of the all-sky image, v1
+"""
+
+import os, sys, logging, time, threading
+import asyncio, functools
+import http.server
+import numpy as np
+import requests
+from astropy import units as u
+
+path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), '../pouet')
+sys.path.append(path)
+
+import clouds, fetch, meteo, scheduler, stationclient
+
+
+logging.basicConfig(format='PID %(process)06d | %(asctime)s | %(levelname)s: %(name)s(%(funcName)s): %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves the debug files of the config directory, slowly under /slow/ and with an error under /fail/
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=os.path.join(path, "config"), **kwargs)
+
+    def do_GET(self):
+        if self.path.startswith("/slow/"):
+            time.sleep(3)
+            self.path = self.path[len("/slow"):]
+        elif self.path.startswith("/fail/"):
+            self.send_error(500)
+            return
+        try:
+            super().do_GET()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = "http://127.0.0.1:{}/".format(server.server_address[1])
+
+
+async def get(page):
+    response = await asyncio.get_event_loop().run_in_executor(None, functools.partial(requests.get, url + page, timeout=10.))
+    response.raise_for_status()
+    return response
+
+
+# the downloads run at the same time, each one with its own timeout
+jobs = {
+    'fast': lambda: get("meteoDebugMode.last"),
+    'slow': lambda: get("slow/meteoDebugMode.last"),
+    'fail': lambda: get("fail/meteoDebugMode.last"),
+    'missing': lambda: get("nothing.here"),
+}
+t0 = time.time()
+results = fetch.Refresh().run(jobs, timeouts={'slow': 0.5})
+logger.info("Downloads done in {:.2f} s".format(time.time() - t0))
+assert time.time() - t0 < 1.5
+with open(os.path.join(path, "config", "meteoDebugMode.last"), 'rb') as f:
+    assert results['fast'].status_code == 200 and results['fast'].content == f.read()
+assert isinstance(results['slow'], fetch.FetchError)
+assert all(isinstance(results[name], requests.HTTPError) for name in ['fail', 'missing'])
+
+# cancelled from another thread
+refresh = fetch.Refresh()
+threading.Timer(0.3, refresh.cancel).start()
+t0 = time.time()
+results = refresh.run({'slow': lambda: get("slow/meteoDebugMode.last"), 'fast': lambda: get("meteoDebugMode.last")})
+assert time.time() - t0 < 1.5
+assert isinstance(results['slow'], asyncio.CancelledError) and results['fast'].status_code == 200
+
+# the downloads that did not start are cancelled with the refresh, the running ones finish on their own
+executor = fetch.RefreshExecutor(max_workers=1)
+started, release = threading.Event(), threading.Event()
+running = executor.submit(lambda: started.set() or release.wait(5.))
+started.wait(5.)
+waiting = executor.submit(time.sleep, 0.)
+executor.cancel()
+assert waiting.cancelled() and not running.cancelled()
+release.set()
+assert running.result(5.)
+
+# weather report and all sky of a meteo, from the stand-in servers
+currentmeteo = meteo.Meteo(name='LaSilla', cloudscheck=True, debugmode=True)
+reference = currentmeteo.weatherReport.get(debugmode=True)
+reference_map = currentmeteo.allsky.observability_map
+currentmeteo.debugmode = False
+currentmeteo.weatherReport.config.set("weather", "url", url + "meteoDebugMode.last")
+
+allsky = clouds.Clouds(name="LaSilla")
+allsky.station.params['url'] = url + "AllSkyDebugMode.jpg"
+results = currentmeteo.fetch(weather=True, allsky=allsky)
+assert results['weather'] == reference and results['allsky'] is allsky
+assert np.array_equal(allsky.observability_map, reference_map, equal_nan=True)
+currentmeteo.apply_refresh(results)
+assert currentmeteo.allsky is allsky and currentmeteo.windspeed == reference[1]
+
+# slow weather report and failing all sky: the weather is unknown, the last all-sky analysis is kept
+currentmeteo.weatherReport.config.set("weather", "url", url + "slow/meteoDebugMode.last")
+allsky.station.params['url'] = url + "fail/AllSkyDebugMode.jpg"
+t0 = time.time()
+results = currentmeteo.fetch(weather=True, allsky=allsky, donotdownloadtime=0, timeouts={'weather': 0.5})
+assert time.time() - t0 < 1.5
+assert isinstance(results['weather'], fetch.FetchError) and allsky.failed_connection
+currentmeteo.apply_refresh(results)
+assert currentmeteo.windspeed == -9999
+assert np.array_equal(currentmeteo.cloudmap, reference_map, equal_nan=True)
+# the abandoned weather download finishes later, without changing the weather report
+report_time = currentmeteo.weatherReport.report_time
+time.sleep(3.5)
+assert currentmeteo.weatherReport.report_time is report_time
+
+# pooled client: retries with backoff, then the circuit opens and the server is not contacted anymore
+client = stationclient.StationClient(retries=2, backoff=0.1, maxfailures=2, cooldown=0.5)
+assert client.get(url + "meteoDebugMode.last").status_code == 200
+for _ in range(3):
+    try:
+        client.get(url + "fail/meteoDebugMode.last")
+        raise AssertionError("the download should fail")
+    except fetch.FetchError:
+        pass
+metrics = client.get_metrics()
+logger.info("Client metrics: {}".format(metrics))
+assert metrics['requests'] == 1 and metrics['failures'] == 2 and metrics['retries'] == 4 and metrics['skipped'] == 1 and metrics['open']
+time.sleep(0.5)
+assert client.get(url + "meteoDebugMode.last").status_code == 200 and not client.is_open
+
+# the weather report serves the last good report while its server fails
+report = currentmeteo.weatherReport
+report.config.set("weather", "url", url + "meteoDebugMode.last")
+report.get_client().retries = 0
+assert report.get(debugmode=False) == reference
+good_time = report.report_time
+report.config.set("weather", "url", url + "fail/meteoDebugMode.last")
+currentmeteo.updateweather()
+assert currentmeteo.windspeed == reference[1] and currentmeteo.lastest_weatherupdate_time == good_time
+report.last_report = (report.last_report[0], good_time - 11 * u.min)
+assert report.get(debugmode=False) == (-9999, -9999, -9999, -9999) and report.report_time is None
+
+server.shutdown()
+server.server_close()
+
+# refresh scheduler: periodic and requested refreshes, merged requests, backoff of a failing source and computations skipped when their inputs did not change
+refreshes = scheduler.RefreshScheduler(backoff=2., maxbackoff=300.)
+refreshes.add_source("weather", 30.)
+refreshes.add_source("allsky", 90.)
+assert refreshes.due(now=0.) == ["weather", "allsky"]
+refreshes.start(["weather", "allsky"], now=0.)
+refreshes.request("weather")
+refreshes.request("weather")
+assert refreshes.due(now=1.) == [] and refreshes.queue == ["weather"]
+refreshes.finish("weather", True, now=2.)
+refreshes.finish("allsky", False, now=2.)
+assert refreshes.due(now=3.) == ["weather"]
+refreshes.start(["weather"], now=3.)
+refreshes.finish("weather", True, now=4.)
+assert refreshes.due(now=33.) == [] and refreshes.due(now=34.) == ["weather"]
+assert refreshes.due(now=2. + 179.) == ["weather"] and refreshes.due(now=2. + 180.) == ["weather", "allsky"]
+refreshes.start(["allsky"], now=200.)
+refreshes.finish("allsky", False, now=200.)
+assert refreshes.get_timings(now=200.)["allsky"]["next_due"] == 300.
+refreshes.enable("weather", False)
+assert refreshes.due(now=1000.) == ["allsky"]
+timings = refreshes.get_timings(now=1000.)
+logger.info(str(refreshes))
+assert timings["weather"]["counts"]["merged"] == 1 and timings["allsky"]["failures"] == 2 and timings["allsky"]["counts"]["attempts"] == 2
+assert refreshes.update_inputs("observability", (1, 2)) and not refreshes.update_inputs("observability", (1, 2)) and refreshes.update_inputs("observability", (1, 3))
+assert not refreshes.update_inputs("observability", (1, 3), count=False)
+assert refreshes.get_timings()["skipped"] == {"observability": 1}
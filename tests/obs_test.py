@@ -2,8 +2,10 @@
 Testing script, v1
 """
 
-import os, sys, logging, threading, time, runpy
-from astropy.time import Time
+import os, sys, logging, threading, time, runpy, collections
+import concurrent.futures
+import numpy as np
+from astropy.time import Time, TimeDelta
 
 path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), '../pouet')
 sys.path.append(path)
@@ -22,6 +24,16 @@ currentmeteo = meteo.Meteo(name='LaSilla', cloudscheck=True, debugmode=True)
 print(currentmeteo)
 currentmeteo.get_nighthours(obs_night="2020-10-20", twilight="nautical")
 
+# Sun and Moon ephemeris of the night
+ephemeris = currentmeteo.get_ephemeris()
+print(ephemeris.error, ephemeris.get_risings_settings("sun"), ephemeris.get_transits("moon"), ephemeris.get_trend("moon", currentmeteo.time))
+assert ephemeris.covers(currentmeteo.time)
+
+# the ephemeris of the last nights are kept, going back to a night does not recompute it
+nextnight = currentmeteo.time + TimeDelta(86400., format='sec')
+assert currentmeteo.get_ephemeris(nextnight) is not ephemeris and currentmeteo.get_ephemeris(nextnight).covers(nextnight)
+assert currentmeteo.get_ephemeris() is ephemeris
+
 
 # load a catalogue of observables
 observables = obs.rdbimport(os.path.join(path, "../cats/example.pouet"), obsprogramcol=4, obsprogram='lens')
@@ -29,15 +41,200 @@ observables = obs.rdbimport(os.path.join(path, "../cats/example.pouet"), obsprog
 for o in observables:
     print(o)
 
+# azimuth and altitude of Angle objects, of floats in radians, or of a mix of both
+o = observables[0]
+azalt = currentmeteo.get_AzAlt(o.alpha, o.delta)
+for alpha, delta in [(o.alpha.radian, o.delta.radian), (o.alpha, o.delta.radian), (o.alpha.radian, o.delta.to('degree'))]:
+    assert np.allclose([angle.radian if hasattr(angle, 'radian') else angle for angle in currentmeteo.get_AzAlt(alpha, delta)], [angle.radian for angle in azalt])
+
 # show current status of all observables
 obs.showstatus(observables, currentmeteo, displayall=True)
 for o in observables:
     print(o)
     o.is_cloudfree(currentmeteo)
 
+# compute the observability of the whole catalogue at once, must match the one-by-one computation
+observableset = obs.ObservableSet(observables)
+observability, flags = observableset.compute_observability(currentmeteo, cloudscheck=False)
+for o, value in zip(observables, observability):
+    o.compute_observability(currentmeteo, cloudscheck=False, verbose=False)
+    assert abs(o.observability - value) < 1e-9
+observableset.writeback()
+
+# cloudfree values in 10 minutes, from the nowcast of the clouds
+cloudfree, confidence = observableset.predict_cloudfree(currentmeteo, currentmeteo.time + TimeDelta(600., format='sec'))
+assert len(cloudfree) == len(observables)
+
+# observability of the whole catalogue along a night
+matrix = obs.ObservabilityMatrix(observables, currentmeteo, obs_night="2020-10-20", nhours=20)
+assert matrix.observability.shape == (len(observables), 20)
+
+# observing windows of the same night, must agree with the matrix airmass flags
+windows = observableset.get_windows(currentmeteo, obs_night="2020-10-20")
+for o, flags in zip(observables, matrix.flags["airmass"]):
+    print(o.name, windows.get_windows(o.name), windows.get_duration(o.name))
+    assert [windows.is_observable(o.name, t, moon=False) for t in matrix.times] == list(flags)
+
+# snapshots at different times, evaluated in parallel while the meteo moves on
+snapshot = currentmeteo.snapshot()
+later = currentmeteo.snapshot(currentmeteo.time + TimeDelta(3 * 3600., format='sec'))
+references = [obs.ObservableSet(observables).compute_observability(m, cloudscheck=True)[0] for m in [currentmeteo, later]]
+try:
+    snapshot.time = Time.now()
+    raise AssertionError("a snapshot cannot be modified")
+except AttributeError:
+    pass
+assert not hasattr(snapshot, "update") and (snapshot.cloudmap is None or not snapshot.cloudmap.flags.writeable)
+with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+    jobs = [executor.submit(obs.ObservableSet(observables).compute_observability, m, cloudscheck=True) for m in [snapshot, later]]
+    currentmeteo.update(obs_time=currentmeteo.time + TimeDelta(6 * 3600., format='sec'), minimal=True)
+    results = [job.result()[0] for job in jobs]
+assert all(np.array_equal(result, reference) for result, reference in zip(results, references))
+assert snapshot.time != currentmeteo.time and snapshot.moonalt != currentmeteo.moonalt
+
+# incremental recomputation: a new wind only re-evaluates the wind flags, a new time everything that depends on it
+observableset = obs.ObservableSet(observables)
+observableset.compute_observability(snapshot, cloudscheck=True)
+observableset.compute_observability(snapshot, cloudscheck=True)
+assert observableset.evaluations == {"geometry": 1, "wind": 1, "clouds": 1, "nowcast": 1, "program": 1}
+observableset.writeback()
+# a matrix of the night built from the set leaves the inputs of its stages alone
+inputs, evaluations = dict(observableset.inputs), collections.Counter(observableset.evaluations)
+obs.ObservabilityMatrix(observableset, currentmeteo, obs_night="2020-10-20", nhours=5)
+assert observableset.inputs.keys() == inputs.keys() and all(observableset.inputs[stage] is inputs[stage] for stage in inputs)
+observableset.compute_observability(snapshot, cloudscheck=True)
+assert observableset.evaluations == evaluations
+currentmeteo.set_weather((np.mod(currentmeteo.winddirection + 90., 360.), 20., currentmeteo.temperature, currentmeteo.humidity))
+windy = currentmeteo.snapshot(snapshot.time)
+assert windy.get_wind() != snapshot.get_wind()
+observability, _ = observableset.copy().compute_observability(windy, cloudscheck=True)
+assert observableset.evaluations["wind"] == 1
+observability, _ = observableset.compute_observability(windy, cloudscheck=True)
+assert observableset.evaluations == {"geometry": 1, "wind": 2, "clouds": 1, "nowcast": 1, "program": 1}
+assert np.array_equal(observability, obs.ObservableSet(observables).compute_observability(windy, cloudscheck=True)[0])
+# only the wind results are written back, the positions are left alone
+altitudes = [o.altitude for o in observables]
+observableset.writeback()
+assert all(o.altitude is altitude for o, altitude in zip(observables, altitudes))
+assert [o.obs_wind for o in observables] == list(observableset.flags["wind"]) and [o.observability for o in observables] == list(observability)
+reference = obs.ObservableSet(obs.rdbimport(os.path.join(path, "../cats/example.pouet"), obsprogramcol=4, obsprogram='lens'))
+reference.compute_observability(windy, cloudscheck=True)
+reference.writeback()
+for name in ["altitude", "airmass", "angletowind", "obs_moondist", "obs_wind_info", "obs_clouds", "observability"]:
+    assert [str(getattr(o, name)) for o in observables] == [str(getattr(o, name)) for o in reference.observables]
+observableset.compute_observability(later, cloudscheck=True)
+assert observableset.evaluations["geometry"] == 2 and np.array_equal(observableset.observability, references[1])
+
+# obsprograms evaluated in batch, must match their observability function called per target and time
+mjd = snapshot.time.mjd
+phasetables = [[{'mjd': mjd + step / 24., 'hourafterstart': step, 'phase': np.mod(shift + step / 10., 1.)} for step in range(11)] for shift in np.linspace(0., 1., 8)]
+bebops = [obs.Observable(name="bebop{}".format(ii), obsprogram='bebop', alpha=o.alpha.to_string(unit='hour', sep=':'), delta=o.delta.to_string(unit='degree', sep=':'), attributes={'phases': phases}) for ii, (o, phases) in enumerate(zip(observables, phasetables))]
+grid = currentmeteo.night_grid(obs_night="2020-10-20", nhours=20)
+for m in [snapshot, later, grid]:
+    observableset = obs.ObservableSet(observables + bebops)
+    observableset.compute_observability(m, cloudscheck=False)
+    times = [m.time] if m.time.isscalar else m.time
+    expected = [[o.program.observability(o.attributes, t)[0] for t in times] for o in observables + bebops]
+    assert np.array_equal(observableset.flags["program"].reshape(len(expected), -1), np.array(expected) != 0)
+assert not observableset.flags["program"].all() and observableset.flags["program"][len(observables):].any()
+
+# BEBOP phases looked up in their sorted index, must match takeclosest on the phase tables
+phasetables = [[{'mjd': mjd - 100. + (step + 0.5 * (ii % 2)) / 24., 'hourafterstart': step, 'phase': np.mod(shift + step / 10., 1.)} for step in range(5000)] for ii, shift in enumerate(np.linspace(0., 1., 200))]
+times = mjd - 100. + np.linspace(-1., 210., 500)
+for tables in [phasetables[::2], phasetables]:
+    t0 = time.time()
+    indices = [util.PhaseIndex(phases) for phases in tables]
+    t1 = time.time()
+    phases = util.PhaseIndex.get_phases(indices, times)
+    logger.info("Phases of {} targets x {} times looked up in {:.1f} ms, indices built in {:.1f} ms".format(len(tables), len(times), (time.time() - t1) * 1e3, (t1 - t0) * 1e3))
+    for ii in [0, 1, len(tables) - 1]:
+        t0 = time.time()
+        reference = [util.takeclosest(tables[ii], 'mjd', t)['phase'] for t in times]
+        assert np.array_equal(phases[ii], reference)
+    logger.info("takeclosest on {} times of one target took {:.1f} ms".format(len(times), (time.time() - t0) * 1e3))
+bebop = bebops[0].program
+attributes = obs.AttributesTable([{'phases': phases, 'phaseindex': index} for phases, index in zip(phasetables, indices)])
+batch = bebop.observability_batch(attributes, Time(times[::50], format='mjd'))
+assert np.array_equal(batch, [[bebop.observability({'phases': phases}, Time(t, format='mjd'))[0] for t in times[::50]] for phases in phasetables])
+
+# table model of the GUI, refreshed from the arrays of the set
+model = main.ObsModel()
+model.set_observables(observables)
+assert model.rowCount() == len(observables) and model.columnCount() == len(main.ObsModel.headers)
+changes = []
+model.dataChanged.connect(lambda first, last, roles: changes.append((first.column(), last.column())))
+observableset = obs.ObservableSet(observables)
+observableset.compute_observability(snapshot, cloudscheck=True)
+observableset.writeback()
+model.update_values(observableset)
+assert len(changes) <= 1
+reference = main.ObsModel()
+reference.set_observables(observables)
+for row in range(len(observables)):
+    for column in range(model.columnCount()):
+        for role in [main.QtCore.Qt.DisplayRole, main.QtCore.Qt.BackgroundRole, main.QtCore.Qt.CheckStateRole]:
+            assert model.data(model.index(row, column), role) == reference.data(reference.index(row, column), role)
+model.update_values(observableset)
+assert len(changes) <= 1
+model.setData(model.index(1, 0), main.QtCore.Qt.Checked, main.QtCore.Qt.CheckStateRole)
+model.sort(main.ObsModel.headers.index("A"), main.QtCore.Qt.DescendingOrder)
+airmasses = [float(model.data(model.index(row, main.ObsModel.headers.index("A")))) for row in range(len(observables))]
+assert airmasses == sorted(airmasses, reverse=True)
+states, names = model.get_check_states()
+assert [n for s, n in zip(states, names) if s] == [observables[1].name]
+model.set_observables(observables[1:])
+states, names = model.get_check_states()
+assert [n for s, n in zip(states, names) if s] == [observables[1].name]
+airmasses = [float(model.data(model.index(row, main.ObsModel.headers.index("A")))) for row in range(len(observables) - 1)]
+assert airmasses == sorted(airmasses, reverse=True)
+
+# background computations of the GUI, a newer request supersedes the running one
+service = main.ComputeService()
+posted, progress = [], []
+service.resultReady.connect(lambda request, result: posted.append((request, result)) or finished.set(), main.QtCore.Qt.DirectConnection)
+service.progress.connect(lambda request, done, total: progress.append((request, done, total)), main.QtCore.Qt.DirectConnection)
+started, release, finished = threading.Event(), threading.Event(), threading.Event()
+
+def superseded(report):
+    started.set()
+    release.wait()
+    report(1, 2)
+    return None
+
+def job(report):
+    observability, _ = obs.ObservableSet(observables).compute_observability(snapshot, cloudscheck=True)
+    report(1, 1)
+    return observability
+
+first = service.submit(superseded)
+started.wait()
+second = service.submit(job)
+release.set()
+assert finished.wait(60)
+service.shutdown(wait=True)
+assert [request for request, _ in posted] == [second] and progress == [(second, 1, 1)]
+assert np.array_equal(posted[0][1], references[0])
+
 # update meteo at now
 currentmeteo.update(obs_time=Time.now())
 
+# the cloud cover predicted at the end of an exposure, from the nowcast of the snapshot, is shown in the table
+snapshot = currentmeteo.snapshot()
+observableset = obs.ObservableSet(observables)
+observableset.compute_observability(snapshot, cloudscheck=True)
+lead = TimeDelta(float(obs.SETTINGS["validity"]["nowcastlead"]) * 60., format='sec')
+predicted, confidence = observableset.predict_cloudfree(snapshot, snapshot.time + lead)
+assert np.array_equal(observableset.predictedcloudfree, predicted, equal_nan=True) and observableset.nowcastconfidence == confidence
+assert len(snapshot.nowcast) > 0 and np.isfinite(predicted).any()
+currentmeteo.nowcast.maps.clear()
+assert len(snapshot.nowcast) > 0 and snapshot.predict_cloudmap(snapshot.time)[0] is not None
+model = main.ObsModel()
+model.set_observables(observables)
+model.update_values(observableset)
+column = main.ObsModel.headers.index("N")
+texts = [model.data(model.index(row, column)) for row in range(len(observables))]
+assert all(text == model.FLAG if not p <= 1 else text == "{:1.1f}".format(1. - np.floor(p * 10.) / 10.) for text, p in zip(texts, predicted[model.order]))
+
 # newtime
 # todo create a new time object, play with it
 
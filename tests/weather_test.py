@@ -0,0 +1,123 @@
+"""
+Testing script for the weather reports, v1
+"""
+
+import os, sys, logging, re, timeit, tempfile
+import numpy as np
+
+path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), '../pouet')
+sys.path.append(path)
+
+import meteolast, meteo, util, weatherseries
+from astropy.time import Time
+
+
+logging.basicConfig(format='PID %(process)06d | %(asctime)s | %(levelname)s: %(name)s(%(funcName)s): %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reference_parse(data):
+    """
+    The original line by line reading of a `meteo.last` report, with four regular expressions per line
+    """
+    WS, WD, RH, Temps = [], [], None, []
+    for line in data.split("\n"):
+        if re.match(r'WD', line, re.M|re.I):
+            WD.append(int(line[20:25]))
+        if re.match(r'WS', line, re.M|re.I):
+            WS.append(float(line[20:25]))
+        if re.match(r'RH', line, re.M|re.I):
+            RH = float(line[20:25])
+        if re.match(r'T ', line, re.M|re.I):
+            Temps.append(float(line[20:25]))
+    return WD, WS, RH, Temps
+
+
+with open(os.path.join(path, "config", "meteoDebugMode.last")) as f:
+    report = f.read()
+
+# every sensor, with its identity
+parser = meteolast.MeteoLastParser()
+records = parser.parse(report)
+assert len(records) == 13 and np.all(records['station'] == "LASILLA1")
+assert np.all(records['time'] == np.datetime64("2018-02-08T16:36"))
+assert list(records['quantity'][-3:]) == ['WD'] * 3 and list(records['sensor'][-3:]) == [1, 2, 3]
+assert records['unit'][records['quantity'] == 'QNH'][0] == 'MB'
+
+# same readings as the original parsing, the missing ones being NaN instead of truncated to 999
+WD, WS, RH, Temps = reference_parse(report)
+for quantity, reference in [('WD', WD), ('WS', WS), ('RH', [RH]), ('T', Temps)]:
+    values = meteolast.get_readings(records, quantity)
+    assert np.array_equal(np.isnan(values), np.array(reference) >= 999)
+    assert np.array_equal(values[np.isfinite(values)], np.array(reference)[np.array(reference) < 999])
+
+# same weather as the original plugin
+station = util.load_station("LaSilla").WeatherReport()
+WD, WS, RH, Temps = reference_parse(report)
+expected = (np.mean([wd for wd in WD if 0 < wd < 360]), np.mean([ws for ws in WS if 0 < ws < 99]), np.mean([t for t in Temps if t < 100]), RH)
+assert np.allclose(station.parse(report), expected)
+
+# an archive of reports of two weather stations, the latest report of each one is found
+reports = []
+for ii in range(2000):
+    stamp = np.datetime64("2018-02-08T16:36") + np.timedelta64(ii, 'm')
+    reports.append(report.replace("2018-02-08  16:36", str(stamp).replace("T", "  ")).replace("LASILLA1", "LASILLA{}".format(1 + ii % 2)))
+archive = "".join(reports)
+records = parser.parse(archive)
+assert len(records) == 13 * 2000
+latest = meteolast.get_latest(records)
+assert len(latest) == 26 and set(latest['time']) == set([np.datetime64("2018-02-08T16:36") + np.timedelta64(1998, 'm'), np.datetime64("2018-02-08T16:36") + np.timedelta64(1999, 'm')])
+
+# benchmarks against the line by line parsing
+for name, data, number in [("one report", report, 2000), ("archive of 2000 reports", archive, 3)]:
+    t_reference = timeit.timeit(lambda: reference_parse(data), number=number) / number
+    t_parser = timeit.timeit(lambda: parser.parse(data), number=number) / number
+    logger.info("{}: {:.3f} ms line by line, {:.3f} ms in a single pass, for all the sensors".format(name, t_reference * 1e3, t_parser * 1e3))
+
+# time series of the weather reports, one every minute, persisted and read back
+with tempfile.TemporaryDirectory() as directory:
+    series = weatherseries.WeatherSeries("LaSilla", directory=directory)
+    t0 = Time("2018-02-08T16:36:00")
+    for ii in range(30):
+        obs_time = Time(t0.mjd + ii / 1440., format='mjd')
+        assert series.append(obs_time, (350. + 2 * ii) % 360., 5. + ii % 2, 12., -9999)
+    assert not series.append(obs_time, 0., 5., 12., 10.) and not series.append(Time(obs_time.mjd + 1., format='mjd'), -9999, -9999, -9999, -9999)
+    assert len(series) == 30 and np.all(np.isnan(series.data['humidity']))
+    reloaded = weatherseries.WeatherSeries("LaSilla", directory=directory)
+    assert reloaded.data.tobytes() == series.data.tobytes()
+
+# interpolation, across north for the wind direction, unknown too far from the reports
+half = Time(t0.mjd + 4.5 / 1440., format='mjd')
+assert np.isclose(series.interpolate('windspeed', half), 5.5) and np.isclose(series.interpolate('winddirection', half), 359.)
+times = Time(t0.mjd + np.array([-60., 0., 29., 35., 60.]) / 1440., format='mjd')
+assert np.array_equal(np.isnan(series.interpolate('temperature', times, maxgap=10.)), [True, False, False, False, True])
+
+# rolling statistics over the last minutes
+assert series.rolling('windspeed', window=10., statistic='max') == 6. and np.isclose(series.rolling('windspeed', window=9.5), 5.5)
+assert np.isclose(series.rolling('winddirection', Time(t0.mjd + 9 / 1440., format='mjd'), window=10.), 359.)
+assert np.isnan(series.rolling('windspeed', Time(t0.mjd - 1., format='mjd')))
+
+# the wind warnings are decided on the smoothed wind, the wind limit on the gusts
+currentmeteo = meteo.Meteo(name='LaSilla', cloudscheck=False, debugmode=True)
+limit = float(currentmeteo.location.get("weather", "windLimitLevel"))
+currentmeteo.weatherseries = weatherseries.WeatherSeries("LaSilla")
+now = Time.now()
+for ii, windspeed in enumerate([limit - 5.] * 5 + [limit + 5.]):
+    currentmeteo.set_weather((100., windspeed, 12., 10.), report_time=Time(now.mjd + (ii - 5) / 1440., format='mjd'))
+assert currentmeteo.windspeed > limit and np.isclose(currentmeteo.get_wind()[1], limit - 5. + 10. / 6) and np.isclose(currentmeteo.get_wind()[0], 100.)
+assert currentmeteo.get_gust() == limit + 5. and currentmeteo.snapshot().get_gust() == limit + 5.
+currentmeteo.set_weather((100., limit - 5., 12., 10.), report_time=Time(now.mjd + 1 / 1440., format='mjd'))
+assert currentmeteo.get_gust() == limit + 5.
+currentmeteo.set_weather((-9999, -9999, 12., 10.), report_time=Time(now.mjd + 2 / 1440., format='mjd'))
+assert currentmeteo.get_wind() == (-9999, -9999) and currentmeteo.get_gust() == -9999
+
+# only the last days of the series are kept, in memory and in the file
+with tempfile.TemporaryDirectory() as directory:
+    series = weatherseries.WeatherSeries("LaSilla", directory=directory, maxage=1.)
+    for ii in range(24 * 5):
+        series.append(Time(t0.mjd + ii / 24., format='mjd'), 100., 5., 12., 10.)
+    assert len(series) <= 2 * 24 + 1 and series.data['mjd'][-1] - series.data['mjd'][0] <= 2.
+    assert os.path.getsize(series.filename) == len(series) * weatherseries.SAMPLE_DTYPE.itemsize
+    reloaded = weatherseries.WeatherSeries("LaSilla", directory=directory, maxage=1.)
+    assert len(reloaded) == 24 + 1 and reloaded.data['mjd'][-1] == series.data['mjd'][-1]
+    assert os.path.getsize(series.filename) == len(reloaded) * weatherseries.SAMPLE_DTYPE.itemsize